@@ -1,10 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from typing import Union
 
 from services.query_service import process_text, NLPResponse, TextCommand, SimplifiedNLPResponse
-from services.smart_text_service import SmartTextService
+from services.container import container
+from services.llm_gateway import deadline_scope
+from services.adaptive_limiter import OverloadedError
+from services.metrics import registry, track_request
 from models.smart_text_models import SmartTextRequest, SmartTextResponse
-from config import Settings
 import logging
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -19,9 +22,14 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Initialize settings and services
-settings = Settings()
-smart_text_service = SmartTextService()
+# Services are built lazily by the container on first use
+settings = container.settings
+
+# Gauges refreshed from the LLM gateway when /metrics is scraped
+LLM_CONCURRENCY_LIMIT = registry.gauge("nlp_llm_concurrency_limit", "Current adaptive limit on concurrent LLM calls")
+LLM_QUEUE_DEPTH = registry.gauge("nlp_llm_queue_depth", "LLM calls waiting for a slot")
+LLM_SHED = registry.gauge("nlp_llm_shed", "LLM calls shed since startup")
+LLM_CIRCUIT_OPEN = registry.gauge("nlp_llm_circuit_open", "1 while the LLM circuit breaker is not closed")
 
 # Add CORS middleware
 app.add_middleware(
@@ -32,6 +40,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """Bound every LLM call made while handling a request by one shared deadline."""
+    with deadline_scope(settings.request_deadline_seconds):
+        return await call_next(request)
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Report the time spent in each stage in a Server-Timing header and in /metrics."""
+    # Unknown paths share one label so scans cannot grow the metrics without bound
+    path = request.url.path if request.url.path in ROUTE_PATHS else "other"
+    with track_request(path) as request_metrics:
+        response = await call_next(request)
+        request_metrics.status = str(response.status_code)
+        if request_metrics.stages:
+            response.headers["Server-Timing"] = request_metrics.server_timing()
+        return response
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    """Shed requests get a 503 with a Retry-After instead of queueing without bound."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Service overloaded: {str(exc)}"},
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
+
+@app.on_event("startup")
+async def startup():
+    """Start expiring and compacting conversation contexts in the background."""
+    if settings.context_compaction_enabled:
+        container.context_compactor.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the compactor, write the queued conversation contexts, then close the context store and the HTTP pools."""
+    if "context_compactor" in container.built():
+        await container.context_compactor.close()
+    if "context_writer" in container.built():
+        await container.context_writer.close()
+    elif "context_store" in container.built():
+        container.context_store.close()
+    await container.http_clients.aclose()
+
 @app.post("/process-text", response_model=Union[NLPResponse, SimplifiedNLPResponse])
 async def process_text_endpoint(command: TextCommand):
     """
@@ -51,7 +103,7 @@ async def process_smart_text_endpoint(request: SmartTextRequest):
     Returns:
         SmartTextResponse containing processed data and conversational response
     """
-    return await smart_text_service.process_smart_text(
+    return await container.smart_text_service.process_smart_text(
         user_id=request.user_id,
         raw_text=request.text,
         is_new_session=request.is_new_session == "true"
@@ -61,6 +113,35 @@ async def process_smart_text_endpoint(request: SmartTextRequest):
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latency histograms and token usage in the Prometheus text format."""
+    gateway_stats = container.llm_gateway.stats()
+    LLM_CIRCUIT_OPEN.set(1 if gateway_stats["circuit"]["state"] != "closed" else 0)
+    if gateway_stats["limiter"]:
+        LLM_CONCURRENCY_LIMIT.set(gateway_stats["limiter"]["limit"])
+        LLM_QUEUE_DEPTH.set(gateway_stats["limiter"]["queue_depth"])
+        LLM_SHED.set(gateway_stats["limiter"]["shed"])
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def stats():
+    """Return internal counters (cache hits, misses, evictions) used to size the service."""
+    nlp_service = container.nlp_service
+    return {
+        "nlp_cache": nlp_service.result_cache.stats(),
+        "template_cache": nlp_service.template_cache.stats(),
+        "single_flight": nlp_service.single_flight.stats(),
+        "batcher": nlp_service.batcher.stats() if nlp_service.batcher else None,
+        "http": container.http_clients.stats(),
+        "llm": container.llm_gateway.stats(),
+        "context_store": container.context_writer.stats() if "context_writer" in container.built() else None,
+        "context_compactor": container.context_compactor.stats() if "context_compactor" in container.built() else None
+    }
+
+# Paths reported as their own label in the request metrics
+ROUTE_PATHS = {route.path for route in app.routes}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
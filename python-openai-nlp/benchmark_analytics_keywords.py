@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the analytics type, visualization and distribution inference.
+
+Compares services/analytics_keywords.py with the per-call keyword dicts and substring
+scans of _determine_analytics_type, _determine_visualization_type and
+_determine_distribution_type, loaded from the last revision of services/query_service.py
+that had them, over a synthetic corpus of analytics utterances.
+"""
+import argparse
+import ast
+import itertools
+import json
+import os
+import random
+import subprocess
+import time
+from typing import Dict, Any, List, Tuple
+
+from services.analytics_keywords import classify_analytics, scan
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEGACY_FUNCTIONS = ("_determine_analytics_type", "_determine_visualization_type", "_determine_distribution_type")
+
+VERBS = ["show", "display", "give me", "i want to see", "plot", "compare", "break down"]
+SUBJECTS = [
+    "my spending", "expenses", "my income", "salary credits", "budget", "investment portfolio",
+    "transactions", "card activity", "earnings", "food vs travel spending", "grocery and canvas purchases"
+]
+SHAPES = [
+    "", "as a pie chart", "in a table", "as a line graph", "as a bar chart", "over time", "by category",
+    "by merchant", "by day of week", "by payment method", "as a breakdown", "distribution by region", "list"
+]
+PERIODS = ["", "for last month", "for 2024", "this year", "for Q1 2024", "since March", "over the last 6 months"]
+SUBMODULES = ["ANALYTICS_SPENDING", "ANALYTICS_INCOME", "ANALYTICS_TRANSACTIONS", "ANALYTICS_BUDGET", "ANALYTICS_SUMMARY"]
+
+
+def build_corpus(size: int, seed: int) -> List[Tuple[str, str]]:
+    """(submoduleCode, utterance) pairs combining verbs, subjects, shapes and periods."""
+    combinations = [
+        " ".join(part for part in parts if part)
+        for parts in itertools.product(VERBS, SUBJECTS, SHAPES, PERIODS)
+    ]
+    rng = random.Random(seed)
+    return [(rng.choice(SUBMODULES), rng.choice(combinations)) for _ in range(size)]
+
+
+def load_legacy() -> Dict[str, Any]:
+    """The legacy inference functions, from the last revision of query_service.py with them."""
+    path = "services/query_service.py"
+    revision = subprocess.run(
+        ["git", "log", "-1", "--format=%H", "-S", "def _determine_analytics_type", "--", path],
+        capture_output=True, text=True, cwd=HERE, check=True
+    ).stdout.strip()
+    source = subprocess.run(
+        ["git", "show", f"{revision}^:./{path}"], capture_output=True, text=True, cwd=HERE
+    )
+    if source.returncode != 0 or LEGACY_FUNCTIONS[0] not in source.stdout:
+        # Not removed yet: the commit found is the one that added them
+        source = subprocess.run(["git", "show", f"{revision}:./{path}"], capture_output=True, text=True, cwd=HERE)
+    tree = ast.parse(source.stdout)
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in LEGACY_FUNCTIONS]
+    namespace: Dict[str, Any] = {}
+    exec("from typing import Dict, Any, Optional", namespace)
+    exec(compile(ast.Module(body=functions, type_ignores=[]), path, "exec"), namespace)
+    return namespace
+
+
+def legacy_classify(legacy: Dict[str, Any], submodule_code: str, text: str) -> Tuple[str, str, Any]:
+    """The legacy inference as process_text ran it."""
+    analytics_type = legacy["_determine_analytics_type"](submodule_code, text)
+    visualization_type = legacy["_determine_visualization_type"](submodule_code, text, {})
+    distribution_type = None
+    if visualization_type == "pie_chart" or "pie" in text.lower() or "distribution" in text.lower():
+        distribution_type = legacy["_determine_distribution_type"](text, {})
+    return analytics_type, visualization_type, distribution_type
+
+
+def new_classify(submodule_code: str, text: str) -> Tuple[str, str, Any]:
+    result = classify_analytics(submodule_code, text, {})
+    return result.analytics_type, result.visualization_type, result.distribution_type
+
+
+def time_per_call(function, corpus: List[Tuple[str, str]]) -> float:
+    start_time = time.perf_counter()
+    for submodule_code, text in corpus:
+        function(submodule_code, text)
+    return (time.perf_counter() - start_time) / len(corpus) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analytics keyword inference')
+    parser.add_argument('--size', type=int, default=100000, help='Utterances in the corpus')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the corpus')
+    parser.add_argument('--examples', type=int, default=10, help='Differing classifications to show')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.seed)
+    legacy = load_legacy()
+
+    legacy_us = time_per_call(lambda sub, text: legacy_classify(legacy, sub, text), corpus)
+    # Every text is distinct here, so the scan cache never hits
+    scan.cache_clear()
+    unique = [(sub, f"{text} #{i}") for i, (sub, text) in enumerate(corpus)]
+    cold_us = time_per_call(new_classify, unique)
+    # The common case in process_text: scanned at the early route, classified again after
+    repeated = unique[:scan.cache_info().maxsize]
+    time_per_call(new_classify, repeated)
+    warm_us = time_per_call(new_classify, repeated)
+
+    differences = []
+    for submodule_code, text in corpus:
+        old, new = legacy_classify(legacy, submodule_code, text), new_classify(submodule_code, text)
+        if old != new:
+            differences.append({"submodule": submodule_code, "text": text, "legacy": old, "compiled": new})
+    distinct = {(d["submodule"], d["text"]): d for d in differences}
+
+    results = {
+        "utterances": len(corpus),
+        "legacy_us_per_call": round(legacy_us, 2),
+        "compiled_us_per_call": round(cold_us, 2),
+        "compiled_cached_us_per_call": round(warm_us, 2),
+        "speedup": round(legacy_us / cold_us, 2) if cold_us else None,
+        "differing_utterances": len(differences),
+        "examples": list(distinct.values())[:args.examples]
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n==== ANALYTICS KEYWORD INFERENCE ({len(corpus)} utterances) ====\n")
+    print(f"Legacy substring scans:   {results['legacy_us_per_call']:>8} us/call")
+    print(f"Compiled matcher:         {results['compiled_us_per_call']:>8} us/call ({results['speedup']}x)")
+    print(f"Compiled, scan cached:    {results['compiled_cached_us_per_call']:>8} us/call")
+    print(f"\nDiffering classifications: {len(differences)} ({len(distinct)} distinct)")
+    for example in results["examples"]:
+        print(f"  {example['submodule']:<24} {example['text']!r}\n    {example['legacy']} -> {example['compiled']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the conversation context compactor over a large store of synthetic sessions.
+
+Fills a store (by default a directory of one million session files) with sessions of
+which some have been idle longer than the TTL and some have more turns than are kept,
+then runs one full compaction pass in a background thread, as the service does. Reads
+of random users keep running meanwhile, and their latency is compared with reads
+before the pass, to show that compaction does not stall request handling.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List
+
+from services.context_store import ContextStore, SQLiteContextBackend, ShardedFileContextBackend
+from services.context_compactor import ContextCompactor
+from services.history_manager import HistoryManager
+
+MODULES = [
+    ("CARD", "Cards", "CARD_DETAILS", "Card Details", {"cardType": "CREDIT"}),
+    ("ACC", "Accounts", "BALANCE", "Account Balance", {"accountType": "SAV"}),
+    ("ANALYTICS", "Analytics", "SPENDING", "Spending Analysis", {"period": "last month"})
+]
+
+
+def synthetic_session(user_id: str, turns: int, timestamp: str) -> Dict[str, Any]:
+    history = []
+    for turn in range(turns):
+        module_code, module_name, submodule_code, submodule_name, entities = MODULES[turn % len(MODULES)]
+        text = f"show my {submodule_name.lower()} please"
+        history.append({"timestamp": timestamp, "text": text, "is_user": True, "response_data": None})
+        history.append({
+            "timestamp": timestamp,
+            "text": f"Here is your {submodule_name.lower()}. Let me know if you need anything else.",
+            "is_user": False,
+            "response_data": {
+                "moduleCode": module_code, "moduleName": module_name, "submoduleCode": submodule_code,
+                "submoduleName": submodule_name, "flow": "QUERY", "entities": entities, "raw_text": text
+            }
+        })
+    return {
+        "user_id": user_id, "session_id": f"session-{user_id}", "created_at": timestamp, "last_updated": timestamp,
+        "history": history, "summary": None, "entities": {}, "current_module": None,
+        "current_submodule": None, "current_flow": None
+    }
+
+
+def plan(sessions: int, expired_fraction: float, long_fraction: float, seed: int) -> List[str]:
+    """The kind of each session: "expired", "long" or "active"."""
+    rng = random.Random(seed)
+    kinds = []
+    for _ in range(sessions):
+        draw = rng.random()
+        kinds.append("expired" if draw < expired_fraction else "long" if draw < expired_fraction + long_fraction else "active")
+    return kinds
+
+
+def fill(kind: str, directory: str, kinds: List[str], long_turns: int, ttl_seconds: float) -> None:
+    """Write the sessions directly in the back end's format, without the fsync of each write."""
+    now = time.time()
+    idle = now - ttl_seconds - 86400
+    texts = {
+        name: json.dumps(synthetic_session("{user}", turns, "2025-05-15T12:55:44.532657"), separators=(",", ":"))
+        for name, turns in (("expired", 3), ("long", long_turns), ("active", 3))
+    }
+    if kind == "sqlite":
+        connection = sqlite3.connect(os.path.join(directory, "conversation_context.db"))
+        SQLiteContextBackend(os.path.join(directory, "conversation_context.db")).close()
+        rows = (
+            (f"user-{i}", texts[name].replace("{user}", f"user-{i}"), idle if name == "expired" else now, os.urandom(8).hex())
+            for i, name in enumerate(kinds)
+        )
+        connection.executemany("INSERT INTO contexts (user_id, data, updated_at, version) VALUES (?, ?, ?, ?)", rows)
+        connection.commit()
+        connection.close()
+        return
+    backend = ShardedFileContextBackend(os.path.join(directory, "conversation_contexts"))
+    for shard in range(256):
+        os.makedirs(os.path.join(backend.root, f"{shard:02x}"), exist_ok=True)
+    for i, name in enumerate(kinds):
+        user_id = f"user-{i}"
+        path = backend.path(user_id)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"user_id":"%s","context":%s}' % (user_id, texts[name].replace("{user}", user_id)))
+        if name == "expired":
+            os.utime(path, (idle, idle))
+
+
+def open_store(kind: str, directory: str) -> ContextStore:
+    if kind == "sqlite":
+        backend = SQLiteContextBackend(os.path.join(directory, "conversation_context.db"))
+    else:
+        backend = ShardedFileContextBackend(os.path.join(directory, "conversation_contexts"))
+    return ContextStore(backend, cache_size=0)
+
+
+def read_latencies(store: ContextStore, sessions: int, rng: random.Random, stop) -> List[float]:
+    latencies: List[float] = []
+    while not stop(latencies):
+        user_id = f"user-{rng.randrange(sessions)}"
+        start_time = time.perf_counter()
+        store.get(user_id)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return latencies
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3) if ordered else 0.0
+
+
+def run(args) -> Dict[str, Any]:
+    directory = args.dir or tempfile.mkdtemp(prefix="nlp-compaction-")
+    ttl_seconds = args.ttl_hours * 3600
+    try:
+        kinds = plan(args.sessions, args.expired_fraction, args.long_fraction, args.seed)
+        start_time = time.perf_counter()
+        fill(args.backend, directory, kinds, args.long_turns, ttl_seconds)
+        fill_seconds = time.perf_counter() - start_time
+
+        store = open_store(args.backend, directory)
+        rng = random.Random(args.seed)
+        idle_latencies = read_latencies(store, args.sessions, rng, lambda latencies: len(latencies) >= args.probe_reads)
+
+        compactor = ContextCompactor(
+            open_store(args.backend, directory),
+            HistoryManager(max_stored_turns=args.max_stored_turns),
+            ttl_seconds=ttl_seconds,
+            batch_size=args.batch_size,
+            pause_ms=args.pause_ms
+        )
+        report: Dict[str, Any] = {}
+
+        def compact():
+            # Steps with pauses between them, as the service runs them
+            while True:
+                if compactor.step()["finished"]:
+                    report.update(compactor.last_pass)
+                    return
+                time.sleep(compactor.pause_seconds)
+
+        start_time = time.perf_counter()
+        thread = threading.Thread(target=compact)
+        thread.start()
+        busy_latencies = read_latencies(store, args.sessions, rng, lambda latencies: not thread.is_alive())
+        thread.join()
+        pass_seconds = time.perf_counter() - start_time
+        store.close()
+        compactor.store.close()
+
+        return {
+            "backend": args.backend,
+            "sessions": args.sessions,
+            "expected_expired": kinds.count("expired"),
+            "expected_compacted": kinds.count("long"),
+            "fill_seconds": round(fill_seconds, 1),
+            "pass_seconds": round(pass_seconds, 1),
+            "sessions_per_second": round(args.sessions / pass_seconds) if pass_seconds else 0,
+            "scanned": report["scanned"],
+            "expired": report["expired"],
+            "compacted": report["compacted"],
+            "reclaimed_mb": round(report["reclaimed_bytes"] / 1e6, 1),
+            "released_mb": round(report["released_bytes"] / 1e6, 1),
+            "steps": report["steps"],
+            "max_step_ms": report["max_step_ms"],
+            "read_ms_idle": {"p50": percentile(idle_latencies, 0.5), "p99": percentile(idle_latencies, 0.99)},
+            "read_ms_compacting": {
+                "p50": percentile(busy_latencies, 0.5),
+                "p99": percentile(busy_latencies, 0.99),
+                "max": round(max(busy_latencies), 3) if busy_latencies else 0.0,
+                "reads": len(busy_latencies)
+            }
+        }
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the conversation context compactor')
+    parser.add_argument('--sessions', type=int, default=1000000, help='Synthetic sessions in the store')
+    parser.add_argument('--backend', choices=('files', 'sqlite'), default='files', help='Back end of the store')
+    parser.add_argument('--expired-fraction', type=float, default=0.3, help='Sessions idle longer than the TTL')
+    parser.add_argument('--long-fraction', type=float, default=0.02, help='Sessions over the stored-turn cap')
+    parser.add_argument('--long-turns', type=int, default=80, help='Turns of the long sessions')
+    parser.add_argument('--max-stored-turns', type=int, default=50, help='Turns kept per session')
+    parser.add_argument('--ttl-hours', type=float, default=720, help='Idle time after which a session expires')
+    parser.add_argument('--batch-size', type=int, default=500, help='Contexts per compaction step')
+    parser.add_argument('--pause-ms', type=float, default=0, help='Pause between compaction steps')
+    parser.add_argument('--probe-reads', type=int, default=5000, help='Reads timed before the pass')
+    parser.add_argument('--dir', default='', help='Directory for the store (kept afterwards); default: a temporary one')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the session mix and the reads')
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"\n{result['backend']}: {result['sessions']} sessions, filled in {result['fill_seconds']}s")
+    print(f"Pass:      {result['pass_seconds']}s ({result['sessions_per_second']} sessions/s) in "
+          f"{result['steps']} steps, longest step {result['max_step_ms']} ms")
+    print(f"Expired:   {result['expired']} (expected {result['expected_expired']})")
+    print(f"Compacted: {result['compacted']} (expected {result['expected_compacted']})")
+    print(f"Reclaimed: {result['reclaimed_mb']} MB of contexts, {result['released_mb']} MB of database file")
+    print(f"Reads:     p50 {result['read_ms_idle']['p50']} ms, p99 {result['read_ms_idle']['p99']} ms idle; "
+          f"p50 {result['read_ms_compacting']['p50']} ms, p99 {result['read_ms_compacting']['p99']} ms, "
+          f"max {result['read_ms_compacting']['max']} ms while compacting")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the conversation context store against the old single-file storage.
+
+For each user count, fills a store with that many users and times reads and writes
+of random users, so the cost per operation can be compared as the user base grows.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, Any, List
+
+from services.context_store import ContextStore, SQLiteContextBackend, ShardedFileContextBackend
+
+BACKENDS = ("legacy", "sqlite", "files")
+
+
+class LegacyJSONFile:
+    """The old storage: every read parses, and every write rewrites, one JSON file of all users."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def get(self, user_id: str):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f).get(user_id)
+
+    def put(self, user_id: str, context: Dict[str, Any]) -> None:
+        contexts = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                contexts = json.load(f)
+        contexts[user_id] = context
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(contexts, f, indent=2, ensure_ascii=False)
+
+    def put_many(self, contexts: Dict[str, Dict[str, Any]]) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(contexts, f, indent=2, ensure_ascii=False)
+
+    def close(self) -> None:
+        pass
+
+
+def sample_context(i: int) -> Dict[str, Any]:
+    return {
+        "timestamp": "2025-05-15T12:55:44.532657",
+        "raw_text": f"show my spending for march #{i}",
+        "response": {"type": "text", "content": "Here is your spending for March. " * 8}
+    }
+
+
+def open_backend(kind: str, directory: str):
+    if kind == "legacy":
+        return LegacyJSONFile(os.path.join(directory, "conversation_context.json"))
+    if kind == "sqlite":
+        return SQLiteContextBackend(os.path.join(directory, "conversation_context.db"))
+    return ShardedFileContextBackend(os.path.join(directory, "conversation_contexts"))
+
+
+def run(kind: str, users: int, operations: int, seed: int) -> Dict[str, Any]:
+    directory = tempfile.mkdtemp(prefix="nlp-contexts-")
+    try:
+        backend = open_backend(kind, directory)
+        start_time = time.perf_counter()
+        # The legacy file is written once; the others in batches of at most 10000 users
+        step = users if kind == "legacy" else 10000
+        for first in range(0, users, step):
+            backend.put_many({f"user-{i}": sample_context(i) for i in range(first, min(users, first + step))})
+        fill_seconds = time.perf_counter() - start_time
+
+        rng = random.Random(seed)
+        user_ids = [f"user-{rng.randrange(users)}" for _ in range(operations)]
+        # The LRU is left out (size 0) so every read reaches the back end
+        store = backend if kind == "legacy" else ContextStore(backend, cache_size=0)
+
+        start_time = time.perf_counter()
+        for user_id in user_ids:
+            store.get(user_id)
+        read_us = (time.perf_counter() - start_time) / operations * 1e6
+
+        start_time = time.perf_counter()
+        for i, user_id in enumerate(user_ids):
+            store.put(user_id, sample_context(i))
+        write_us = (time.perf_counter() - start_time) / operations * 1e6
+        backend.close()
+        return {
+            "backend": kind,
+            "users": users,
+            "operations": operations,
+            "fill_seconds": round(fill_seconds, 2),
+            "read_us": round(read_us, 1),
+            "write_us": round(write_us, 1)
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the conversation context store')
+    parser.add_argument('--users', default='100,10000,100000', help='Comma-separated user counts')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma-separated back ends')
+    parser.add_argument('--operations', type=int, default=500, help='Reads and writes per run')
+    parser.add_argument('--legacy-max-users', type=int, default=10000,
+                        help='Skip the legacy file above this many users (each operation rewrites all of them)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the user order')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    for users in [int(count) for count in args.users.split(",") if count]:
+        for kind in [kind for kind in args.backends.split(",") if kind]:
+            if kind == "legacy" and users > args.legacy_max_users:
+                continue
+            operations = min(args.operations, 50) if kind == "legacy" else args.operations
+            results.append(run(kind, users, operations, args.seed))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'Backend':<8} {'Users':>8} {'Fill s':>8} {'Read us':>10} {'Write us':>10}")
+    for result in results:
+        print(f"{result['backend']:<8} {result['users']:>8} {result['fill_seconds']:>8} "
+              f"{result['read_us']:>10} {result['write_us']:>10}")
+
+
+if __name__ == "__main__":
+    main()
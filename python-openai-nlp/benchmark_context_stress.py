@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Stress test of the conversation context store under several worker processes.
+
+Each of N worker processes, like the workers of `uvicorn --workers N`, opens the same
+store and for every round reads and rewrites the context of its own M users and of a
+set of users every worker writes. Afterwards every user must have the context of the
+last round. Any other answer is a lost context. Workers then read the contended users
+again through their warm caches, and any answer that differs from the store is
+counted as a stale read.
+
+The "legacy" back end is the old single JSON file without locking, included to show
+the contexts it loses.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+from benchmark_context_store import LegacyJSONFile, open_backend
+from services.context_store import ContextStore
+
+BACKENDS = ("legacy", "sqlite", "files")
+
+
+class UnlockedJSONFile(LegacyJSONFile):
+    """The old service's storage: a file it could not parse was replaced by an empty one."""
+
+    def get(self, user_id: str):
+        try:
+            return super().get(user_id)
+        except json.JSONDecodeError:
+            return None
+
+    def put(self, user_id: str, context: Dict[str, Any]) -> None:
+        try:
+            super().put(user_id, context)
+        except json.JSONDecodeError:
+            self.put_many({user_id: context})
+
+
+def context(worker: int, round_number: int) -> Dict[str, Any]:
+    return {
+        "worker": worker,
+        "round": round_number,
+        "raw_text": f"show my spending for march (worker {worker}, round {round_number})",
+        "response": {"type": "text", "content": "Here is your spending for March. " * 8}
+    }
+
+
+def open_store(kind: str, directory: str, private: bool):
+    if kind == "legacy":
+        return UnlockedJSONFile(os.path.join(directory, "conversation_context.json"))
+    return ContextStore(open_backend(kind, directory), shared=not private)
+
+
+def worker_main(kind: str, directory: str, worker: int, users: int, shared_users: List[str],
+                rounds: int, private: bool, barrier, results) -> None:
+    own_users = [f"worker-{worker}-user-{i}" for i in range(users)]
+    operations = errors = lost = 0
+    store = open_store(kind, directory, private)
+    barrier.wait()
+    start_time = time.time()
+    for round_number in range(rounds):
+        for user_id in own_users + shared_users:
+            try:
+                previous = store.get(user_id)
+                # Only this worker writes its own users, so it must read back its last write
+                if user_id in own_users and round_number and (previous or {}).get("round") != round_number - 1:
+                    lost += 1
+                store.put(user_id, context(worker, round_number))
+                operations += 2
+            except Exception:
+                errors += 1
+    end_time = time.time()
+
+    # Every worker has finished writing: read the contended users through the warm cache
+    barrier.wait()
+    stale = 0
+    if kind != "legacy":
+        for user_id in shared_users:
+            if store.get(user_id) != store.backend.get(user_id):
+                stale += 1
+    store.close()
+    results.put({
+        "worker": worker, "operations": operations, "errors": errors, "lost_reads": lost,
+        "stale_reads": stale, "start": start_time, "end": end_time
+    })
+
+
+def verify(kind: str, directory: str, workers: int, users: int, shared_users: List[str], rounds: int) -> int:
+    """The number of users whose stored context is not one of the last round."""
+    store = open_store(kind, directory, private=True)
+    expected = [f"worker-{worker}-user-{i}" for worker in range(workers) for i in range(users)] + shared_users
+    lost = 0
+    for user_id in expected:
+        try:
+            stored = store.get(user_id)
+        except json.JSONDecodeError:
+            stored = None
+        if not stored or stored.get("round") != rounds - 1:
+            lost += 1
+    store.close()
+    return lost
+
+
+def run(kind: str, workers: int, users: int, shared: int, rounds: int, private: bool) -> Dict[str, Any]:
+    directory = tempfile.mkdtemp(prefix="nlp-context-stress-")
+    shared_users = [f"shared-user-{i}" for i in range(shared)]
+    try:
+        # Create the store once, as the first worker to start would
+        open_store(kind, directory, private).close()
+        barrier = multiprocessing.Barrier(workers)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=worker_main,
+                args=(kind, directory, worker, users, shared_users, rounds, private, barrier, results)
+            )
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        seconds = max(report["end"] for report in reports) - min(report["start"] for report in reports)
+        operations = sum(report["operations"] for report in reports)
+        return {
+            "backend": kind,
+            "shared": kind != "legacy" and not private,
+            "workers": workers,
+            "users": workers * users + shared,
+            "operations": operations,
+            "seconds": round(seconds, 2),
+            "ops_per_second": round(operations / seconds) if seconds else 0,
+            "errors": sum(report["errors"] for report in reports),
+            "lost_reads": sum(report["lost_reads"] for report in reports),
+            "lost_contexts": verify(kind, directory, workers, users, shared_users, rounds),
+            "stale_reads": sum(report["stale_reads"] for report in reports)
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress the conversation context store with several worker processes')
+    parser.add_argument('--workers', default='1,2,4,8', help='Comma-separated worker process counts')
+    parser.add_argument('--users', type=int, default=100, help='Users of each worker')
+    parser.add_argument('--shared-users', type=int, default=20, help='Users every worker writes')
+    parser.add_argument('--rounds', type=int, default=10, help='Reads and writes of each user by each worker')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma-separated back ends')
+    parser.add_argument('--private', action='store_true',
+                        help='Trust the cache without revalidating, as with CONTEXT_STORE_SHARED=False')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for workers in [int(count) for count in args.workers.split(",") if count]:
+        for kind in [kind for kind in args.backends.split(",") if kind]:
+            results.append(run(kind, workers, args.users, args.shared_users, args.rounds, args.private))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"\n{'Backend':<8} {'Workers':>7} {'Users':>7} {'Ops/s':>8} {'Errors':>7} "
+              f"{'Lost reads':>10} {'Lost ctx':>9} {'Stale':>6}")
+        for result in results:
+            print(f"{result['backend']:<8} {result['workers']:>7} {result['users']:>7} "
+                  f"{result['ops_per_second']:>8} {result['errors']:>7} {result['lost_reads']:>10} "
+                  f"{result['lost_contexts']:>9} {result['stale_reads']:>6}")
+
+    # Losing contexts is a failure for every back end but the legacy file
+    if any(result["lost_contexts"] or result["lost_reads"] or result["errors"]
+           for result in results if result["backend"] != "legacy"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+import asyncio
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# Commands the fake server can route, sent round-robin
+COMMANDS = [
+    "show my account balance",
+    "show my cards",
+    "transfer 500 to John",
+    "how much did I spend on food last month",
+    "block my credit card",
+    "show my recent transactions"
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_server(port: int, args) -> subprocess.Popen:
+    """Start fake_openai_server.py and wait until it answers."""
+    import httpx
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.join(here, "fake_openai_server.py"),
+            "--port", str(port),
+            "--p50-ms", str(args.p50_ms),
+            "--slow-fraction", str(args.slow_fraction),
+            "--slow-ms", str(args.slow_ms),
+            "--error-rate", str(args.error_rate),
+            "--capacity", str(args.capacity),
+            "--retry-after-ms", str(args.retry_after_ms)
+        ],
+        cwd=here
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError("Fake OpenAI server exited during startup")
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Fake OpenAI server did not start")
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+# Gateway settings compared by each scenario
+SCENARIOS = {
+    "hedging": [
+        ("hedging off", {"llm_hedging_enabled": False}),
+        ("hedging on", {"llm_hedging_enabled": True})
+    ],
+    "limiter": [
+        ("limiter off", {"llm_limiter_enabled": False}),
+        ("limiter on", {"llm_limiter_enabled": True})
+    ]
+}
+
+
+async def run_scenario(port: int, label: str, overrides: dict, args) -> dict:
+    """Send the requests through a fresh gateway and collect their latencies."""
+    from openai import AsyncOpenAI
+    from config import Settings
+    from services.adaptive_limiter import OverloadedError
+    from services.llm_gateway import LLMGateway, LLMUnavailableError, deadline_scope
+
+    settings = Settings(
+        llm_hedge_delay_ms=args.hedge_delay_ms,
+        request_deadline_seconds=args.deadline_seconds,
+        **overrides
+    )
+    client = AsyncOpenAI(api_key="sk-benchmark", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+    gateway = LLMGateway(client, settings)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+    shed = 0
+
+    async def one(i: int):
+        nonlocal errors, shed
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                with deadline_scope(settings.request_deadline_seconds):
+                    await gateway.create(
+                        model=settings.openai_model,
+                        messages=[{
+                            "role": "user",
+                            "content": f"Extract the module, sub_module, entities, and flow from this banking command: {COMMANDS[i % len(COMMANDS)]}\n\nReturn ONLY a JSON object with the defined structure."
+                        }],
+                        response_format={"type": "json_object"}
+                    )
+                latencies.append((time.perf_counter() - start_time) * 1000)
+            except LLMUnavailableError:
+                errors += 1
+            except OverloadedError:
+                shed += 1
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start_time
+    await client.close()
+
+    stats = gateway.stats()
+    return {
+        "scenario": label,
+        "requests": args.requests,
+        "errors": errors,
+        "shed": shed,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "upstream_attempts": stats["attempts"] + stats["hedges"],
+        "hedges": stats["hedges"],
+        "hedge_wins": stats["hedge_wins"],
+        "retries": stats["retries"],
+        "final_limit": stats["limiter"]["limit"] if stats["limiter"] else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare LLM latency and errors under gateway settings')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='hedging',
+                        help='hedging: slow tail with and without hedges; limiter: overload with and without the adaptive limit')
+    parser.add_argument('--requests', type=int, default=300, help='Number of completions per scenario')
+    parser.add_argument('--concurrency', type=int, default=20, help='Completions in flight at once')
+    parser.add_argument('--p50-ms', type=float, default=300, help='Median latency of the fake server')
+    parser.add_argument('--slow-fraction', type=float, default=0.05, help='Share of slow fake responses')
+    parser.add_argument('--slow-ms', type=float, default=3000, help='Latency of the slow tail')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of fake responses that are 500s')
+    parser.add_argument('--capacity', type=int, default=0, help='Concurrency of the fake server before 429s (0 = unlimited)')
+    parser.add_argument('--retry-after-ms', type=float, default=500, help='Retry-After the fake server sends with 429s')
+    parser.add_argument('--hedge-delay-ms', type=float, default=600, help='Hedge delay until the p95 is known')
+    parser.add_argument('--deadline-seconds', type=float, default=20, help='Deadline of each request')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_fake_server(port, args)
+    try:
+        results = [
+            asyncio.run(run_scenario(port, label, overrides, args))
+            for label, overrides in SCENARIOS[args.scenario]
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n==== LLM GATEWAY: {args.scenario.upper()} ====\n")
+    print(f"{'Scenario':<13} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'Errors':>7} {'Shed':>5} {'Upstream':>9} {'Hedges':>7}")
+    for result in results:
+        print(
+            f"{result['scenario']:<13} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+            f"{result['p99_ms']:>9} {result['max_ms']:>9} {result['errors']:>7} {result['shed']:>5} "
+            f"{result['upstream_attempts']:>9} {result['hedges']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Offline load test of the service's HTTP endpoints.
+
+Starts fake_openai_server.py, fake_banking_backend.py and the service itself, drives
+/process-text and /process-smart-text at each requested concurrency, and reports
+throughput, latency percentiles and the per-stage breakdown read from the
+Server-Timing header as JSON that can be diffed between releases (--baseline).
+"""
+import asyncio
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+
+from benchmark_llm_gateway import free_port, percentile
+from benchmark_pipeline_modes import BENCHMARK_QUERIES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINTS = {
+    "process-text": lambda text, user_id: {"text": text, "user_id": user_id},
+    "process-smart-text": lambda text, user_id: {"text": text, "user_id": user_id, "is_new": False}
+}
+
+
+def start_process(command: List[str], port: int, name: str, cwd: str = HERE,
+                  env: Optional[Dict[str, str]] = None, verbose: bool = False) -> subprocess.Popen:
+    """Start a server and wait until its /health answers."""
+    import httpx
+
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=output, stderr=output)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited during startup")
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not start")
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Stage durations in milliseconds from a Server-Timing header."""
+    stages = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = stages.get(name, 0.0) + float(value)
+    return stages
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(values, 0.50), 1),
+        "p95_ms": round(percentile(values, 0.95), 1),
+        "p99_ms": round(percentile(values, 0.99), 1),
+        "mean_ms": round(sum(values) / len(values), 1) if values else 0.0,
+        "max_ms": round(max(values), 1) if values else 0.0
+    }
+
+
+async def drive(port: int, endpoint: str, requests: int, concurrency: int, commands: List[str],
+                users: int) -> Dict[str, Any]:
+    """Send the requests from `concurrency` closed-loop clients and collect their timings."""
+    import httpx
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    next_request = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal next_request
+            while next_request < requests:
+                i = next_request
+                next_request += 1
+                payload = ENDPOINTS[endpoint](commands[i % len(commands)], f"load-user-{i % users}")
+                start_time = time.perf_counter()
+                try:
+                    response = await client.post(f"/{endpoint}", json=payload)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                    response = None
+                statuses[status] = statuses.get(status, 0) + 1
+                if response is None or response.status_code != 200:
+                    continue
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                for name, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                    stages.setdefault(name, []).append(ms)
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start_time
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency": summarize(latencies),
+        # Stages are summarized over the requests that ran them
+        "stages": {
+            name: {"requests": len(values), **summarize(values)}
+            for name, values in sorted(stages.items())
+        }
+    }
+
+
+def upstream_counters(port: int) -> Dict[str, Any]:
+    import httpx
+    return httpx.get(f"http://127.0.0.1:{port}/health", timeout=5).json()
+
+
+def counter_delta(after: Dict[str, Any], before: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: after[key] - before.get(key, 0) for key in ("requests", "errors") if key in after}
+
+
+def run_load(args) -> Dict[str, Any]:
+    """Start the fakes and the service, then run every endpoint at every concurrency."""
+    openai_port, backend_port, service_port = free_port(), free_port(), free_port()
+    seed = ["--seed", str(args.seed)] if args.seed is not None else []
+    canned = ["--canned", args.canned] if args.canned else []
+    # The service runs in a scratch directory so its context files do not touch data/
+    workdir = tempfile.mkdtemp(prefix="nlp-load-")
+    os.symlink(os.path.join(HERE, "mapping"), os.path.join(workdir, "mapping"))
+    env = {
+        **os.environ,
+        "PYTHONPATH": HERE + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "EXTERNAL_API_BASE_URL": f"http://127.0.0.1:{backend_port}/api",
+        **dict(setting.split("=", 1) for setting in args.env)
+    }
+
+    processes = []
+    try:
+        processes.append(start_process([
+            sys.executable, "fake_openai_server.py", "--port", str(openai_port),
+            "--p50-ms", str(args.llm_p50_ms), "--slow-fraction", str(args.llm_slow_fraction),
+            "--slow-ms", str(args.llm_slow_ms), "--error-rate", str(args.llm_error_rate), *seed, *canned
+        ], openai_port, "Fake OpenAI server", verbose=args.verbose))
+        processes.append(start_process([
+            sys.executable, "fake_banking_backend.py", "--port", str(backend_port),
+            "--p50-ms", str(args.backend_p50_ms), "--error-rate", str(args.backend_error_rate), *seed
+        ], backend_port, "Fake banking backend", verbose=args.verbose))
+        processes.append(start_process([
+            sys.executable, "-m", "uvicorn", "app:app", "--port", str(service_port),
+            "--workers", str(args.workers), "--log-level", "warning"
+        ], service_port, "Service", cwd=workdir, env=env, verbose=args.verbose))
+
+        commands = [query["text"] for query in BENCHMARK_QUERIES]
+        random.Random(args.seed).shuffle(commands)
+        results = []
+        for endpoint in args.endpoints:
+            # Warm up the lazily built services and the connection pools
+            asyncio.run(drive(service_port, endpoint, args.warmup, 1, commands, args.users))
+            for concurrency in args.concurrency:
+                openai_before = upstream_counters(openai_port)
+                backend_before = upstream_counters(backend_port)
+                result = asyncio.run(drive(service_port, endpoint, args.requests, concurrency, commands, args.users))
+                result["upstream"] = {
+                    "openai": counter_delta(upstream_counters(openai_port), openai_before),
+                    "backend": counter_delta(upstream_counters(backend_port), backend_before)
+                }
+                results.append(result)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "users": args.users,
+            "workers": args.workers,
+            "llm_p50_ms": args.llm_p50_ms,
+            "llm_slow_fraction": args.llm_slow_fraction,
+            "llm_slow_ms": args.llm_slow_ms,
+            "llm_error_rate": args.llm_error_rate,
+            "backend_p50_ms": args.backend_p50_ms,
+            "backend_error_rate": args.backend_error_rate,
+            "env": sorted(args.env),
+            "seed": args.seed
+        },
+        "results": results
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the change of every run's headline numbers against a baseline report."""
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"\n{'Endpoint':<20} {'Conc':>5} {'Metric':<15} {'Baseline':>10} {'Current':>10} {'Change':>8}")
+    for result in report["results"]:
+        before = previous.get((result["endpoint"], result["concurrency"]))
+        if before is None:
+            continue
+        rows = [("throughput_rps", before["throughput_rps"], result["throughput_rps"])]
+        rows += [(key, before["latency"][key], result["latency"][key]) for key in ("p50_ms", "p95_ms", "p99_ms")]
+        for metric, old, new in rows:
+            change = f"{(new - old) / old:+.1%}" if old else "n/a"
+            print(f"{result['endpoint']:<20} {result['concurrency']:>5} {metric:<15} {old:>10} {new:>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the service against local fake OpenAI and backend servers')
+    parser.add_argument('--endpoints', default='process-text,process-smart-text',
+                        help='Comma-separated endpoints to drive')
+    parser.add_argument('--concurrency', default='1,10,50', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and concurrency level')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests before each endpoint')
+    parser.add_argument('--users', type=int, default=50, help='Distinct user ids to spread the requests over')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers of the service')
+    parser.add_argument('--llm-p50-ms', type=float, default=300, help='Median latency of the fake OpenAI server')
+    parser.add_argument('--llm-slow-fraction', type=float, default=0.05, help='Share of slow fake completions')
+    parser.add_argument('--llm-slow-ms', type=float, default=3000, help='Latency of the slow tail')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Share of fake completions that are 500s')
+    parser.add_argument('--backend-p50-ms', type=float, default=20, help='Median latency of the fake backend')
+    parser.add_argument('--backend-error-rate', type=float, default=0.0, help='Share of fake backend 500s')
+    parser.add_argument('--canned', default=None, help='JSON file of canned completions by command')
+    parser.add_argument('--env', action='append', default=[],
+                        help='Service setting as NAME=VALUE, e.g. NLP_CACHE_ENABLED=False (repeatable)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed the fakes and the command order')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file')
+    parser.add_argument('--baseline', default=None, help='JSON report of an earlier run to compare against')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the servers')
+    args = parser.parse_args()
+    args.endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+    args.concurrency = [int(level) for level in args.concurrency.split(",") if level]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    report = run_load(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
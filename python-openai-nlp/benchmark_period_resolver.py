@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the period resolution of analytics filters.
+
+Times services/period_resolver.py over a mix of period phrases, cold (every phrase
+parsed) and memoized (the same phrases again on the same day), and prints what each
+phrase resolves to.
+"""
+import argparse
+import json
+import time
+from datetime import date
+
+from services.period_resolver import PeriodResolver, resolve_period
+
+PHRASES = [
+    "today", "yesterday", "this week", "last week", "this month", "last month", "this quarter",
+    "last quarter", "year to date", "last year", "last 30 days", "past 6 months", "last two weeks",
+    "since March", "since 2024", "February 2024", "Q1 2024", "2024 Q3", "first quarter of 2025",
+    "H1 2024", "second half of 2023", "FY 2023-24", "fy25", "this fiscal year", "last fiscal year",
+    "Nov 2023 to Feb 2024", "from Dec 2024 to Jan 2025", "between Q3 2023 and Q1 2024", "nov to feb"
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analytics period resolver')
+    parser.add_argument('--iterations', type=int, default=20000, help='Phrases resolved per measurement')
+    parser.add_argument('--today', default=None, help='Day to resolve against (YYYY-MM-DD)')
+    parser.add_argument('--timezone', default='', help='Timezone of today')
+    parser.add_argument('--fiscal-start', type=int, default=4, help='First month of the fiscal year')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    resolver = PeriodResolver(args.timezone, args.fiscal_start)
+    today = date.fromisoformat(args.today) if args.today else resolver.today()
+    phrases = [PHRASES[i % len(PHRASES)] for i in range(args.iterations)]
+
+    start_time = time.perf_counter()
+    for phrase in phrases:
+        resolve_period.cache_clear()
+        resolver.resolve(phrase, today)
+    cold_us = (time.perf_counter() - start_time) / len(phrases) * 1e6
+
+    start_time = time.perf_counter()
+    for phrase in phrases:
+        resolver.filters({"period": phrase})
+    memoized_us = (time.perf_counter() - start_time) / len(phrases) * 1e6
+
+    results = {
+        "today": today.isoformat(),
+        "cold_us_per_phrase": round(cold_us, 2),
+        "memoized_us_per_request": round(memoized_us, 2),
+        "resolved": {phrase: resolver.resolve(phrase, today) for phrase in PHRASES}
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n==== PERIOD RESOLUTION (today {results['today']}) ====\n")
+    print(f"Parsed:             {results['cold_us_per_phrase']:>8} us/phrase")
+    print(f"Memoized, filters:  {results['memoized_us_per_request']:>8} us/request\n")
+    for phrase, span in results["resolved"].items():
+        print(f"  {phrase:<32} {span[0] + ' .. ' + span[1] if span else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import asyncio
+import argparse
+import time
+import logging
+import statistics
+from services.nlp_service import NLPService
+
+# Configure logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Commands covering every module, with the module each one should route to
+BENCHMARK_QUERIES = [
+    {"text": "show my account balance", "expected_module": "ACC"},
+    {"text": "get mini statement for my savings account", "expected_module": "ACC"},
+    {"text": "block my debit card", "expected_module": "CARD"},
+    {"text": "show my credit card details", "expected_module": "CARD"},
+    {"text": "transfer $500 from savings to checking", "expected_module": "TRF"},
+    {"text": "send 200 euros to Alice Johnson", "expected_module": "TRF"},
+    {"text": "add John Smith as a beneficiary", "expected_module": "BEN"},
+    {"text": "pay my electricity bill", "expected_module": "BILL"},
+    {"text": "show my loan details", "expected_module": "LOAN"},
+    {"text": "update my email address", "expected_module": "PROF"},
+    {"text": "show my spending trends for 2024", "expected_module": "ANALYTICS"},
+    {"text": "pie chart of my expenses by category last month", "expected_module": "ANALYTICS"},
+]
+
+
+def estimate_prompt_tokens(nlp_service: NLPService, module_code: str) -> dict:
+    """
+    Estimate the prompt tokens each pipeline mode sends for a command routed to a module.
+    The user message is the same size in both modes and is left out.
+    """
+    compiler = nlp_service.prompt_compiler
+    version = nlp_service.mapping_version
+    combined = compiler.compile(version, name="combined").token_count
+    two_stage = compiler.compile(version, name="router").token_count
+    if nlp_service.module_properties.get(module_code) or module_code in ("TRF", "ANALYTICS"):
+        two_stage += compiler.compile(version, name=f"entities:{module_code}").token_count
+    return {"combined": combined, "two_stage": two_stage}
+
+
+def run_offline(nlp_service: NLPService):
+    """Compare the compiled prompt sizes of both modes without calling OpenAI."""
+    print("\n==== PROMPT TOKENS PER COMMAND (OFFLINE ESTIMATE) ====\n")
+    print(f"{'Command':<50} {'Module':<10} {'Combined':>9} {'2-stage':>9}")
+    totals = {"combined": 0, "two_stage": 0}
+    for query in BENCHMARK_QUERIES:
+        tokens = estimate_prompt_tokens(nlp_service, query["expected_module"])
+        totals["combined"] += tokens["combined"]
+        totals["two_stage"] += tokens["two_stage"]
+        print(f"{query['text'][:50]:<50} {query['expected_module']:<10} {tokens['combined']:>9} {tokens['two_stage']:>9}")
+
+    saving = 1 - totals["two_stage"] / totals["combined"]
+    print(f"\nTotal prompt tokens: combined={totals['combined']}, two_stage={totals['two_stage']} ({saving:.1%} fewer)")
+
+
+async def run_live(nlp_service: NLPService, repeat: int):
+    """Run every command through both modes against OpenAI, recording usage and latency."""
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}
+    original_create = nlp_service.llm.create
+
+    async def recording_create(**kwargs):
+        response = await original_create(**kwargs)
+        usage["calls"] += 1
+        if getattr(response, "usage", None):
+            usage["prompt_tokens"] += response.usage.prompt_tokens
+            usage["completion_tokens"] += response.usage.completion_tokens
+        return response
+
+    nlp_service.llm.create = recording_create
+
+    results = {}
+    for mode in ("combined", "two_stage"):
+        nlp_service.settings.nlp_pipeline_mode = mode
+        usage.update(prompt_tokens=0, completion_tokens=0, calls=0)
+        latencies = []
+        correct = 0
+        for _ in range(repeat):
+            for query in BENCHMARK_QUERIES:
+                start_time = time.perf_counter()
+                result, _ = await nlp_service._analyze(query["text"])
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                if result.get("module") == query["expected_module"]:
+                    correct += 1
+
+        total = len(latencies)
+        results[mode] = {
+            "calls": usage["calls"],
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "p50_ms": statistics.median(latencies),
+            "mean_ms": statistics.mean(latencies),
+            "accuracy": correct / total
+        }
+
+    print("\n==== LIVE COMPARISON ====\n")
+    print(f"{'Mode':<10} {'Calls':>6} {'Prompt tok':>11} {'Compl tok':>10} {'p50 ms':>8} {'Mean ms':>8} {'Routing':>8}")
+    for mode, stats in results.items():
+        print(
+            f"{mode:<10} {stats['calls']:>6} {stats['prompt_tokens']:>11} {stats['completion_tokens']:>10} "
+            f"{stats['p50_ms']:>8.0f} {stats['mean_ms']:>8.0f} {stats['accuracy']:>8.0%}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare the combined and two-stage NLP pipeline modes')
+    parser.add_argument(
+        '--live',
+        action='store_true',
+        help='Also call OpenAI with both modes to measure actual token usage and end-to-end latency'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Number of times to run each command in live mode'
+    )
+    args = parser.parse_args()
+
+    nlp_service = NLPService()
+    run_offline(nlp_service)
+    if args.live:
+        await run_live(nlp_service, args.repeat)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Deterministic end-to-end regression benchmark over recorded LLM completions.
+
+  corpus  Build the golden corpus from the queries of the test_*_optimization.py
+          scripts and, optionally, from service logs or plain query files.
+  record  Run the corpus through /process-text and /process-smart-text with the OpenAI
+          client in cassette record mode, and save the results as the golden results.
+          With --fake-openai, completions come from fake_openai_server.py instead of
+          OpenAI; the cassette and results committed in data/ are recorded this way.
+  replay  Run it again with the completions served from the cassette, check every
+          result against the golden results and report latency and CPU time per request.
+          Exits with status 1 if a result differs or a completion was not recorded.
+
+The service runs in a fresh interpreter behind an ASGI transport, against
+fake_banking_backend.py, in a scratch directory so its context files do not touch data/. Requests are sent one at
+a time, in corpus order, so the replayed run makes exactly the recorded requests.
+"""
+import asyncio
+import argparse
+import ast
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+from benchmark_llm_gateway import free_port, percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_SCRIPTS = ("test_query_optimization.py", "test_analytics_optimization.py", "test_transfer_optimization.py")
+DEFAULT_CORPUS = os.path.join(HERE, "data", "golden_corpus.json")
+DEFAULT_CASSETTE = os.path.join(HERE, "data", "golden_cassette.jsonl.gz")
+DEFAULT_GOLDEN = os.path.join(HERE, "data", "golden_results.json")
+
+# Service log lines that name the command being processed
+LOG_PATTERNS = [
+    re.compile(r"Result cache hit for '(?P<text>.+)'$"),
+    re.compile(r"Template cache hit for '(?P<text>.+)'$"),
+    re.compile(r"(?:Local classifier|Local fallback) matched '(?P<text>.+)' to "),
+    re.compile(r"Determined flow for text '(?P<text>.+)' from"),
+]
+
+# Result fields compared against the golden results
+COMPARED_FIELDS = ("moduleCode", "submoduleCode", "flow", "entity_keys", "error")
+
+
+def queries_from_script(path: str) -> List[Dict[str, Any]]:
+    """The literal `test_queries` list of a test script, read without running it."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == "test_queries" for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    return []
+
+
+def queries_from_log(path: str) -> List[str]:
+    """Commands named in a service log, or every line of a plain file of queries."""
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    for line in lines:
+        for pattern in LOG_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                texts.append(match.group("text"))
+                break
+    if not texts and not path.endswith(".log"):
+        texts = [line.strip() for line in lines]
+    return texts
+
+
+def build_corpus(logs: List[str]) -> List[Dict[str, Any]]:
+    corpus = []
+    seen = set()
+    for script in TEST_SCRIPTS:
+        for query in queries_from_script(os.path.join(HERE, script)):
+            key = query["text"].strip().lower()
+            if key not in seen:
+                seen.add(key)
+                corpus.append({"text": query["text"], "source": script, "expected_module": query.get("expected_module")})
+    for log in logs:
+        for text in queries_from_log(log):
+            key = text.strip().lower()
+            if key not in seen:
+                seen.add(key)
+                corpus.append({"text": text, "source": os.path.basename(log)})
+    return corpus
+
+
+def summarize_result(endpoint: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a response that must not change between releases."""
+    if endpoint == "process-smart-text":
+        return {
+            "moduleCode": (body.get("module") or {}).get("moduleCode"),
+            "submoduleCode": (body.get("sub_module") or {}).get("submoduleCode"),
+            "flow": body.get("flow"),
+            "entity_keys": sorted(body.get("entities") or {}),
+            "error": body.get("error")
+        }
+    return {
+        "moduleCode": body.get("moduleCode"),
+        "submoduleCode": body.get("submoduleCode"),
+        "flow": body.get("flow"),
+        "entity_keys": sorted(body.get("entities") or {}),
+        "error": body.get("error")
+    }
+
+
+async def run_corpus(corpus: List[Dict[str, Any]], endpoints: List[str], repeat: int) -> Dict[str, Any]:
+    """Send every query to every endpoint in order and time each request."""
+    import httpx
+    import app
+
+    results: Dict[str, Dict[str, Any]] = {}
+    timings: Dict[str, Dict[str, List[float]]] = {endpoint: {"wall_ms": [], "cpu_ms": []} for endpoint in endpoints}
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=60) as client:
+        for round_number in range(repeat):
+            for endpoint in endpoints:
+                for i, query in enumerate(corpus):
+                    # A fresh user per round, so no round sees the context of an earlier one
+                    payload = {"text": query["text"], "user_id": f"golden-{round_number}-{i}"}
+                    wall_start, cpu_start = time.perf_counter(), time.process_time()
+                    response = await client.post(f"/{endpoint}", json=payload)
+                    timings[endpoint]["cpu_ms"].append((time.process_time() - cpu_start) * 1000)
+                    timings[endpoint]["wall_ms"].append((time.perf_counter() - wall_start) * 1000)
+                    if round_number == 0:
+                        body = response.json() if response.status_code == 200 else {"error": f"HTTP {response.status_code}"}
+                        results[f"{endpoint} {query['text']}"] = summarize_result(endpoint, body)
+    cassette = app.container.http_clients.stats()["cassette"]
+    await app.container.http_clients.aclose()
+    return {"results": results, "timings": timings, "cassette": cassette}
+
+
+def run_child(args) -> None:
+    """Run the corpus in a scratch directory and print the outcome as JSON."""
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    os.chdir(args.workdir)
+    outcome = asyncio.run(run_corpus(corpus, args.endpoints, args.repeat))
+    print(json.dumps(outcome))
+
+
+def run_phase(args, mode: str, repeat: int) -> Dict[str, Any]:
+    """Start the fake backend, run the corpus in a fresh interpreter and return its outcome."""
+    from benchmark_load import start_process
+
+    backend_port = free_port()
+    workdir = tempfile.mkdtemp(prefix="nlp-replay-")
+    os.symlink(os.path.join(HERE, "mapping"), os.path.join(workdir, "mapping"))
+    env = {
+        **os.environ,
+        "PYTHONPATH": HERE + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "LLM_CASSETTE_MODE": mode,
+        "LLM_CASSETTE_PATH": os.path.abspath(args.cassette),
+        "LLM_CASSETTE_LATENCY_SCALE": str(args.latency_scale),
+        "EXTERNAL_API_BASE_URL": f"http://127.0.0.1:{backend_port}/api",
+        # Hedges and jittered retries would make the requests depend on timing
+        "LLM_HEDGING_ENABLED": "False",
+        "LLM_MAX_RETRIES": "0"
+    }
+    env.setdefault("OPENAI_API_KEY", "sk-replay")
+    backend = start_process([
+        sys.executable, "fake_banking_backend.py", "--port", str(backend_port), "--p50-ms", "0", "--seed", "1"
+    ], backend_port, "Fake banking backend", verbose=args.verbose)
+    servers = [backend]
+    try:
+        if mode == "record" and args.fake_openai:
+            openai_port = free_port()
+            servers.append(start_process([
+                sys.executable, "fake_openai_server.py", "--port", str(openai_port),
+                "--p50-ms", "0", "--slow-fraction", "0", "--seed", "1"
+            ], openai_port, "Fake OpenAI server", verbose=args.verbose))
+            env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{openai_port}/v1"
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "child", "--corpus", os.path.abspath(args.corpus),
+             "--workdir", workdir, "--endpoints", ",".join(args.endpoints), "--repeat", str(repeat)],
+            capture_output=True, text=True, env=env, cwd=workdir
+        )
+        if output.returncode != 0:
+            raise RuntimeError(f"Corpus run failed:\n{output.stderr[-2000:]}")
+        return json.loads(output.stdout.strip().splitlines()[-1])
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare_results(results: Dict[str, Any], golden: Dict[str, Any]) -> Dict[str, Any]:
+    mismatches = []
+    for key, expected in golden.items():
+        actual = results.get(key)
+        if actual is None:
+            mismatches.append({"request": key, "field": "missing"})
+            continue
+        for field in COMPARED_FIELDS:
+            if actual.get(field) != expected.get(field):
+                mismatches.append({"request": key, "field": field, "golden": expected.get(field), "actual": actual.get(field)})
+    failed = {mismatch["request"] for mismatch in mismatches}
+    return {
+        "requests": len(golden),
+        "matching": len(golden) - len(failed),
+        "accuracy": round((len(golden) - len(failed)) / len(golden), 4) if golden else 1.0,
+        "mismatches": mismatches
+    }
+
+
+def summarize_timings(timings: Dict[str, Dict[str, List[float]]]) -> Dict[str, Any]:
+    return {
+        endpoint: {
+            name: {
+                "p50": round(percentile(values, 0.50), 2),
+                "p95": round(percentile(values, 0.95), 2),
+                "p99": round(percentile(values, 0.99), 2),
+                "mean": round(sum(values) / len(values), 2) if values else 0.0
+            }
+            for name, values in series.items()
+        }
+        for endpoint, series in timings.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay a golden corpus of service requests')
+    parser.add_argument('command', choices=['corpus', 'record', 'replay', 'child'])
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='Golden corpus file')
+    parser.add_argument('--cassette', default=DEFAULT_CASSETTE, help='Cassette of recorded completions')
+    parser.add_argument('--golden', default=DEFAULT_GOLDEN, help='Golden results file')
+    parser.add_argument('--logs', nargs='*', default=[], help='Service logs or query files to add to the corpus')
+    parser.add_argument('--endpoints', default='process-text,process-smart-text', help='Comma-separated endpoints')
+    parser.add_argument('--latency-scale', type=float, default=0.0,
+                        help='Replay recorded latencies scaled by this factor (0 measures CPU overhead only)')
+    parser.add_argument('--repeat', type=int, default=3, help='Rounds over the corpus when replaying')
+    parser.add_argument('--fake-openai', action='store_true',
+                        help='Record completions from fake_openai_server.py instead of OpenAI')
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Print the replay report as JSON')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the fake backend')
+    args = parser.parse_args()
+    args.endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+
+    if args.command == "child":
+        run_child(args)
+        return
+
+    if args.command == "corpus":
+        corpus = build_corpus(args.logs)
+        with open(args.corpus, "w", encoding="utf-8") as f:
+            json.dump(corpus, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Wrote {len(corpus)} queries to {args.corpus}")
+        return
+
+    if args.command == "record":
+        if os.path.exists(args.cassette):
+            os.remove(args.cassette)
+        outcome = run_phase(args, "record", 1)
+        with open(args.golden, "w", encoding="utf-8") as f:
+            json.dump(outcome["results"], f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+        print(f"Recorded {outcome['cassette']['recorded']} completions to {args.cassette}")
+        print(f"Wrote {len(outcome['results'])} golden results to {args.golden}")
+        return
+
+    with open(args.golden, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    outcome = run_phase(args, "replay", args.repeat)
+    report = {
+        "latency_scale": args.latency_scale,
+        "repeat": args.repeat,
+        "cassette": outcome["cassette"],
+        "accuracy": compare_results(outcome["results"], golden),
+        "timings_ms": summarize_timings(outcome["timings"])
+    }
+    accuracy = report["accuracy"]
+    failed = bool(accuracy["mismatches"]) or bool(report["cassette"]["misses"])
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        sys.exit(1 if failed else 0)
+
+    print(f"\n==== GOLDEN REPLAY (latency x{args.latency_scale}, {args.repeat} rounds) ====\n")
+    print(f"Matching golden results: {accuracy['matching']}/{accuracy['requests']}, "
+          f"cassette misses: {report['cassette']['misses']}")
+    for mismatch in accuracy["mismatches"]:
+        print(f"  {mismatch['request']}: {mismatch['field']} {mismatch.get('golden')!r} -> {mismatch.get('actual')!r}")
+    print(f"\n{'Endpoint':<20} {'Metric':<8} {'p50':>8} {'p95':>8} {'p99':>8} {'mean':>8}")
+    for endpoint, series in report["timings_ms"].items():
+        for name, stats in series.items():
+            print(f"{endpoint:<20} {name:<8} {stats['p50']:>8} {stats['p95']:>8} {stats['p99']:>8} {stats['mean']:>8}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import asyncio
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Commands the local classifier resolves, so the first request does not depend on OpenAI
+FIRST_COMMAND = "show my account balance"
+SECOND_COMMAND = "show my cards"
+
+
+async def measure_requests(app) -> dict:
+    """Send the first requests through the ASGI app, as uvicorn would."""
+    import httpx
+
+    timings = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name, text in (("first_request_ms", FIRST_COMMAND), ("second_request_ms", SECOND_COMMAND)):
+            start_time = time.perf_counter()
+            response = await client.post("/process-text", json={"text": text, "user_id": "benchmark"})
+            timings[name] = (time.perf_counter() - start_time) * 1000
+            response.raise_for_status()
+    return timings
+
+
+def run_child():
+    """Measure one cold start in this process and print the timings as JSON."""
+    start_time = time.perf_counter()
+    import app
+    timings = {"import_ms": (time.perf_counter() - start_time) * 1000}
+    timings.update(asyncio.run(measure_requests(app.app)))
+    timings["built_at_import"] = len(app.container.built())
+    print(json.dumps(timings))
+
+
+def run_benchmark(runs: int) -> dict:
+    """Start the service in fresh interpreters and collect the cold start timings."""
+    env = dict(os.environ)
+    # The measured requests never reach OpenAI, but the client needs a key to be built
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"],
+            capture_output=True, text=True, env=env, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    summary = {}
+    for key in ("import_ms", "first_request_ms", "second_request_ms"):
+        values = [sample[key] for sample in samples]
+        summary[key] = {
+            "median": round(statistics.median(values), 1),
+            "min": round(min(values), 1),
+            "max": round(max(values), 1)
+        }
+    summary["runs"] = runs
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold start time of the banking NLP service')
+    parser.add_argument('--runs', type=int, default=5, help='Number of cold starts to measure')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    summary = run_benchmark(args.runs)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print("\n==== COLD START ({} runs) ====\n".format(summary["runs"]))
+    print(f"{'Phase':<20} {'Median ms':>10} {'Min ms':>10} {'Max ms':>10}")
+    for key in ("import_ms", "first_request_ms", "second_request_ms"):
+        stats = summary[key]
+        print(f"{key:<20} {stats['median']:>10} {stats['min']:>10} {stats['max']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,13 @@ class Settings(BaseSettings):
     # OpenAI Configuration
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    # Point the OpenAI client at another server (e.g. fake_openai_server.py for benchmarks)
+    openai_base_url: Optional[str] = os.getenv("OPENAI_BASE_URL") or None
+    
+    # Record completions to, or replay them from, a cassette ("off", "record" or "replay")
+    llm_cassette_mode: str = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+    llm_cassette_path: str = os.getenv("LLM_CASSETTE_PATH", "data/llm_cassette.jsonl.gz")
+    llm_cassette_latency_scale: float = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0"))
     
     # API Configuration
     api_prefix: str = "/api/v1"
@@ -20,6 +27,91 @@ class Settings(BaseSettings):
     # External API Configuration
     external_api_base_url: str = os.getenv("EXTERNAL_API_BASE_URL", "http://localhost:3000/api")
     
+    # Shared HTTP Client Configuration
+    http_max_connections: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    http_max_keepalive_connections: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    http_keepalive_expiry_seconds: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    http_connect_timeout_seconds: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+    http2_enabled: bool = os.getenv("HTTP2_ENABLED", "True").lower() == "true"
+    openai_timeout_seconds: float = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+    external_api_timeout_seconds: float = float(os.getenv("EXTERNAL_API_TIMEOUT_SECONDS", "10"))
+    
+    # LLM Gateway Configuration
+    request_deadline_seconds: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "20"))
+    llm_attempt_timeout_seconds: float = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "10"))
+    llm_min_attempt_seconds: float = float(os.getenv("LLM_MIN_ATTEMPT_SECONDS", "0.25"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    llm_retry_base_delay_ms: float = float(os.getenv("LLM_RETRY_BASE_DELAY_MS", "200"))
+    llm_retry_max_delay_ms: float = float(os.getenv("LLM_RETRY_MAX_DELAY_MS", "2000"))
+    llm_hedging_enabled: bool = os.getenv("LLM_HEDGING_ENABLED", "False").lower() == "true"
+    llm_hedge_delay_ms: float = float(os.getenv("LLM_HEDGE_DELAY_MS", "1500"))
+    llm_circuit_failure_threshold: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    llm_circuit_reset_seconds: float = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+    
+    # Adaptive LLM Concurrency Limiter Configuration
+    llm_limiter_enabled: bool = os.getenv("LLM_LIMITER_ENABLED", "True").lower() == "true"
+    llm_limiter_initial_limit: int = int(os.getenv("LLM_LIMITER_INITIAL_LIMIT", "20"))
+    llm_limiter_min_limit: int = int(os.getenv("LLM_LIMITER_MIN_LIMIT", "2"))
+    llm_limiter_max_limit: int = int(os.getenv("LLM_LIMITER_MAX_LIMIT", "200"))
+    llm_limiter_backoff_ratio: float = float(os.getenv("LLM_LIMITER_BACKOFF_RATIO", "0.7"))
+    llm_limiter_latency_tolerance: float = float(os.getenv("LLM_LIMITER_LATENCY_TOLERANCE", "2.0"))
+    llm_limiter_max_queue: int = int(os.getenv("LLM_LIMITER_MAX_QUEUE", "100"))
+    llm_limiter_queue_timeout_ms: float = float(os.getenv("LLM_LIMITER_QUEUE_TIMEOUT_MS", "2000"))
+    
+    # NLP Result Cache Configuration
+    nlp_cache_enabled: bool = os.getenv("NLP_CACHE_ENABLED", "True").lower() == "true"
+    nlp_cache_max_entries: int = int(os.getenv("NLP_CACHE_MAX_ENTRIES", "1024"))
+    nlp_cache_ttl_seconds: float = float(os.getenv("NLP_CACHE_TTL_SECONDS", "300"))
+    nlp_template_cache_enabled: bool = os.getenv("NLP_TEMPLATE_CACHE_ENABLED", "True").lower() == "true"
+    nlp_template_cache_max_entries: int = int(os.getenv("NLP_TEMPLATE_CACHE_MAX_ENTRIES", "512"))
+    nlp_template_cache_ttl_seconds: float = float(os.getenv("NLP_TEMPLATE_CACHE_TTL_SECONDS", "3600"))
+    
+    # Local Intent Classifier Configuration
+    local_classifier_enabled: bool = os.getenv("LOCAL_CLASSIFIER_ENABLED", "True").lower() == "true"
+    local_classifier_threshold: float = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+    
+    # Micro-batching Configuration
+    nlp_batching_enabled: bool = os.getenv("NLP_BATCHING_ENABLED", "False").lower() == "true"
+    nlp_batch_window_ms: float = float(os.getenv("NLP_BATCH_WINDOW_MS", "5"))
+    nlp_batch_max_size: int = int(os.getenv("NLP_BATCH_MAX_SIZE", "8"))
+    
+    # Conversation Context Store Configuration ("sqlite" or "files"; empty path: the back end's default)
+    context_store_backend: str = os.getenv("CONTEXT_STORE_BACKEND", "sqlite").lower()
+    context_store_path: str = os.getenv("CONTEXT_STORE_PATH", "")
+    context_cache_size: int = int(os.getenv("CONTEXT_CACHE_SIZE", "10000"))
+    # Contexts of the old single-file store, imported once into an empty store
+    context_legacy_file: str = os.getenv("CONTEXT_LEGACY_FILE", "data/conversation_context.json")
+    # Other processes (uvicorn workers) write the same store: revalidate cached contexts on every read
+    context_store_shared: bool = os.getenv("CONTEXT_STORE_SHARED", "True").lower() == "true"
+    # Queue context writes and flush them in batches instead of waiting for each one
+    context_write_behind: bool = os.getenv("CONTEXT_WRITE_BEHIND", "True").lower() == "true"
+    context_flush_interval_ms: float = float(os.getenv("CONTEXT_FLUSH_INTERVAL_MS", "200"))
+    context_flush_max_batch: int = int(os.getenv("CONTEXT_FLUSH_MAX_BATCH", "256"))
+    # Sessions of the old per-session files (data/contexts/<session_id>.json), imported with the file above
+    context_legacy_sessions_dir: str = os.getenv("CONTEXT_LEGACY_SESSIONS_DIR", "data/contexts")
+    
+    # Conversation History Configuration (turns quoted in smart-response prompts, within a token budget)
+    history_max_turns: int = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+    history_token_budget: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+    # Turns kept per session; older ones are folded into the session's summary
+    history_max_stored_turns: int = int(os.getenv("HISTORY_MAX_STORED_TURNS", "50"))
+    
+    # Context Compaction Configuration (expire contexts idle for the TTL, 0: never; cap stored history)
+    context_compaction_enabled: bool = os.getenv("CONTEXT_COMPACTION_ENABLED", "True").lower() == "true"
+    context_ttl_hours: float = float(os.getenv("CONTEXT_TTL_HOURS", "720"))
+    context_compaction_interval_seconds: float = float(os.getenv("CONTEXT_COMPACTION_INTERVAL_SECONDS", "3600"))
+    context_compaction_batch_size: int = int(os.getenv("CONTEXT_COMPACTION_BATCH_SIZE", "500"))
+    context_compaction_pause_ms: float = float(os.getenv("CONTEXT_COMPACTION_PAUSE_MS", "50"))
+    
+    # Analytics Period Configuration (empty timezone: the server's local time)
+    analytics_timezone: str = os.getenv("ANALYTICS_TIMEZONE", "")
+    fiscal_year_start_month: int = int(os.getenv("FISCAL_YEAR_START_MONTH", "4"))
+    
+    # NLP Pipeline Configuration ("combined" or "two_stage")
+    nlp_pipeline_mode: str = os.getenv("NLP_PIPELINE_MODE", "combined").lower()
+    # Stream the combined analysis so routing can start before the entities are complete
+    nlp_streaming_enabled: bool = os.getenv("NLP_STREAMING_ENABLED", "False").lower() == "true"
+    
     model_config = SettingsConfigDict(
         env_file=".env",
         case_sensitive=True,
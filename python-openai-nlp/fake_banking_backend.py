@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the banking backend at EXTERNAL_API_BASE_URL, for benchmarks and load tests.
+
+Every submodule endpoint in the mapping directory is served. Responses are sample
+documents generated from the submodule's JSON schema in service/src/dataFormats, so
+the service receives data of the shape it would get from the real backend, and every
+response is delayed by a LatencyProfile like the fake OpenAI server's. Point the
+service at it with EXTERNAL_API_BASE_URL=http://127.0.0.1:<port>/api.
+"""
+import asyncio
+import argparse
+import json
+import os
+import random
+import re
+from datetime import date
+from typing import Dict, Any, List, Optional, Tuple
+
+from fake_openai_server import LatencyProfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_FORMATS_DIR = os.path.join(HERE, "..", "service", "src", "dataFormats")
+
+# Sample values for string properties, by a word their name ends with
+STRING_SAMPLES = {
+    "id": "ID-0001",
+    "number": "XXXX-XXXX-1234",
+    "name": "John Smith",
+    "email": "john.smith@example.com",
+    "date": "2024-01-15",
+    "currency": "INR",
+    "status": "active",
+    "type": "SAV",
+    "code": "HDFC0001234",
+    "address": "12 Marine Drive, Mumbai",
+}
+
+
+def sample_value(schema: Any, name: str = "", array_items: int = 3, depth: int = 0,
+                 rng: Optional[random.Random] = None) -> Any:
+    """
+    A sample document for a JSON schema.
+
+    Defaults, then the first enum value, then a value guessed from the property name are
+    used. The dataFormats schemas are loose (some omit "type", some use "date"), so
+    anything with properties is treated as an object.
+    """
+    if not isinstance(schema, dict) or depth > 8:
+        return None
+    rng = rng or random.Random()
+    if "default" in schema:
+        return schema["default"]
+    if schema.get("enum"):
+        return schema["enum"][0]
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), None)
+    if schema_type == "object" or (schema_type is None and "properties" in schema):
+        return {
+            key.strip(): sample_value(value, key.strip(), array_items, depth + 1, rng)
+            for key, value in (schema.get("properties") or {}).items()
+        }
+    if schema_type == "array":
+        item = schema.get("items", {"type": "string"})
+        return [sample_value(item, name, array_items, depth + 1, rng) for _ in range(array_items)]
+    if schema_type in ("number", "integer"):
+        low = schema.get("minimum", 1)
+        high = schema.get("maximum", max(low, 1000))
+        value = rng.uniform(low, high)
+        return int(value) if schema_type == "integer" else round(value, 2)
+    if schema_type == "boolean":
+        return True
+    if schema_type == "date" or schema.get("format") in ("date", "date-time"):
+        return date.today().isoformat()
+    if schema.get("pattern") == "^[A-Z]{3}$":
+        return "INR"
+    lowered = name.lower()
+    for suffix, value in STRING_SAMPLES.items():
+        if lowered.endswith(suffix):
+            return value
+    return f"sample {name}" if name else "sample"
+
+
+class SchemaIndex:
+    """The JSON schemas of the dataFormats directory, by file name and module directory."""
+
+    def __init__(self, data_formats_dir: str = DEFAULT_DATA_FORMATS_DIR):
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        self.by_module: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        for root, _, files in os.walk(data_formats_dir):
+            module_dir = os.path.basename(root).upper()
+            for file_name in sorted(files):
+                if not file_name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(root, file_name), "r", encoding="utf-8") as f:
+                        schema = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                self.by_name[file_name.lower()] = schema
+                self.by_module.setdefault(module_dir, []).append((file_name.lower(), schema))
+
+    def for_submodule(self, module_code: str, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        The schema of a submodule: its requestFile, found by file name because the mapping
+        paths do not always match the directory names, or else the file of its module
+        whose name contains a word of the submoduleCode (ACC_BALANCE -> *balance*).
+        """
+        request_file = entry.get("requestFile")
+        if request_file:
+            schema = self.by_name.get(os.path.basename(request_file).lower())
+            if schema is not None:
+                return schema
+        words = [w for w in entry["submoduleCode"].lower().split("_")[1:] if len(w) > 2]
+        for file_name, schema in self.by_module.get(module_code.upper(), []):
+            if any(word in file_name for word in words):
+                return schema
+        return None
+
+
+class BackendRoutes:
+    """
+    Matches request paths against the submodule endpoints of the mappings.
+
+    Paths are matched the way SmartTextService builds them: the endpoint, or
+    /<module>/<submodule> when there is none, under the base path, with ":param"
+    segments matching any value and left out when the parameter is missing.
+    """
+
+    def __init__(self, mapping_dir: str, schemas: SchemaIndex, array_items: int = 3):
+        from services.mapping_registry import MappingRegistry
+
+        registry = MappingRegistry(mapping_dir)
+        self.array_items = array_items
+        self.routes: List[Tuple[re.Pattern, str, Optional[Dict[str, Any]]]] = []
+        literals: Dict[str, int] = {}
+        for module_code, module_data in registry.module_mappings.items():
+            for entry in module_data["submodules"]:
+                if not isinstance(entry, dict) or "submoduleCode" not in entry:
+                    continue
+                endpoint = entry.get("endpoint") or f"/{module_code.lower()}/{entry['submoduleCode'].lower()}"
+                schema = schemas.for_submodule(module_code, entry)
+                self.routes.append((self._pattern(endpoint), entry["submoduleCode"], schema))
+                literals[entry["submoduleCode"]] = sum(
+                    1 for part in endpoint.split("/") if part and not part.startswith(":")
+                )
+        # The most specific endpoint wins, then one with a schema over one without
+        self.routes.sort(key=lambda route: (-literals[route[1]], route[2] is None))
+        self.analytics_schema = schemas.by_name.get("transaction-analytics-request.json")
+
+    @staticmethod
+    def _pattern(endpoint: str) -> re.Pattern:
+        parts = []
+        for part in endpoint.strip("/").split("/"):
+            if part.startswith(":"):
+                parts.append("(?:/[^/]+)?")
+            elif part:
+                parts.append("/" + re.escape(part))
+        # Any base path (e.g. /api) may come before the endpoint
+        return re.compile("(?:/[^/]+)*?" + "".join(parts) + "/?$")
+
+    def match(self, path: str) -> Tuple[str, Any]:
+        """
+        The submoduleCode served at a path and a sample response for it.
+
+        Samples are seeded by the path, so the same request always gets the same response.
+        """
+        rng = random.Random(path)
+        for pattern, submodule_code, schema in self.routes:
+            if pattern.fullmatch(path):
+                data = sample_value(schema, array_items=self.array_items, rng=rng) if schema else {}
+                return submodule_code, data
+        if re.fullmatch(r"(?:/[^/]+)*/analytics/[^/]+", path):
+            # AnalyticsService reads and then drops the "data" field
+            data = sample_value(self.analytics_schema, array_items=self.array_items, rng=rng) or {}
+            return "ANALYTICS", {**data, "data": [data] * self.array_items}
+        return "", None
+
+
+def create_app(profile: Optional[LatencyProfile] = None, mapping_dir: str = "mapping",
+               data_formats_dir: str = DEFAULT_DATA_FORMATS_DIR, array_items: int = 3):
+    """Build the fake banking backend application."""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    profile = profile or LatencyProfile(p50_ms=20, slow_fraction=0.0)
+    routes = BackendRoutes(mapping_dir, SchemaIndex(data_formats_dir), array_items)
+    counters = {"requests": 0, "errors": 0, "not_found": 0, "in_flight": 0, "max_in_flight": 0}
+    by_submodule: Dict[str, int] = {}
+    app = FastAPI(title="Fake Banking Backend")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", **counters, "by_submodule": by_submodule}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def serve(path: str, request: Request):
+        counters["requests"] += 1
+        counters["in_flight"] += 1
+        counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+        try:
+            await asyncio.sleep(profile.sample_seconds(counters["in_flight"]))
+            if random.random() < profile.error_rate:
+                counters["errors"] += 1
+                return JSONResponse(status_code=500, content={"error": "Injected backend error"})
+            submodule_code, data = routes.match("/" + path)
+            if data is None:
+                counters["not_found"] += 1
+                return JSONResponse(status_code=404, content={"error": f"No endpoint for /{path}"})
+            by_submodule[submodule_code] = by_submodule.get(submodule_code, 0) + 1
+            return data
+        finally:
+            counters["in_flight"] -= 1
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake banking backend generated from the dataFormats schemas')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=3001, help='Port to listen on')
+    parser.add_argument('--p50-ms', type=float, default=20, help='Median response time')
+    parser.add_argument('--slow-fraction', type=float, default=0.0, help='Share of responses in the slow tail')
+    parser.add_argument('--slow-ms', type=float, default=500, help='Minimum response time of the slow tail')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    parser.add_argument('--array-items', type=int, default=3, help='Items in every generated array')
+    parser.add_argument('--data-formats', default=DEFAULT_DATA_FORMATS_DIR, help='Directory of the JSON schemas')
+    parser.add_argument('--seed', type=int, default=None, help='Seed the latency model for repeatable runs')
+    args = parser.parse_args()
+
+    import uvicorn
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    profile = LatencyProfile(
+        p50_ms=args.p50_ms,
+        slow_fraction=args.slow_fraction,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate
+    )
+    app = create_app(profile, data_formats_dir=args.data_formats, array_items=args.array_items)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the OpenAI chat completions API, for benchmarks and load tests.
+
+Answers are built with the local intent classifier from the mapping directory, so the
+service gets plausible routes back, unless a file of canned answers overrides them for
+some commands, and every response is delayed by a configurable
+latency model with a slow tail, an error rate and, optionally, a capacity beyond which
+requests are rate limited. Point the service at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+import asyncio
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+# Prompt phrasings used by NLPService, from the most to the least specific
+BATCH_PATTERN = re.compile(r"from each of these \d+ banking commands:\n(?P<commands>.*?)\n\n", re.S)
+ROUTER_PATTERN = re.compile(r"Identify the module, sub_module and flow of this banking command: (?P<text>.*?)\n\n", re.S)
+ENTITY_PATTERN = re.compile(r"Extract the entities from this banking command for submodule \S*: (?P<text>.*?)\n\n", re.S)
+COMBINED_PATTERN = re.compile(r"from this banking command: (?P<text>.*?)\n\n", re.S)
+
+PLAIN_TEXT_REPLY = "Here is the information you asked for. Let me know if you need anything else."
+
+
+class LatencyProfile:
+    """
+    Response times of the fake server.
+
+    Most responses take around p50_ms (log-normally spread); a slow_fraction of them
+    take slow_ms to twice that instead, which is the tail hedging is meant to cut.
+
+    With a capacity, responses slow down in proportion to the requests in flight beyond
+    half of it, and requests beyond it are answered with a 429 and a Retry-After.
+    """
+
+    def __init__(self, p50_ms: float = 300, slow_fraction: float = 0.05, slow_ms: float = 3000,
+                 error_rate: float = 0.0, stream_chunk_ms: float = 5, capacity: int = 0,
+                 retry_after_ms: float = 500):
+        self.p50_ms = p50_ms
+        self.slow_fraction = slow_fraction
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.stream_chunk_ms = stream_chunk_ms
+        self.capacity = capacity
+        self.retry_after_ms = retry_after_ms
+
+    def sample_seconds(self, in_flight: int = 1) -> float:
+        if random.random() < self.slow_fraction:
+            seconds = self.slow_ms * (1 + random.random()) / 1000.0
+        else:
+            seconds = self.p50_ms * random.lognormvariate(0, 0.25) / 1000.0
+        if self.capacity:
+            seconds *= max(1.0, in_flight / (self.capacity / 2))
+        return seconds
+
+
+class FakeCompletions:
+    """
+    Builds completion contents for the prompts the service sends.
+
+    Canned answers map a command (compared case-insensitively) to the analysis result
+    returned for it, and "*" to the reply of prompts that are not analyses.
+    """
+
+    def __init__(self, mapping_dir: str = "mapping", canned: Optional[Dict[str, Any]] = None):
+        from services.mapping_registry import MappingRegistry
+        from services.intent_classifier import LocalIntentClassifier
+
+        registry = MappingRegistry(mapping_dir)
+        self.classifier = LocalIntentClassifier(registry.module_mappings, registry.module_properties)
+        self.canned = {key.strip().lower(): value for key, value in (canned or {}).items()}
+        first_module = next(iter(registry.module_mappings.values()))
+        first_submodule = next(
+            (entry for entry in first_module["submodules"] if isinstance(entry, dict) and "submoduleCode" in entry),
+            {"submoduleCode": ""}
+        )
+        self.default_route = {
+            "module": first_module["moduleCode"],
+            "sub_module": {"submoduleCode": first_submodule["submoduleCode"]},
+            "flow": "QUERY"
+        }
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """A combined analysis result for one command."""
+        canned = self.canned.get(text.strip().lower())
+        if canned is not None:
+            return {"entities": {}, **canned}
+        match = self.classifier.classify(text, strict=False)
+        if match is None:
+            return {**self.default_route, "entities": {}}
+        return {
+            "module": match.module_code,
+            "sub_module": {"submoduleCode": match.submodule_code},
+            "entities": match.entities,
+            "flow": match.flow
+        }
+
+    def content_for(self, messages: List[Dict[str, Any]], json_mode: bool) -> str:
+        prompt = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        prompt = prompt if prompt.endswith("\n\n") else prompt + "\n\n"
+
+        batch = BATCH_PATTERN.search(prompt)
+        if batch:
+            commands = [re.sub(r"^\d+\.\s*", "", line) for line in batch.group("commands").splitlines() if line.strip()]
+            return json.dumps({"results": [self.analyze(command) for command in commands]})
+        router = ROUTER_PATTERN.search(prompt)
+        if router:
+            result = self.analyze(router.group("text"))
+            result.pop("entities")
+            return json.dumps(result)
+        entity = ENTITY_PATTERN.search(prompt)
+        if entity:
+            return json.dumps({"entities": self.analyze(entity.group("text"))["entities"]})
+        combined = COMBINED_PATTERN.search(prompt)
+        if combined:
+            return json.dumps(self.analyze(combined.group("text")))
+        if json_mode:
+            return "{}"
+        return self.canned.get("*", PLAIN_TEXT_REPLY)
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly four characters per token, which is close enough for load tests."""
+    return max(1, len(text) // 4)
+
+
+def create_app(profile: Optional[LatencyProfile] = None, mapping_dir: str = "mapping",
+               canned: Optional[Dict[str, Any]] = None):
+    """Build the fake OpenAI application."""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    profile = profile or LatencyProfile()
+    completions = FakeCompletions(mapping_dir, canned)
+    counters = {"requests": 0, "errors": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0}
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", **counters}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        counters["in_flight"] += 1
+        counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+        try:
+            if profile.capacity and counters["in_flight"] > profile.capacity:
+                counters["rate_limited"] += 1
+                return JSONResponse(
+                    status_code=429,
+                    content={"error": {"message": "Rate limit reached", "type": "requests"}},
+                    headers={"retry-after-ms": str(int(profile.retry_after_ms))}
+                )
+            await asyncio.sleep(profile.sample_seconds(counters["in_flight"]))
+            if random.random() < profile.error_rate:
+                counters["errors"] += 1
+                return JSONResponse(
+                    status_code=500,
+                    content={"error": {"message": "Injected upstream error", "type": "server_error"}}
+                )
+
+            messages = body.get("messages", [])
+            json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+            content = completions.content_for(messages, json_mode)
+            model = body.get("model", "gpt-3.5-turbo")
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            created = int(time.time())
+            prompt_tokens = estimate_tokens("".join(str(m.get("content") or "") for m in messages))
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": estimate_tokens(content),
+                "total_tokens": prompt_tokens + estimate_tokens(content)
+            }
+
+            if body.get("stream"):
+                include_usage = (body.get("stream_options") or {}).get("include_usage")
+                return StreamingResponse(
+                    stream_chunks(completion_id, created, model, content, profile.stream_chunk_ms,
+                                  usage if include_usage else None),
+                    media_type="text/event-stream"
+                )
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+        finally:
+            counters["in_flight"] -= 1
+
+    return app
+
+
+async def stream_chunks(completion_id: str, created: int, model: str, content: str, chunk_ms: float,
+                        usage: Optional[Dict[str, int]] = None):
+    """Send the content as server-sent chat.completion.chunk events."""
+    def event(delta: Optional[Dict[str, Any]], finish_reason: Optional[str] = None,
+              chunk_usage: Optional[Dict[str, int]] = None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        if chunk_usage is not None:
+            chunk["usage"] = chunk_usage
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    yield event({"role": "assistant", "content": ""})
+    for start in range(0, len(content), 8):
+        await asyncio.sleep(chunk_ms / 1000.0)
+        yield event({"content": content[start:start + 8]})
+    yield event({}, "stop")
+    if usage is not None:
+        # Requested with stream_options.include_usage: a last chunk without choices
+        yield event(None, chunk_usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake OpenAI chat completions server')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8089, help='Port to listen on')
+    parser.add_argument('--p50-ms', type=float, default=300, help='Median response time')
+    parser.add_argument('--slow-fraction', type=float, default=0.05, help='Share of responses in the slow tail')
+    parser.add_argument('--slow-ms', type=float, default=3000, help='Minimum response time of the slow tail')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    parser.add_argument('--capacity', type=int, default=0, help='Concurrent requests before 429s (0 = unlimited)')
+    parser.add_argument('--retry-after-ms', type=float, default=500, help='Retry-After sent with 429s')
+    parser.add_argument('--seed', type=int, default=None, help='Seed the latency model for repeatable runs')
+    parser.add_argument('--canned', default=None, help='JSON file of canned answers by command')
+    args = parser.parse_args()
+
+    import uvicorn
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    profile = LatencyProfile(
+        p50_ms=args.p50_ms,
+        slow_fraction=args.slow_fraction,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate,
+        capacity=args.capacity,
+        retry_after_ms=args.retry_after_ms
+    )
+    canned = None
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as f:
+            canned = json.load(f)
+    uvicorn.run(create_app(profile, canned=canned), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
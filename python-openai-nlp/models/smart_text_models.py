@@ -1,11 +1,17 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Dict, Any, List, Literal
 
+# Module and SubModule instances are built once by the mapping registry and shared
+# across requests, so they are immutable
 class Module(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     moduleCode: str
     moduleName: str
 
 class SubModule(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     submoduleCode: str
     submoduleName: str
     endpoint: Optional[str] = None
@@ -47,4 +53,6 @@ class SmartTextResponse(BaseModel):
     resolution: Optional[ResolutionResult] = None
     raw_text: str
     smart_response: Optional[SmartResponseContent] = None
+    # How the command was resolved (source: local, llm, cache, template_cache) and its confidence
+    metadata: Optional[Dict[str, Any]] = None
     error: Optional[str] = None 
\ No newline at end of file
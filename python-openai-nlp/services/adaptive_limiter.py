@@ -0,0 +1,205 @@
+from typing import Dict, Any, Optional
+from collections import deque
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# Outcomes reported when a slot is released
+SUCCESS = "success"
+DROPPED = "dropped"
+IGNORED = "ignored"
+
+# Moving average weights of the recent and the long-run latency
+RECENT_LATENCY_WEIGHT = 0.1
+BASELINE_LATENCY_WEIGHT = 0.01
+
+
+class OverloadedError(Exception):
+    """The upstream is saturated and the request was shed instead of queued."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for upstream calls.
+
+    Every successful call grows the limit by 1/limit, i.e. by about one per round of
+    calls, as long as the recent latency (a fast moving average) stays within
+    latency_tolerance times the long-run latency (a slow one). A rate limit, a 5xx, a
+    timeout or recent latency above that tolerance cuts the limit by backoff_ratio, at
+    most once per long-run latency so that one burst of failures counts once. A
+    Retry-After from the upstream pauses all calls until it has passed.
+
+    Calls beyond the limit wait in a bounded FIFO queue for at most queue_timeout seconds.
+    When the queue is full or the wait runs out, the call is shed with OverloadedError
+    rather than left to pile up.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 2,
+        max_limit: int = 200,
+        backoff_ratio: float = 0.7,
+        latency_tolerance: float = 2.0,
+        max_queue: int = 100,
+        queue_timeout: float = 2.0
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._recent_latency: Optional[float] = None
+        self._baseline_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self._resume_handle: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.decreases = 0
+        self.rate_limited = 0
+
+    async def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Wait for a slot.
+
+        Args:
+            timeout: Longest wait the caller can afford; the wait is also capped at queue_timeout
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            OverloadedError: If the queue is full or no slot freed up in time
+        """
+        if not self._waiters and self._has_capacity():
+            self._admit()
+            return 0.0
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise OverloadedError("LLM request queue is full", retry_after=self.retry_after())
+
+        wait = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=max(0.0, wait))
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the wait ran out
+                return time.monotonic() - started
+            waiter.cancel()
+            self.shed += 1
+            raise OverloadedError("No LLM capacity freed up in time", retry_after=self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over; give it back
+                self.release(IGNORED)
+            waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return time.monotonic() - started
+
+    def release(self, outcome: str = IGNORED, latency: Optional[float] = None) -> None:
+        """
+        Return a slot and adjust the limit.
+
+        Args:
+            outcome: SUCCESS, DROPPED (rate limit, 5xx, timeout) or IGNORED (no signal)
+            latency: Seconds the upstream took, for SUCCESS
+        """
+        self.in_flight -= 1
+        if outcome == SUCCESS and latency is not None:
+            self._track_latency(latency)
+            if self._recent_latency > self.latency_tolerance * self._baseline_latency:
+                self._decrease(f"latency {self._recent_latency * 1000:.0f} ms")
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        elif outcome == DROPPED:
+            self._decrease("upstream error")
+        self._wake()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every call back for the given Retry-After."""
+        if seconds <= 0:
+            return
+        self.rate_limited += 1
+        until = time.monotonic() + seconds
+        if until <= self._paused_until:
+            return
+        self._paused_until = until
+        logger.warning(f"LLM rate limited, pausing calls for {seconds:.2f}s")
+        if self._resume_handle is not None:
+            self._resume_handle.cancel()
+        self._resume_handle = asyncio.get_running_loop().call_later(seconds, self._wake)
+
+    def retry_after(self) -> float:
+        """Seconds a shed client should wait before trying again."""
+        return max(1.0, math.ceil(self._paused_until - time.monotonic()))
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit) and time.monotonic() >= self._paused_until
+
+    def _admit(self) -> None:
+        self.in_flight += 1
+        self.admitted += 1
+
+    def _wake(self) -> None:
+        """Hand free slots to the longest waiting calls."""
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._admit()
+            waiter.set_result(None)
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < (self._baseline_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        logger.info(f"LLM concurrency limit lowered to {int(self.limit)} ({reason})")
+
+    def _track_latency(self, latency: float) -> None:
+        """Update the recent and long-run moving averages of the latency."""
+        if self._baseline_latency is None:
+            self._recent_latency = self._baseline_latency = latency
+            return
+        # A single slow outlier moves the recent average too little to count as overload
+        self._recent_latency += RECENT_LATENCY_WEIGHT * (latency - self._recent_latency)
+        self._baseline_latency += BASELINE_LATENCY_WEIGHT * (latency - self._baseline_latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current limit, queue depth and shed counts."""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "decreases": self.decreases,
+            "rate_limited": self.rate_limited,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            "recent_latency_ms": round(self._recent_latency * 1000, 1) if self._recent_latency else None,
+            "baseline_latency_ms": round(self._baseline_latency * 1000, 1) if self._baseline_latency else None
+        }
@@ -0,0 +1,177 @@
+from typing import Dict, Any, Optional
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+import re
+
+# ISO 4217 code, minor units and the symbols and words written for each currency.
+# "¥" is read as yen; yuan is only recognized by name.
+CURRENCIES = {
+    "INR": (2, ("₹", "rs", "rs.", "inr", "rupee", "rupees")),
+    "USD": (2, ("$", "us$", "usd", "dollar", "dollars", "buck", "bucks")),
+    "EUR": (2, ("€", "eur", "euro", "euros")),
+    "GBP": (2, ("£", "gbp", "pound", "pounds", "quid", "sterling")),
+    "JPY": (0, ("¥", "jpy", "yen")),
+    "CNY": (2, ("cny", "rmb", "yuan", "renminbi")),
+    "AED": (2, ("aed", "dirham", "dirhams")),
+    "SGD": (2, ("s$", "sgd")),
+    "AUD": (2, ("a$", "aud")),
+    "CAD": (2, ("c$", "cad")),
+    "CHF": (2, ("chf", "franc", "francs")),
+    "KWD": (3, ("kwd", "dinar", "dinars"))
+}
+
+# Scale words and suffixes: "5k", "1.5 lakh", "2 crore", "3m", "1bn"
+MULTIPLIERS = {
+    "k": 1000, "thousand": 1000,
+    "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000,
+    "crore": 10000000, "crores": 10000000, "cr": 10000000,
+    "m": 1000000, "mn": 1000000, "million": 1000000,
+    "b": 1000000000, "bn": 1000000000, "billion": 1000000000
+}
+
+# One-letter scales are ambiguous apart from a number ("send 2 m to Ravi"), so they
+# only count written right after it
+ATTACHED_SCALES = {"k", "m", "b"}
+
+CURRENCY_TOKENS = {token: code for code, (_, tokens) in CURRENCIES.items() for token in tokens}
+MINOR_UNITS = {code: minor for code, (minor, _) in CURRENCIES.items()}
+
+
+def _alternatives(tokens, after_number: bool = False, attached=()) -> str:
+    """
+    Longest first, with word boundaries only where a token starts or ends with a letter.
+    Tokens written right after a number ("5k", "100usd") need no boundary before them,
+    and attached tokens must follow a digit with no space in between.
+    """
+    patterns = []
+    for token in sorted(tokens, key=len, reverse=True):
+        pattern = re.escape(token)
+        if token in attached:
+            pattern = r"(?<=\d)" + pattern
+        elif token[0].isalnum() and not after_number:
+            pattern = r"\b" + pattern
+        if token[-1].isalnum():
+            pattern += r"\b"
+        patterns.append(pattern)
+    return "|".join(patterns)
+
+
+_CURRENCY = _alternatives(CURRENCY_TOKENS)
+
+# An amount with an optional currency before it, scale after it and currency after that
+AMOUNT_PATTERN = re.compile(
+    rf"(?:(?P<before>{_CURRENCY})\s*|(?<![\w.]))"
+    r"(?P<number>\d[\d,]*(?:\.\d+)?)"
+    rf"(?:\s*(?P<scale>{_alternatives(MULTIPLIERS, after_number=True, attached=ATTACHED_SCALES)}))?"
+    rf"(?:\s*(?P<after>{_alternatives(CURRENCY_TOKENS, after_number=True)}))?",
+    re.IGNORECASE
+)
+
+
+class Amount:
+    """An amount read from text: its value, currency (or None) and how it was written."""
+
+    def __init__(self, value: Decimal, currency: Optional[str], number: Decimal, scaled: bool):
+        self.value = value
+        self.currency = currency
+        self.number = number
+        self.scaled = scaled
+
+
+def currency_code(token: Any) -> Optional[str]:
+    """The ISO 4217 code for a currency code, symbol or word, or None."""
+    if not isinstance(token, str):
+        return None
+    token = token.strip().lower()
+    if token.upper() in MINOR_UNITS:
+        return token.upper()
+    return CURRENCY_TOKENS.get(token)
+
+
+def _amount(match: "re.Match") -> Optional[Amount]:
+    try:
+        number = Decimal(match.group("number").replace(",", ""))
+    except InvalidOperation:
+        return None
+    scale = match.group("scale")
+    value = number * MULTIPLIERS[scale.lower()] if scale else number
+    token = match.group("before") or match.group("after")
+    return Amount(value, CURRENCY_TOKENS.get(token.lower()) if token else None, number, bool(scale))
+
+
+@lru_cache(maxsize=1024)
+def find_amount(text: str) -> Optional[Amount]:
+    """
+    The transfer amount written in a text, or None.
+
+    One pass over the text: an amount written with a currency is preferred over one
+    with only a scale ("5k"), which is preferred over a bare number, so account numbers
+    and dates lose to "Rs. 2500". The first of equals wins.
+    """
+    best, best_score = None, -1
+    for match in AMOUNT_PATTERN.finditer(text):
+        score = (2 if match.group("before") or match.group("after") else 0) + (1 if match.group("scale") else 0)
+        if score > best_score:
+            best, best_score = match, score
+            if score == 3:
+                break
+    return _amount(best) if best is not None else None
+
+
+def parse_amount(value: Any) -> Optional[Amount]:
+    """Parse an amount entity, a number or a string like "₹1.5 lakh" or "5k"."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        try:
+            number = Decimal(str(value))
+        except InvalidOperation:
+            return None
+        return Amount(number, None, number, False)
+    return find_amount(str(value))
+
+
+def canonical_amount(value: Decimal, currency: Optional[str]) -> Optional[Decimal]:
+    """
+    The amount rounded to the minor units of its currency, or without trailing zeros.
+    None for amounts that are not finite or have more digits than the decimal context holds.
+    """
+    if not value.is_finite():
+        return None
+    try:
+        if currency in MINOR_UNITS:
+            return value.quantize(Decimal(1).scaleb(-MINOR_UNITS[currency]))
+        if value == value.to_integral_value():
+            return value.quantize(Decimal(1))
+        return value.normalize()
+    except InvalidOperation:
+        return None
+
+
+def normalize_transfer_entities(text: str, entities: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Set canonical "amount" (Decimal) and "currency" (ISO 4217) entities for a transfer.
+
+    The model's entities win, once canonicalized: "rupees" becomes INR and "1,50,000"
+    becomes 150000.00. What the model left out is taken from the text. When the text
+    scales the number the model returned ("1.5 lakh" read as 1.5), the scaled value is
+    used. Values that cannot be parsed are left as they are.
+    """
+    written = find_amount(text)
+
+    currency = currency_code(entities.get("currency"))
+    if currency is None and written is not None:
+        # Only a currency written next to the amount: "cad" in "300 for the cad drawing" is not one
+        currency = written.currency
+    if currency is not None:
+        entities["currency"] = currency
+
+    amount = parse_amount(entities["amount"]) if "amount" in entities else written
+    if amount is not None:
+        value = amount.value
+        if written is not None and written.scaled and not amount.scaled and amount.value == written.number:
+            value = written.value
+        canonical = canonical_amount(value, currency)
+        if canonical is not None:
+            entities["amount"] = canonical
+    return entities
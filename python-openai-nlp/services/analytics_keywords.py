@@ -0,0 +1,261 @@
+from typing import Dict, Any, FrozenSet, Iterable, Optional
+from functools import lru_cache
+import re
+import string
+
+# Analytics type of each analytics submodule
+SUBMODULE_ANALYTICS = {
+    "ANALYTICS_TRANSACTIONS": "transaction_analysis",
+    "ANALYTICS_SPENDING": "spending_trends",
+    "ANALYTICS_INCOME": "income_analysis",
+    "ANALYTICS_BUDGET": "budget_tracking",
+    "ANALYTICS_INVESTMENT": "investment_performance"
+}
+
+# Default visualization of each analytics submodule
+SUBMODULE_VISUALIZATION = {
+    "ANALYTICS_TRANSACTIONS": "table",
+    "ANALYTICS_SPENDING": "bar_chart",
+    "ANALYTICS_INCOME": "line_chart",
+    "ANALYTICS_BUDGET": "pie_chart",
+    "ANALYTICS_INVESTMENT": "area_chart"
+}
+
+# Words that make any request a comparison or a distribution, before the submodule is considered
+COMPARISON_WORDS = ("compare", "comparison", "versus", "vs")
+DISTRIBUTION_WORDS = ("distribution", "breakdown", "split", "allocation")
+
+# Keyword tables, checked in order; the first keyword found in the text wins
+ANALYTICS_KEYWORDS = (
+    ("spend", "spending_trends"),
+    ("spending", "spending_trends"),
+    ("expense", "spending_trends"),
+    ("expenses", "spending_trends"),
+    ("income", "income_analysis"),
+    ("earning", "income_analysis"),
+    ("salary", "income_analysis"),
+    ("budget", "budget_tracking"),
+    ("investment", "investment_performance"),
+    ("portfolio", "investment_performance"),
+    ("trend", "trending_analysis"),
+    ("compare", "comparison_analysis"),
+    ("comparison", "comparison_analysis"),
+    ("distribution", "distribution_analysis"),
+    ("transaction", "transaction_analysis"),
+    ("activity", "transaction_analysis")
+)
+
+# Named charts come before the bare "chart" and "graph" they contain
+VISUALIZATION_KEYWORDS = (
+    ("table", "table"),
+    ("list", "table"),
+    ("bar chart", "bar_chart"),
+    ("bar graph", "bar_chart"),
+    ("line chart", "line_chart"),
+    ("line graph", "line_chart"),
+    ("pie chart", "pie_chart"),
+    ("chart", "bar_chart"),
+    ("graph", "line_chart"),
+    ("pie", "pie_chart"),
+    ("distribution", "pie_chart"),
+    ("breakdown", "pie_chart"),
+    ("trend", "line_chart"),
+    ("trends", "line_chart"),
+    ("compare", "bar_chart"),
+    ("comparison", "bar_chart"),
+    ("time series", "line_chart"),
+    ("timeline", "line_chart"),
+    ("over time", "line_chart")
+)
+
+DISTRIBUTION_KEYWORDS = (
+    ("category", "category"),
+    ("categories", "category"),
+    ("spending category", "category"),
+    ("expense category", "category"),
+    ("amount range", "amount_range"),
+    ("price range", "amount_range"),
+    ("value range", "amount_range"),
+    ("transaction size", "amount_range"),
+    ("time of day", "time_of_day"),
+    ("hour of day", "time_of_day"),
+    ("day time", "time_of_day"),
+    ("day of week", "day_of_week"),
+    ("weekday", "day_of_week"),
+    ("weekdays", "day_of_week"),
+    ("week day", "day_of_week"),
+    ("transaction type", "transaction_type"),
+    ("payment method", "payment_method"),
+    ("payment type", "payment_method"),
+    ("merchant", "merchant"),
+    ("vendor", "merchant"),
+    ("shop", "merchant"),
+    ("store", "merchant"),
+    ("location", "location"),
+    ("region", "location"),
+    ("place", "location"),
+    ("month", "month"),
+    ("monthly", "month"),
+    ("by month", "month")
+)
+
+# Requests for a pie chart or a distribution get a distribution type
+DISTRIBUTION_REQUEST_WORDS = ("pie", "distribution", "breakdown")
+# Spending words that make a distribution request one by category
+CATEGORY_HINT_WORDS = ("spend", "expense", "payment", "transaction")
+
+# Visualization for an analytics type when the text does not ask for one
+ANALYTICS_VISUALIZATION = {
+    "spending_trends": "line_chart",
+    "income_analysis": "line_chart",
+    "budget_tracking": "pie_chart",
+    "transaction_analysis": "table",
+    "distribution_analysis": "pie_chart",
+    "comparison_analysis": "bar_chart",
+    "trending_analysis": "line_chart"
+}
+
+# Inflections a keyword may carry and still match ("transactions", "spending", "compared")
+INFLECTIONS = ("", "s", "es", "d", "ed", "ing")
+
+# Punctuation separates words like whitespace does
+PUNCTUATION_TO_SPACE = str.maketrans({character: " " for character in string.punctuation})
+
+
+def _inflected_pattern(keyword: str) -> str:
+    words = [re.escape(word) for word in keyword.split()]
+    return r"\b" + r"\s+".join(words) + f"(?:{'|'.join(INFLECTIONS[1:])})?" + r"\b"
+
+
+class KeywordMatcher:
+    """
+    Finds whole-word keywords and phrases in a text in one pass over its words.
+
+    Every keyword and phrase is compiled into a table of its spellings, with an optional
+    plural or verb inflection on the last word, so "vs" never matches inside other words
+    and a text costs one tokenization plus a few dict lookups per word. At each word the
+    longest phrase wins, and a match also reports the keywords it contains, so "expenses"
+    reports "expense" and "spending category" reports "spending", "spend" and "category".
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        keywords = sorted(set(keywords), key=len, reverse=True)
+        patterns = {keyword: re.compile(_inflected_pattern(keyword)) for keyword in keywords}
+        self.forms: Dict[str, FrozenSet[str]] = {}
+        for keyword in keywords:
+            for inflection in INFLECTIONS:
+                form = keyword + inflection
+                self.forms.setdefault(form, frozenset(
+                    other for other, pattern in patterns.items() if pattern.search(form)
+                ))
+        # Longest phrase starting with each word; most words start none and cost one lookup
+        self.starts: Dict[str, int] = {}
+        for form in self.forms:
+            first, length = form.split()[0], len(form.split())
+            self.starts[first] = max(self.starts.get(first, 0), length)
+
+    def find(self, text: str) -> FrozenSet[str]:
+        """The keywords found in the text."""
+        words = text.lower().translate(PUNCTUATION_TO_SPACE).split()
+        forms, starts = self.forms, self.starts
+        found = set()
+        covered = 0
+        for i in [i for i, word in enumerate(words) if word in starts]:
+            if i < covered:
+                continue
+            for length in range(min(starts[words[i]], len(words) - i), 0, -1):
+                implied = forms.get(" ".join(words[i:i + length]) if length > 1 else words[i])
+                if implied is not None:
+                    found.update(implied)
+                    covered = i + length
+                    break
+        return frozenset(found)
+
+
+MATCHER = KeywordMatcher(
+    [keyword for keyword, _ in ANALYTICS_KEYWORDS + VISUALIZATION_KEYWORDS + DISTRIBUTION_KEYWORDS]
+    + list(COMPARISON_WORDS + DISTRIBUTION_WORDS + DISTRIBUTION_REQUEST_WORDS + CATEGORY_HINT_WORDS)
+)
+
+
+@lru_cache(maxsize=4096)
+def scan(text: str) -> FrozenSet[str]:
+    """The analytics keywords of a text, scanned once per distinct text."""
+    return MATCHER.find(text)
+
+
+def _first(table, found: FrozenSet[str]) -> Optional[str]:
+    for keyword, value in table:
+        if keyword in found:
+            return value
+    return None
+
+
+class AnalyticsClassification:
+    """The analytics type, visualization and distribution inferred for an ANALYTICS command."""
+
+    def __init__(self, analytics_type: str, visualization_type: str, distribution_type: Optional[str]):
+        self.analytics_type = analytics_type
+        self.visualization_type = visualization_type
+        self.distribution_type = distribution_type
+
+
+def classify_analytics(submodule_code: str, text: str,
+                       entities: Optional[Dict[str, Any]] = None) -> AnalyticsClassification:
+    """
+    Infer the analytics type, visualization and distribution of a command.
+
+    The text is scanned once (and only once per distinct text, so classifying again
+    with the entities after an early route costs only table lookups). An explicit
+    "visualization" or "distributionType" entity takes precedence over the text.
+    """
+    entities = entities or {}
+    found = scan(text)
+
+    analytics_type = analytics_type_for(submodule_code, found)
+    visualization_type = (
+        _visualization_entity(entities.get("visualization"))
+        or _first(VISUALIZATION_KEYWORDS, found)
+        or ANALYTICS_VISUALIZATION.get(analytics_type)
+        or SUBMODULE_VISUALIZATION.get(submodule_code)
+        or "table"
+    )
+
+    distribution_type = None
+    if visualization_type == "pie_chart" or found.intersection(("pie", "distribution")):
+        distribution_type = entities.get("distributionType") or _first(DISTRIBUTION_KEYWORDS, found)
+        if distribution_type is None and found.intersection(DISTRIBUTION_REQUEST_WORDS):
+            # General distribution requests about spending are broken down by category
+            if "category" in entities or found.intersection(CATEGORY_HINT_WORDS):
+                distribution_type = "category"
+
+    return AnalyticsClassification(analytics_type, visualization_type, distribution_type)
+
+
+def analytics_type_for(submodule_code: str, found: FrozenSet[str]) -> str:
+    """The analytics type for a submodule and the keywords of its text."""
+    if found.intersection(COMPARISON_WORDS):
+        return "comparison_analysis"
+    if found.intersection(DISTRIBUTION_WORDS):
+        return "distribution_analysis"
+    if submodule_code in SUBMODULE_ANALYTICS:
+        return SUBMODULE_ANALYTICS[submodule_code]
+    return _first(ANALYTICS_KEYWORDS, found) or "general_analytics"
+
+
+def _visualization_entity(value: Any) -> Optional[str]:
+    """The visualization named by an explicit "visualization" entity."""
+    if not isinstance(value, str):
+        return None
+    value = value.lower()
+    if value in ("table", "list", "grid"):
+        return "table"
+    if "bar" in value or "column" in value:
+        return "bar_chart"
+    if "line" in value:
+        return "line_chart"
+    if "pie" in value or "circle" in value:
+        return "pie_chart"
+    if "area" in value or "fill" in value:
+        return "area_chart"
+    return None
@@ -1,16 +1,17 @@
 from typing import Dict, Any, List, Optional
-import httpx
 import logging
 from config import Settings
+from services.http_clients import get_http_clients
+from services.llm_gateway import get_llm_gateway
+from services.metrics import stage
 import json
-from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
 class AnalyticsService:
-    def __init__(self):
-        self.settings = Settings()
-        self.client = httpx.AsyncClient()
+    def __init__(self, settings: Optional[Settings] = None):
+        self.settings = settings or Settings()
+        self.client = get_http_clients().api
         
     async def process_analytics_request(
         self,
@@ -107,20 +108,22 @@ class AnalyticsService:
             params = {k: v for k, v in params.items() if v is not None}
             
             # Call analytics API
-            response = await self.client.get(
-                f"{self.settings.external_api_base_url}/analytics/{user_id}",
-                params=params
-            )
+            with stage("analytics_api"):
+                response = await self.client.get(
+                    f"{self.settings.external_api_base_url}/analytics/{user_id}",
+                    params=params
+                )
             response.raise_for_status()
             analytics_data = response.json()
             
             # Generate visualization data using OpenAI
-            visualization_data = await self._generate_visualization_data(
-                analytics_data,
-                entities.get("analyticsType", ""),
-                entities.get("visualizationType", ""),
-                nlp_response["raw_text"]
-            )
+            with stage("visualization"):
+                visualization_data = await self._generate_visualization_data(
+                    analytics_data,
+                    entities.get("analyticsType", ""),
+                    entities.get("visualizationType", ""),
+                    nlp_response["raw_text"]
+                )
             
             # Add visualization data to response
             analytics_data["visualization"] = visualization_data
@@ -151,7 +154,7 @@ class AnalyticsService:
         Returns:
             Visualization data structure specific to the requested chart type
         """
-        client = AsyncOpenAI(api_key=self.settings.openai_api_key)
+        llm = get_llm_gateway()
         
         # Map common visualization type variations
         viz_type_mapping = {
@@ -194,7 +197,7 @@ class AnalyticsService:
         """
         
         try:
-            response = await client.chat.completions.create(
+            response = await llm.create(
                 model="gpt-4-turbo-preview",
                 messages=[
                     {"role": "system", "content": "You are a data visualization expert. Generate precise, visualization-ready JSON structures."},
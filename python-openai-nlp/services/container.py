@@ -0,0 +1,151 @@
+from typing import Dict, Any, Callable, List
+import logging
+import time
+from config import Settings
+from services.http_clients import HTTPClientRegistry, get_http_clients
+from services.llm_gateway import LLMGateway, get_llm_gateway
+from services.mapping_registry import MappingRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Lazily builds the process-wide services.
+
+    The settings, the parsed mappings and each service are built once, on first use,
+    and shared. Importing the application no longer constructs any service, so cold
+    starts only pay for the services a request actually needs.
+    """
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Return the named instance, building it on first use."""
+        instance = self._instances.get(name)
+        if instance is None:
+            start_time = time.perf_counter()
+            instance = factory()
+            self._instances[name] = instance
+            logger.info(f"Built {name} in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        return instance
+
+    def _build_settings(self) -> Settings:
+        settings = Settings()
+        # The HTTP clients are configured from the same settings as the services using them
+        get_http_clients(settings)
+        get_llm_gateway(settings)
+        return settings
+
+    @property
+    def settings(self) -> Settings:
+        return self._get("settings", self._build_settings)
+
+    @property
+    def http_clients(self) -> HTTPClientRegistry:
+        return self._get("http_clients", lambda: get_http_clients(self.settings))
+
+    @property
+    def llm_gateway(self) -> LLMGateway:
+        return self._get("llm_gateway", lambda: get_llm_gateway(self.settings))
+
+    @property
+    def mappings(self) -> MappingRegistry:
+        return self._get("mappings", MappingRegistry)
+
+    @property
+    def context_store(self):
+        from services.context_store import create_context_store
+        return self._get("context_store", lambda: create_context_store(self.settings))
+
+    @property
+    def context_writer(self):
+        from services.context_writer import ContextWriter
+        return self._get(
+            "context_writer",
+            lambda: ContextWriter(
+                self.context_store,
+                write_behind=self.settings.context_write_behind,
+                flush_interval_ms=self.settings.context_flush_interval_ms,
+                max_batch=self.settings.context_flush_max_batch
+            )
+        )
+
+    @property
+    def history_manager(self):
+        from services.history_manager import HistoryManager
+        return self._get(
+            "history_manager",
+            lambda: HistoryManager(
+                max_turns=self.settings.history_max_turns,
+                token_budget=self.settings.history_token_budget,
+                max_stored_turns=self.settings.history_max_stored_turns,
+                model=self.settings.openai_model
+            )
+        )
+
+    @property
+    def context_compactor(self):
+        from services.context_compactor import create_context_compactor
+        return self._get(
+            "context_compactor",
+            lambda: create_context_compactor(self.settings, self.context_store, self.history_manager)
+        )
+
+    @property
+    def period_resolver(self):
+        from services.period_resolver import PeriodResolver
+        return self._get(
+            "period_resolver",
+            lambda: PeriodResolver(
+                timezone=self.settings.analytics_timezone,
+                fiscal_year_start_month=self.settings.fiscal_year_start_month
+            )
+        )
+
+    @property
+    def nlp_service(self):
+        from services.nlp_service import NLPService
+        return self._get("nlp_service", lambda: NLPService(settings=self.settings, mappings=self.mappings))
+
+    @property
+    def validator_service(self):
+        from services.request_validator_service import RequestValidatorService
+        return self._get(
+            "validator_service",
+            lambda: RequestValidatorService(settings=self.settings, mappings=self.mappings)
+        )
+
+    @property
+    def transfer_service(self):
+        from services.transfer_service import TransferService
+        return self._get("transfer_service", lambda: TransferService(settings=self.settings))
+
+    @property
+    def analytics_service(self):
+        from services.analytics_service import AnalyticsService
+        return self._get("analytics_service", lambda: AnalyticsService(settings=self.settings))
+
+    @property
+    def smart_text_service(self):
+        from services.smart_text_service import SmartTextService
+        return self._get(
+            "smart_text_service",
+            lambda: SmartTextService(
+                settings=self.settings,
+                nlp_service=self.nlp_service,
+                validator_service=self.validator_service,
+                transfer_service=self.transfer_service,
+                analytics_service=self.analytics_service,
+                context_writer=self.context_writer,
+                history_manager=self.history_manager
+            )
+        )
+
+    def built(self) -> List[str]:
+        """Names of the instances built so far."""
+        return list(self._instances)
+
+
+container = ServiceContainer()
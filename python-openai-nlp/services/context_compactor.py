@@ -0,0 +1,206 @@
+from typing import Dict, Any, Optional
+import asyncio
+import logging
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker compacts, which is safe but repeats the work
+    fcntl = None
+
+from services.context_store import ContextStore, DEFAULT_PATHS
+from services.history_manager import HistoryManager
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# A stored turn (a user entry and an answer) is never smaller than this, so contexts
+# smaller than max_stored_turns of them are not parsed to count their turns
+MIN_TURN_BYTES = 160
+
+CONTEXT_COMPACTED = registry.counter(
+    "nlp_context_compacted_total", "Conversation contexts expired or shortened by the compactor, by action", ("action",)
+)
+CONTEXT_RECLAIMED_BYTES = registry.counter(
+    "nlp_context_reclaimed_bytes_total", "Bytes of conversation contexts removed by the compactor"
+)
+
+
+def _new_pass() -> Dict[str, Any]:
+    return {"started_at": time.time(), "scanned": 0, "expired": 0, "compacted": 0, "reclaimed_bytes": 0,
+            "released_bytes": 0, "steps": 0, "max_step_ms": 0.0}
+
+
+class ContextCompactor:
+    """
+    Expires idle conversation contexts and caps the history of long sessions.
+
+    Each step scans one batch of the store from where the last step stopped. It deletes
+    contexts not written for ttl_seconds, and rewrites sessions over the history manager's
+    max_stored_turns, folding their oldest turns into the session summary. Only contexts
+    not written since the scan are changed, so a worker writing a user meanwhile wins.
+    Steps run in a worker thread, pause_ms apart, so request handling never waits for a
+    pass. A new pass starts interval_seconds after one ends.
+
+    With several workers, the one holding the advisory lock on lock_path compacts.
+    """
+
+    def __init__(self, store: ContextStore, history_manager: HistoryManager, ttl_seconds: float,
+                 batch_size: int = 500, interval_seconds: float = 3600.0, pause_ms: float = 50.0,
+                 lock_path: Optional[str] = None):
+        self.store = store
+        self.history_manager = history_manager
+        self.ttl_seconds = ttl_seconds
+        self.batch_size = max(1, batch_size)
+        self.interval_seconds = interval_seconds
+        self.pause_seconds = pause_ms / 1000.0
+        self.lock_path = lock_path
+        self.min_bytes = history_manager.max_stored_turns * MIN_TURN_BYTES
+        self._cursor: Optional[str] = None
+        self._pass = _new_pass()
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        self.passes = 0
+        self.last_pass: Optional[Dict[str, Any]] = None
+        self.totals = {"scanned": 0, "expired": 0, "compacted": 0, "reclaimed_bytes": 0}
+
+    def step(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Compact the next batch; safe to run in a worker thread.
+
+        Returns the entries deleted and rewritten (as they were scanned), and whether the
+        pass is finished. The report of a finished pass is in last_pass.
+        """
+        start_time = time.perf_counter()
+        now = now if now is not None else time.time()
+        backend = self.store.backend
+        stored, self._cursor = backend.scan(self._cursor, self.batch_size)
+
+        expired = [entry for entry in stored if self.ttl_seconds > 0 and now - entry.updated_at > self.ttl_seconds]
+        deleted = backend.delete_unchanged(expired)
+
+        changes = []
+        expired_keys = {entry.key for entry in expired}
+        for entry in stored:
+            if entry.key in expired_keys or entry.size < self.min_bytes:
+                continue
+            context = backend.load(entry)
+            if isinstance(context, dict) and "history" in context:
+                compacted = self.history_manager.compact(context)
+                if compacted is not context:
+                    changes.append((entry, compacted))
+        rewritten = backend.replace_unchanged(changes)
+
+        reclaimed = sum(entry.size for entry in deleted) + sum(old.size - new.size for old, new in rewritten)
+        released = backend.release() if deleted or rewritten else 0
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+        CONTEXT_COMPACTED.inc(len(deleted), action="expired")
+        CONTEXT_COMPACTED.inc(len(rewritten), action="capped")
+        CONTEXT_RECLAIMED_BYTES.inc(reclaimed)
+        report = self._pass
+        report["scanned"] += len(stored)
+        report["expired"] += len(deleted)
+        report["compacted"] += len(rewritten)
+        report["reclaimed_bytes"] += reclaimed
+        report["released_bytes"] += released
+        report["steps"] += 1
+        report["max_step_ms"] = round(max(report["max_step_ms"], elapsed_ms), 2)
+        finished = self._cursor is None
+        if finished:
+            self._finish_pass()
+        return {"removed": deleted + [old for old, _ in rewritten], "finished": finished}
+
+    def _finish_pass(self) -> None:
+        report = self._pass
+        report["seconds"] = round(time.time() - report.pop("started_at"), 2)
+        for name in self.totals:
+            self.totals[name] += report[name]
+        self.passes += 1
+        self.last_pass = report
+        self._pass = _new_pass()
+        logger.info(
+            f"Context compaction: scanned {report['scanned']}, expired {report['expired']}, "
+            f"compacted {report['compacted']}, reclaimed {report['reclaimed_bytes']} bytes in {report['seconds']}s"
+        )
+
+    def run_pass(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Compact the whole store at once, from the start; for maintenance and benchmarks."""
+        self._cursor = None
+        self._pass = _new_pass()
+        while not self.step(now)["finished"]:
+            pass
+        return self.last_pass
+
+    async def run_step(self) -> bool:
+        """Compact the next batch off the event loop; returns whether the pass is finished."""
+        result = await asyncio.to_thread(self.step)
+        # The cache is only touched on the event loop
+        for entry in result["removed"]:
+            if entry.user_id is not None:
+                self.store.forget(entry.user_id, entry.version)
+        return result["finished"]
+
+    def _acquire_lock(self) -> bool:
+        """Whether this process compacts: it holds the lock, or there is no lock to take."""
+        if self._lock_file is not None or not self.lock_path or fcntl is None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            finished = True
+            try:
+                if self._acquire_lock():
+                    finished = await self.run_step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Context compaction failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds if finished else self.pause_seconds)
+
+    def start(self) -> None:
+        """Start compacting in the background; called with the event loop running."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        """Stop between steps and release the lock."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "active": self._lock_file is not None or fcntl is None or not self.lock_path,
+            "passes": self.passes,
+            **self.totals,
+            "current_pass": {name: value for name, value in self._pass.items() if name != "started_at"},
+            "last_pass": self.last_pass
+        }
+
+
+def create_context_compactor(settings, store: ContextStore, history_manager: HistoryManager) -> ContextCompactor:
+    """Build the compactor configured by the settings, locked next to the store's data."""
+    path = settings.context_store_path or DEFAULT_PATHS[settings.context_store_backend]
+    return ContextCompactor(
+        store,
+        history_manager,
+        ttl_seconds=settings.context_ttl_hours * 3600,
+        batch_size=settings.context_compaction_batch_size,
+        interval_seconds=settings.context_compaction_interval_seconds,
+        pause_ms=settings.context_compaction_pause_ms,
+        lock_path=f"{path}.compactor.lock"
+    )
@@ -0,0 +1,710 @@
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SQLITE = "sqlite"
+FILES = "files"
+
+# Where each back end keeps its contexts unless CONTEXT_STORE_PATH says otherwise
+DEFAULT_PATHS = {SQLITE: "data/conversation_context.db", FILES: "data/conversation_contexts"}
+
+# How long a write waits for another process's transaction before failing
+BUSY_TIMEOUT_SECONDS = 30.0
+
+# Cached "no context" entries, so new users do not hit the back end on every request
+_MISSING = object()
+
+# Answer of ContextBackend.read when the stored context is still the version the caller has
+UNCHANGED = object()
+
+# Files set aside by a version-checked delete or replace for longer than this were left by a crash
+CLAIM_RECOVERY_SECONDS = 60.0
+
+
+def _dumps(context: Dict[str, Any]) -> str:
+    return json.dumps(context, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _new_version() -> str:
+    return os.urandom(8).hex()
+
+
+class StoredContext:
+    """
+    A context found by a scan: where the back end keeps it, its version, last write time
+    and size, without parsing it. user_id is None until load() or delete_unchanged() if
+    the back end's key is not the user id.
+    """
+
+    def __init__(self, key: str, version: str, updated_at: float, size: int,
+                 data: Optional[str] = None, user_id: Optional[str] = None):
+        self.key = key
+        self.version = version
+        self.updated_at = updated_at
+        self.size = size
+        self.data = data
+        self.user_id = user_id
+
+
+class ContextBackend(ABC):
+    """
+    Durable storage of one JSON context per user.
+
+    Every operation touches only the users it is given, so its cost does not depend on
+    how many users are stored. Several processes may use the same storage at once: each
+    context is written completely or not at all, and the last write of a user wins.
+
+    Every write gives the context a new version, so a cached copy can be revalidated
+    without reading the context again. A back end that leaves out one of the abstract
+    methods cannot be created.
+    """
+
+    name = "backend"
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self.read(user_id)[1]
+
+    @abstractmethod
+    def read(self, user_id: str, version: Optional[str] = None) -> Tuple[Optional[str], Any]:
+        """
+        The version and context of a user, (None, None) without one. The context is
+        UNCHANGED when the stored version is still the given one.
+        """
+
+    @abstractmethod
+    def put_many(self, contexts: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """Store the contexts of several users, each written completely or not at all; returns their versions."""
+
+    def put(self, user_id: str, context: Dict[str, Any]) -> str:
+        return self.put_many({user_id: context})[user_id]
+
+    @abstractmethod
+    def put_missing(self, contexts: Dict[str, Dict[str, Any]]) -> int:
+        """Store the contexts of the users that have none yet; returns how many were stored."""
+
+    @abstractmethod
+    def scan(self, after: Optional[str], limit: int) -> Tuple[List[StoredContext], Optional[str]]:
+        """
+        Up to limit stored contexts after a cursor (None: from the start), in a stable
+        order, and the cursor to continue from, None once every context was scanned.
+        """
+
+    @abstractmethod
+    def load(self, stored: StoredContext) -> Optional[Dict[str, Any]]:
+        """The context of a scanned entry, or None if it was written or deleted since the scan."""
+
+    @abstractmethod
+    def delete_unchanged(self, stored: List[StoredContext]) -> List[StoredContext]:
+        """
+        Delete scanned contexts that were not written since the scan; returns those
+        deleted, with their user_id set.
+        """
+
+    @abstractmethod
+    def replace_unchanged(
+        self, changes: List[Tuple[StoredContext, Dict[str, Any]]]
+    ) -> List[Tuple[StoredContext, StoredContext]]:
+        """
+        Rewrite loaded contexts that were not written since the scan, keeping their last
+        write time; returns each one rewritten as (scanned, now stored).
+        """
+
+    def release(self) -> int:
+        """Give space freed by deletes back to the file system; returns the bytes released."""
+        return 0
+
+    @abstractmethod
+    def delete(self, user_id: str) -> None:
+        """Remove the context of a user, if there is one."""
+
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Every stored (user_id, context)."""
+
+    def is_empty(self) -> bool:
+        return next(self.items(), None) is None
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteContextBackend(ContextBackend):
+    """
+    Contexts in one SQLite table, keyed by user id, in WAL mode.
+
+    Each put_many is one transaction, so a crash leaves every context either old or
+    new, and readers never wait for writers. synchronous=NORMAL gives up only the
+    last transactions on power loss, never consistency. Writers in other processes,
+    such as other uvicorn workers, are waited for up to BUSY_TIMEOUT_SECONDS.
+    """
+
+    name = SQLITE
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False, isolation_level=None
+        )
+        # New databases give the pages of deleted contexts back to the file system (see release)
+        self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        # Workers starting together create (or upgrade) the table one at a time
+        self._transaction(self._create_table)
+
+    def _create_table(self) -> None:
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS contexts ("
+            "user_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "version TEXT NOT NULL DEFAULT '')"
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(contexts)")}
+        if "version" not in columns:
+            self._connection.execute("ALTER TABLE contexts ADD COLUMN version TEXT NOT NULL DEFAULT ''")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return result
+
+    def read(self, user_id: str, version: Optional[str] = None) -> Tuple[Optional[str], Any]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT version, CASE WHEN version = ? THEN NULL ELSE data END FROM contexts WHERE user_id = ?",
+                (version, user_id)
+            ).fetchone()
+        if row is None:
+            return None, None
+        return row[0], UNCHANGED if row[1] is None else json.loads(row[1])
+
+    def put_many(self, contexts: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        now = time.time()
+        versions = {user_id: _new_version() for user_id in contexts}
+        rows = [(user_id, _dumps(context), now, versions[user_id]) for user_id, context in contexts.items()]
+        self._transaction(lambda: self._connection.executemany(
+            "INSERT INTO contexts (user_id, data, updated_at, version) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET "
+            "data = excluded.data, updated_at = excluded.updated_at, version = excluded.version",
+            rows
+        ))
+        return versions
+
+    def put_missing(self, contexts: Dict[str, Dict[str, Any]]) -> int:
+        now = time.time()
+        rows = [(user_id, _dumps(context), now, _new_version()) for user_id, context in contexts.items()]
+        return self._transaction(lambda: self._connection.executemany(
+            "INSERT INTO contexts (user_id, data, updated_at, version) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO NOTHING",
+            rows
+        ).rowcount)
+
+    def scan(self, after: Optional[str], limit: int) -> Tuple[List[StoredContext], Optional[str]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT user_id, version, updated_at, length(CAST(data AS BLOB)), data FROM contexts "
+                "WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (after or "", limit)
+            ).fetchall()
+        stored = [StoredContext(*row, user_id=row[0]) for row in rows]
+        return stored, stored[-1].key if len(stored) == limit else None
+
+    def load(self, stored: StoredContext) -> Optional[Dict[str, Any]]:
+        return json.loads(stored.data)
+
+    def delete_unchanged(self, stored: List[StoredContext]) -> List[StoredContext]:
+        if not stored:
+            return []
+
+        def delete() -> List[StoredContext]:
+            return [
+                entry for entry in stored
+                if self._connection.execute(
+                    "DELETE FROM contexts WHERE user_id = ? AND version = ?", (entry.key, entry.version)
+                ).rowcount
+            ]
+        return self._transaction(delete)
+
+    def replace_unchanged(
+        self, changes: List[Tuple[StoredContext, Dict[str, Any]]]
+    ) -> List[Tuple[StoredContext, StoredContext]]:
+        if not changes:
+            return []
+        rows = [(entry, _dumps(context), _new_version()) for entry, context in changes]
+
+        def replace() -> List[Tuple[StoredContext, StoredContext]]:
+            return [
+                (entry, StoredContext(entry.key, version, entry.updated_at, len(data.encode("utf-8")), data, entry.key))
+                for entry, data, version in rows
+                if self._connection.execute(
+                    "UPDATE contexts SET data = ?, version = ? WHERE user_id = ? AND version = ?",
+                    (data, version, entry.key, entry.version)
+                ).rowcount
+            ]
+        return self._transaction(replace)
+
+    def release(self, pages: int = 1000) -> int:
+        """
+        Give up to this many free pages back to the file system; returns the bytes released.
+        Databases created before auto_vacuum was set keep their free pages for reuse.
+        """
+        with self._lock:
+            page_size = self._connection.execute("PRAGMA page_size").fetchone()[0]
+            free_before = self._connection.execute("PRAGMA freelist_count").fetchone()[0]
+            self._connection.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            free_after = self._connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return (free_before - free_after) * page_size
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM contexts WHERE user_id = ?", (user_id,))
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._connection.execute("SELECT user_id, data FROM contexts").fetchall()
+        for user_id, data in rows:
+            yield user_id, json.loads(data)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM contexts LIMIT 1").fetchone() is None
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class ShardedFileContextBackend(ContextBackend):
+    """
+    One JSON file per user, spread over 256 shard directories.
+
+    Files are named by a hash of the user id, so any id is a safe file name and no
+    directory grows past a few thousand files per million users. Writes go to a
+    temporary file in the same directory, are fsynced and renamed over the old file,
+    so a crash leaves either the old or the new context, never a torn one, and
+    processes writing the same user at once never mix their contexts. A file's
+    version is its inode, modification time and size, which every rename changes.
+    """
+
+    name = FILES
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, user_id: str) -> str:
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    @staticmethod
+    def _version(stat: os.stat_result) -> str:
+        return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def read(self, user_id: str, version: Optional[str] = None) -> Tuple[Optional[str], Any]:
+        path = self.path(user_id)
+        try:
+            if version is not None and self._version(os.stat(path)) == version:
+                return version, UNCHANGED
+            with open(path, "r", encoding="utf-8") as f:
+                # The version of the file opened, even if it was replaced since the stat
+                return self._version(os.fstat(f.fileno())), json.load(f)["context"]
+        except FileNotFoundError:
+            return None, None
+        except (json.JSONDecodeError, KeyError):
+            logger.warning(f"Ignoring unreadable context file for user {user_id}")
+            return None, None
+
+    def put_many(self, contexts: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        return {
+            user_id: self._write(self.path(user_id), _dumps({"user_id": user_id, "context": context}))
+            for user_id, context in contexts.items()
+        }
+
+    def put_missing(self, contexts: Dict[str, Dict[str, Any]]) -> int:
+        stored = 0
+        for user_id, context in contexts.items():
+            text = _dumps({"user_id": user_id, "context": context})
+            if self._write(self.path(user_id), text, replace=False) is not None:
+                stored += 1
+        return stored
+
+    @classmethod
+    def _write(cls, path: str, text: str, replace: bool = True, mtime_ns: Optional[int] = None) -> Optional[str]:
+        """
+        Write a file atomically and return its version. Without replace, an existing file
+        is kept (linking fails atomically if another process created it first) and None
+        is returned. mtime_ns keeps the time of the write being rewritten.
+        """
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            if mtime_ns is not None:
+                os.utime(temporary, ns=(mtime_ns, mtime_ns))
+            version = cls._version(os.stat(temporary))
+            if replace:
+                os.replace(temporary, path)
+                return version
+            try:
+                os.link(temporary, path)
+            except FileExistsError:
+                return None
+            finally:
+                os.unlink(temporary)
+            return version
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def scan(self, after: Optional[str], limit: int) -> Tuple[List[StoredContext], Optional[str]]:
+        after_shard, _, after_name = (after or "").partition("/")
+        stored: List[StoredContext] = []
+        for shard in sorted(name for name in os.listdir(self.root) if name >= after_shard):
+            shard_path = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            names = sorted(os.listdir(shard_path))
+            self._recover_claims(shard_path, names)
+            for name in names:
+                if not name.endswith(".json") or (shard == after_shard and name <= after_name):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(shard_path, name))
+                except FileNotFoundError:
+                    continue
+                # The user id is inside the file, read by load()
+                stored.append(StoredContext(f"{shard}/{name}", self._version(stat), stat.st_mtime, stat.st_size))
+                if len(stored) == limit:
+                    return stored, stored[-1].key
+        return stored, None
+
+    def _recover_claims(self, shard_path: str, names: List[str]) -> None:
+        """
+        Put back files a crash left set aside by a version-checked delete or replace,
+        and remove temporary files a crash left behind.
+        """
+        for name in names:
+            if not name.endswith((".claimed", ".tmp")):
+                continue
+            leftover = os.path.join(shard_path, name)
+            try:
+                if time.time() - os.stat(leftover).st_mtime < CLAIM_RECOVERY_SECONDS:
+                    continue
+                if name.endswith(".claimed"):
+                    os.link(leftover, os.path.join(shard_path, name.split(".", 1)[0] + ".json"))
+            except (FileNotFoundError, FileExistsError):
+                pass
+            try:
+                os.unlink(leftover)
+            except FileNotFoundError:
+                pass
+
+    def load(self, stored: StoredContext) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.root, stored.key), "r", encoding="utf-8") as f:
+                if self._version(os.fstat(f.fileno())) != stored.version:
+                    return None
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        stored.user_id = record.get("user_id")
+        return record.get("context")
+
+    def _claim(self, path: str, version: str) -> Optional[str]:
+        """
+        Move a file aside if it is still the given version, so no other process can
+        write it in between; returns where it was moved. A file written again since
+        is put back, unless an even newer one took its place.
+        """
+        try:
+            if self._version(os.stat(path)) != version:
+                return None
+            claimed = f"{path[:-len('.json')]}.{os.urandom(4).hex()}.claimed"
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        if self._version(os.stat(claimed)) == version:
+            return claimed
+        self._restore(claimed, path)
+        return None
+
+    @staticmethod
+    def _restore(claimed: str, path: str) -> None:
+        """Put a file set aside back, unless a newer one was written in its place."""
+        try:
+            os.link(claimed, path)
+        except FileExistsError:
+            pass
+        os.unlink(claimed)
+
+    def delete_unchanged(self, stored: List[StoredContext]) -> List[StoredContext]:
+        deleted = []
+        for entry in stored:
+            claimed = self._claim(os.path.join(self.root, entry.key), entry.version)
+            if claimed is None:
+                continue
+            if entry.user_id is None:
+                # Read before the file goes, so the store can drop the user's cached copy
+                try:
+                    with open(claimed, "r", encoding="utf-8") as f:
+                        entry.user_id = json.load(f).get("user_id")
+                except (OSError, json.JSONDecodeError, AttributeError):
+                    pass
+            os.unlink(claimed)
+            deleted.append(entry)
+        return deleted
+
+    def replace_unchanged(
+        self, changes: List[Tuple[StoredContext, Dict[str, Any]]]
+    ) -> List[Tuple[StoredContext, StoredContext]]:
+        replaced = []
+        for entry, context in changes:
+            path = os.path.join(self.root, entry.key)
+            claimed = self._claim(path, entry.version)
+            if claimed is None:
+                continue
+            try:
+                text = _dumps({"user_id": entry.user_id, "context": context})
+                version = self._write(path, text, replace=False, mtime_ns=os.stat(claimed).st_mtime_ns)
+            except BaseException:
+                self._restore(claimed, path)
+                raise
+            os.unlink(claimed)
+            if version is not None:
+                size = len(text.encode("utf-8"))
+                replaced.append((entry, StoredContext(entry.key, version, entry.updated_at, size, user_id=entry.user_id)))
+        return replaced
+
+    def delete(self, user_id: str) -> None:
+        try:
+            os.unlink(self.path(user_id))
+        except FileNotFoundError:
+            pass
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for shard in sorted(os.listdir(self.root)):
+            shard_path = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(shard_path, name), "r", encoding="utf-8") as f:
+                        record = json.load(f)
+                    yield record["user_id"], record["context"]
+                except (OSError, json.JSONDecodeError, KeyError):
+                    continue
+
+
+class ContextStore:
+    """
+    Per-user conversation contexts: an in-memory LRU in front of a durable back end.
+
+    Reads are served from the LRU when possible, including "no context" answers for new
+    users, and writes go through to the back end. Contexts returned are shared with the
+    cache and must not be mutated.
+
+    A shared store is one that other processes write to as well, such as the store of
+    several uvicorn workers. There, a cached context is used only after the back end
+    confirms it still has that version. That costs a lookup, but the context is not
+    read or parsed again.
+    """
+
+    def __init__(self, backend: ContextBackend, cache_size: int = 10000, shared: bool = False):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.shared = shared
+        # user_id -> (version, context or _MISSING)
+        self._cache: "OrderedDict[str, Tuple[Optional[str], Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.writes = 0
+
+    def cached(self, user_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Look a user up in the LRU only: whether it is known there, and its context. A
+        shared store revalidates its entries first (see refresh), so it never answers here.
+        """
+        entry = None if self.shared else self._cache.get(user_id)
+        if entry is None:
+            return False, None
+        self._cache.move_to_end(user_id)
+        self.hits += 1
+        return True, _context(entry)
+
+    def entry(self, user_id: str) -> Optional[Tuple[Optional[str], Any]]:
+        """The cached (version, context) of a user, to revalidate with backend.read, or None."""
+        return self._cache.get(user_id)
+
+    def refresh(self, user_id: str, entry: Optional[Tuple[Optional[str], Any]],
+                version: Optional[str], context: Any) -> Optional[Dict[str, Any]]:
+        """
+        Cache what backend.read answered for a user and return the user's context.
+
+        entry is the cached entry the read revalidated. It is kept if the back end
+        answered UNCHANGED, or still has no context for the user. If the user was cached
+        again while the read ran, the newer entry wins.
+        """
+        current = self._cache.get(user_id)
+        if current is not None and current is not entry:
+            self._cache.move_to_end(user_id)
+            return _context(current)
+        if entry is not None and (context is UNCHANGED or (context is None and entry[1] is _MISSING)):
+            self.hits += 1
+            self._cache.move_to_end(user_id)
+            return _context(entry)
+        self.misses += 1
+        if entry is not None:
+            self.stale += 1
+        self.remember(user_id, context, version)
+        return context
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        found, context = self.cached(user_id)
+        if found:
+            return context
+        entry = self.entry(user_id)
+        version, context = self.backend.read(user_id, entry[0] if entry is not None else None)
+        return self.refresh(user_id, entry, version, context)
+
+    def put(self, user_id: str, context: Dict[str, Any]) -> None:
+        version = self.backend.put(user_id, context)
+        self.remember(user_id, context, version)
+        self.writes += 1
+
+    def written(self, contexts: Dict[str, Dict[str, Any]], versions: Dict[str, str]) -> None:
+        """Record the versions written for contexts that are still the cached ones."""
+        for user_id, version in versions.items():
+            entry = self._cache.get(user_id)
+            if entry is not None and entry[1] is contexts[user_id]:
+                self._cache[user_id] = (version, entry[1])
+        self.writes += len(versions)
+
+    def delete(self, user_id: str) -> None:
+        self.backend.delete(user_id)
+        self._cache.pop(user_id, None)
+
+    def forget(self, user_id: str, version: str) -> None:
+        """Drop a cached context that is still this version, after it was deleted or rewritten behind the cache."""
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] == version:
+            del self._cache[user_id]
+
+    def remember(self, user_id: str, context: Optional[Dict[str, Any]], version: Optional[str] = None) -> None:
+        """Put a context (or None, for no context) in the LRU without writing it."""
+        if self.cache_size <= 0:
+            return
+        self._cache[user_id] = (version, _MISSING if context is None else context)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "shared": self.shared,
+            "cached": len(self._cache),
+            "cache_size": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "writes": self.writes,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def _context(entry: Tuple[Optional[str], Any]) -> Optional[Dict[str, Any]]:
+    return None if entry[1] is _MISSING else entry[1]
+
+
+def _load_legacy_file(path: str) -> Optional[Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not import legacy contexts from {path}: {str(e)}")
+        return None
+
+
+def _legacy_sessions(directory: str) -> Dict[str, Dict[str, Any]]:
+    """The most recently updated session of each user in a directory of <session_id>.json files."""
+    sessions: Dict[str, Dict[str, Any]] = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        session = _load_legacy_file(os.path.join(directory, name))
+        if not isinstance(session, dict) or not session.get("user_id") or not isinstance(session.get("history"), list):
+            continue
+        user_id = str(session["user_id"])
+        known = sessions.get(user_id)
+        if known is None or str(session.get("last_updated", "")) > str(known.get("last_updated", "")):
+            sessions[user_id] = session
+    return sessions
+
+
+def import_legacy_contexts(backend: ContextBackend, path: str, sessions_dir: str = "") -> int:
+    """
+    Copy the contexts of the old single-file store, and the latest session of each user
+    in the old session directory, into an empty back end.
+
+    A user's session is preferred over the user's single-turn context. Returns the number
+    of contexts imported. The old files are left in place. Users that already have a
+    context, written by a worker that started first, keep it.
+    """
+    if not backend.is_empty():
+        return 0
+    contexts: Dict[str, Dict[str, Any]] = {}
+    if path and os.path.exists(path):
+        legacy = _load_legacy_file(path)
+        if isinstance(legacy, dict):
+            contexts.update((user_id, context) for user_id, context in legacy.items() if isinstance(context, dict))
+    if sessions_dir and os.path.isdir(sessions_dir):
+        contexts.update(_legacy_sessions(sessions_dir))
+    if not contexts:
+        return 0
+    imported = backend.put_missing(contexts)
+    logger.info(f"Imported {imported} legacy contexts")
+    return imported
+
+
+def create_context_store(settings) -> ContextStore:
+    """Build the context store configured by the settings."""
+    kind = settings.context_store_backend
+    if kind not in DEFAULT_PATHS:
+        raise ValueError(f"Unknown context store backend: {kind}")
+    path = settings.context_store_path or DEFAULT_PATHS[kind]
+    backend: ContextBackend = SQLiteContextBackend(path) if kind == SQLITE else ShardedFileContextBackend(path)
+    import_legacy_contexts(backend, settings.context_legacy_file, settings.context_legacy_sessions_dir)
+    return ContextStore(backend, cache_size=settings.context_cache_size, shared=settings.context_store_shared)
@@ -0,0 +1,161 @@
+from typing import Dict, Any, Optional
+import asyncio
+import logging
+import time
+
+from services.context_store import ContextStore
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_QUEUE_DEPTH = registry.gauge("nlp_context_queue_depth", "Conversation contexts waiting to be written")
+CONTEXT_FLUSH_SECONDS = registry.histogram(
+    "nlp_context_flush_duration_seconds", "Time to write one batch of conversation contexts"
+)
+CONTEXT_FLUSHED = registry.counter("nlp_context_flushed_total", "Conversation contexts written, by outcome", ("outcome",))
+
+
+class ContextWriter:
+    """
+    Reads and writes conversation contexts without blocking the event loop.
+
+    Reads missing from the store's LRU run in a worker thread. With write_behind, put()
+    updates the in-memory state, marks the user dirty and returns at once. Dirty
+    contexts are written together, in a worker thread, flush_interval_ms after the
+    first of them was queued or as soon as max_batch are waiting. A context updated
+    again before it is written is written once, with its latest value. Batches never
+    overlap, and a failed batch is queued again except for contexts updated since.
+
+    Without write_behind, put() waits for its own write, still off the event loop.
+    close() writes everything still queued.
+
+    Queued contexts are visible only in this process. Other workers of a shared store
+    see a context once it is flushed.
+    """
+
+    def __init__(self, store: ContextStore, write_behind: bool = True,
+                 flush_interval_ms: float = 200.0, max_batch: int = 256):
+        self.store = store
+        self.write_behind = write_behind
+        self.flush_interval_seconds = flush_interval_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        # The batch being written, still the latest contexts of its users until it is stored
+        self._writing: Dict[str, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._pending: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The context of a user, from memory when possible."""
+        pending = self._dirty.get(user_id) or self._writing.get(user_id)
+        if pending is not None:
+            return pending
+        found, context = self.store.cached(user_id)
+        if found:
+            return context
+        entry = self.store.entry(user_id)
+        version, context = await asyncio.to_thread(
+            self.store.backend.read, user_id, entry[0] if entry is not None else None
+        )
+        # A newer context may have been put while this one was read
+        if user_id in self._dirty:
+            return self._dirty[user_id]
+        return self.store.refresh(user_id, entry, version, context)
+
+    async def put(self, user_id: str, context: Dict[str, Any]) -> None:
+        """Update the context of a user and queue its write."""
+        self.store.remember(user_id, context)
+        self._dirty[user_id] = context
+        CONTEXT_QUEUE_DEPTH.set(len(self._dirty))
+        if not self.write_behind:
+            await self.flush()
+        elif len(self._dirty) >= self.max_batch:
+            self._start_flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """Flush after the interval, unless a flush is already scheduled or running."""
+        if self._timer is None and self._pending is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval_seconds, self._start_flush)
+
+    def _start_flush(self) -> None:
+        """Flush now in the background; at most one background flush is pending at a time."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._background_flush())
+
+    async def _background_flush(self) -> None:
+        try:
+            await self.flush()
+        finally:
+            self._pending = None
+            # Contexts queued while the batch was written, or put back after a failure
+            if self._dirty:
+                if len(self._dirty) >= self.max_batch:
+                    self._start_flush()
+                else:
+                    self._schedule_flush()
+
+    async def flush(self) -> None:
+        """Write every dirty context now."""
+        async with self._flush_lock:
+            batch, self._dirty = self._dirty, {}
+            if not batch:
+                return
+            self._writing = batch
+            start_time = time.perf_counter()
+            try:
+                versions = await asyncio.to_thread(self.store.backend.put_many, batch)
+            except Exception as e:
+                self.failures += 1
+                CONTEXT_FLUSHED.inc(len(batch), outcome="error")
+                logger.error(f"Writing {len(batch)} conversation contexts failed: {str(e)}")
+                for user_id, context in batch.items():
+                    self._dirty.setdefault(user_id, context)
+                return
+            finally:
+                self._writing = {}
+                elapsed = time.perf_counter() - start_time
+                self.last_flush_ms = round(elapsed * 1000, 2)
+                CONTEXT_FLUSH_SECONDS.observe(elapsed)
+                CONTEXT_QUEUE_DEPTH.set(len(self._dirty))
+            self.flushes += 1
+            self.flushed += len(batch)
+            self.store.written(batch, versions)
+            CONTEXT_FLUSHED.inc(len(batch), outcome="ok")
+
+    async def close(self) -> None:
+        """Write everything still queued, then close the store."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending is not None:
+            await asyncio.gather(self._pending, return_exceptions=True)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        if self._dirty:
+            logger.error(f"{len(self._dirty)} conversation contexts could not be written before shutdown")
+        self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the queue depth and flush counters, with the store's counters."""
+        return {
+            **self.store.stats(),
+            "write_behind": self.write_behind,
+            "queue_depth": len(self._dirty),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "last_flush_ms": self.last_flush_ms,
+            "average_batch_size": round(self.flushed / self.flushes, 2) if self.flushes else 0.0
+        }
@@ -0,0 +1,283 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import json
+import uuid
+
+from services.prompt_compiler import estimate_tokens, CHARS_PER_TOKEN
+
+# A summary names at most this many topics, the most frequent first
+SUMMARY_TOPICS = 5
+# Values quoted per entity of a topic, and the longest value quoted
+SUMMARY_VALUES = 3
+SUMMARY_VALUE_CHARS = 40
+
+# First line of the conversation in a prompt
+HISTORY_HEADER = "Conversation so far:"
+
+
+def _plain(value: Any) -> Any:
+    """The JSON form of entity values (Decimal amounts, dates), as they are stored."""
+    return json.loads(json.dumps(value, default=str))
+
+
+def new_session(user_id: str, now: Optional[str] = None) -> Dict[str, Any]:
+    """An empty session, in the format of data/contexts/<session_id>.json."""
+    now = now or datetime.now().isoformat()
+    return {
+        "user_id": user_id,
+        "session_id": str(uuid.uuid4()),
+        "created_at": now,
+        "last_updated": now,
+        "history": [],
+        "summary": None,
+        "entities": {},
+        "current_module": None,
+        "current_submodule": None,
+        "current_flow": None
+    }
+
+
+def session_from_context(context: Optional[Dict[str, Any]], user_id: str) -> Dict[str, Any]:
+    """
+    The session stored for a user, upgrading the single-turn context
+    ({timestamp, raw_text, response}) written before sessions were stored.
+    """
+    if not context:
+        return new_session(user_id)
+    if "history" in context:
+        return context
+    timestamp = context.get("timestamp") or datetime.now().isoformat()
+    response = context.get("response")
+    session = new_session(user_id, timestamp)
+    session["history"] = [
+        {"timestamp": timestamp, "text": context.get("raw_text", ""), "is_user": True, "response_data": None},
+        {
+            "timestamp": timestamp,
+            "text": response.get("content", "") if isinstance(response, dict) else str(response or ""),
+            "is_user": False,
+            "response_data": None
+        }
+    ]
+    return session
+
+
+def _turns(history: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Group history entries into turns: a user entry and the assistant entries after it."""
+    turns: List[List[Dict[str, Any]]] = []
+    for entry in history:
+        if entry.get("is_user") or not turns:
+            turns.append([entry])
+        else:
+            turns[-1].append(entry)
+    return turns
+
+
+def _response_data(turn: List[Dict[str, Any]]) -> Dict[str, Any]:
+    for entry in reversed(turn):
+        if not entry.get("is_user") and entry.get("response_data"):
+            return entry["response_data"]
+    return {}
+
+
+def _topic(response_data: Dict[str, Any]) -> Optional[str]:
+    module = response_data.get("moduleName") or response_data.get("moduleCode")
+    submodule = response_data.get("submoduleName") or response_data.get("submoduleCode")
+    if not module:
+        return None
+    return f"{module} > {submodule}" if submodule else module
+
+
+def fold_summary(summary: Optional[Dict[str, Any]], turns: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Add turns to a summary: how many turns it covers and, per module and submodule, how
+    many turns asked about it and the latest values of their entities.
+    """
+    summary = summary or {"turns": 0, "topics": {}}
+    topics = {name: {"turns": topic["turns"], "entities": dict(topic["entities"])}
+              for name, topic in summary["topics"].items()}
+    for turn in turns:
+        response_data = _response_data(turn)
+        name = _topic(response_data)
+        if name is None:
+            continue
+        topic = topics.setdefault(name, {"turns": 0, "entities": {}})
+        topic["turns"] += 1
+        for key, value in (response_data.get("entities") or {}).items():
+            if value is None or isinstance(value, (dict, list)):
+                continue
+            value = str(value)[:SUMMARY_VALUE_CHARS]
+            values = [known for known in topic["entities"].get(key, []) if known != value]
+            topic["entities"][key] = (values + [value])[-SUMMARY_VALUES:]
+    return {"turns": summary["turns"] + len(turns), "topics": topics}
+
+
+def render_summary(summary: Optional[Dict[str, Any]]) -> str:
+    """One line describing the turns a summary covers, or "" for none."""
+    if not summary or not summary["turns"]:
+        return ""
+    topics = sorted(summary["topics"].items(), key=lambda item: -item[1]["turns"])
+    parts = []
+    for name, topic in topics[:SUMMARY_TOPICS]:
+        part = name if topic["turns"] == 1 else f"{name} ({topic['turns']} turns)"
+        values = "; ".join(f"{key}: {', '.join(values)}" for key, values in topic["entities"].items())
+        parts.append(f"{part} [{values}]" if values else part)
+    if len(topics) > SUMMARY_TOPICS:
+        parts.append(f"{len(topics) - SUMMARY_TOPICS} more topics")
+    turns = "1 turn" if summary["turns"] == 1 else f"{summary['turns']} turns"
+    return f"Earlier in this conversation ({turns}): " + ("; ".join(parts) if parts else "general questions") + "."
+
+
+def _render_turn(turn: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """The user's text and the assistant's answer of a turn."""
+    user = turn[0].get("text", "") if turn[0].get("is_user") else ""
+    answers = [entry.get("text") for entry in turn if not entry.get("is_user") and entry.get("text")]
+    if answers:
+        return user, " ".join(answers)
+    # Turns stored without the answer's text are described by what they were about
+    topic = _topic(_response_data(turn))
+    return user, f"(answered about {topic})" if topic else "(no answer)"
+
+
+def _clip(text: str, chars: int) -> str:
+    """The text cut to at most chars characters, ending in "…" when it was cut."""
+    if len(text) <= chars:
+        return text
+    return text[:chars - 1] + "…" if chars > 0 else ""
+
+
+class HistoryManager:
+    """
+    Keeps a user's conversation as a session and fits it into smart-response prompts.
+
+    Sessions are stored in the context store in the format of data/contexts/<session_id>.json.
+    A prompt quotes the last max_turns turns, newest first, as long as they fit in
+    token_budget. Older turns are described by a one-line summary, built locally from the
+    module, submodule and entities of their stored response_data, so a prompt stays the
+    same size however long the session grows. Stored history is capped at
+    max_stored_turns; turns dropped from it are folded into the stored summary.
+    """
+
+    def __init__(self, max_turns: int = 6, token_budget: int = 600, max_stored_turns: int = 50,
+                 model: Optional[str] = None):
+        self.max_turns = max(1, max_turns)
+        self.token_budget = token_budget
+        self.max_stored_turns = max(self.max_turns, max_stored_turns)
+        self.model = model
+
+    def record(self, session: Dict[str, Any], raw_text: str, content: str,
+               nlp_result: Dict[str, Any], flow_type: Optional[str]) -> Dict[str, Any]:
+        """
+        The session with one more turn. The session given is left as it is, since it may
+        be shared with the context store's cache.
+        """
+        now = datetime.now().isoformat()
+        module = nlp_result.get("module") or {}
+        submodule = nlp_result.get("sub_module") or {}
+        entities = _plain(nlp_result.get("entities") or {})
+        response_data = {
+            "moduleCode": module.get("moduleCode", ""),
+            "moduleName": module.get("moduleName", ""),
+            "submoduleCode": submodule.get("submoduleCode", ""),
+            "submoduleName": submodule.get("submoduleName", ""),
+            "flow": flow_type,
+            "entities": entities,
+            "raw_text": raw_text,
+            "session_id": session["session_id"]
+        }
+        history = session["history"] + [
+            {"timestamp": now, "text": raw_text, "is_user": True, "response_data": None},
+            {"timestamp": now, "text": content, "is_user": False, "response_data": response_data}
+        ]
+        return self.compact({
+            **session,
+            "last_updated": now,
+            "history": history,
+            "entities": {**session.get("entities", {}), **entities},
+            "current_module": response_data["moduleCode"] or None,
+            "current_submodule": response_data["submoduleCode"] or None,
+            "current_flow": flow_type
+        })
+
+    def compact(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The session with at most max_stored_turns turns, older ones folded into its
+        summary; the session itself if it is within the cap.
+        """
+        turns = _turns(session.get("history") or [])
+        if len(turns) <= self.max_stored_turns:
+            return session
+        dropped = len(turns) - self.max_stored_turns
+        return {
+            **session,
+            "history": [entry for turn in turns[dropped:] for entry in turn],
+            "summary": fold_summary(session.get("summary"), turns[:dropped])
+        }
+
+    def window(self, session: Optional[Dict[str, Any]]) -> Tuple[str, List[Tuple[str, str]]]:
+        """The summary of older turns and the (user, assistant) texts of the turns quoted."""
+        if not session:
+            return "", []
+        turns = _turns(session["history"])
+        if not turns:
+            return render_summary(session.get("summary")), []
+        # The header and the line breaks between the summary and the quoted turns count too
+        budget = self.token_budget - estimate_tokens(HISTORY_HEADER + "\n" * (2 * self.max_turns + 3), self.model)
+        candidates = [_render_turn(turn) for turn in turns[-self.max_turns:]]
+        costs = [estimate_tokens(f"User: {user}\nAssistant: {answer}", self.model) for user, answer in candidates]
+
+        def summary_of_older(quoted: int) -> Tuple[str, int]:
+            summary = render_summary(fold_summary(session.get("summary"), turns[:len(turns) - quoted]))
+            return summary, estimate_tokens(summary, self.model) if summary else 0
+
+        # The newest turn is always quoted; older ones while they and the summary fit
+        quoted = 1
+        summary, summary_cost = summary_of_older(1)
+        for count in range(2, len(candidates) + 1):
+            wider, wider_cost = summary_of_older(count)
+            if sum(costs[-count:]) + wider_cost > budget:
+                break
+            quoted, summary, summary_cost = count, wider, wider_cost
+
+        window = candidates[-quoted:]
+        if summary_cost + costs[-1] > budget:
+            # The newest turn alone is over the budget: the summary gets at most half of
+            # it, and the user's text and the answer are clipped to the rest
+            if summary_cost > budget // 2:
+                summary = self._clip_to(lambda text: text, (summary,), budget // 2)[0]
+                summary_cost = estimate_tokens(summary, self.model) if summary else 0
+            render = lambda user, answer: f"User: {user}\nAssistant: {answer}"
+            window[-1] = self._clip_to(render, window[-1], budget - summary_cost)
+            if estimate_tokens(render(*window[-1]), self.model) > budget - summary_cost:
+                # Too small a budget to quote even part of a turn
+                window = []
+        return summary, window
+
+    def _clip_to(self, render, texts: Tuple[str, ...], budget: int) -> Tuple[str, ...]:
+        """
+        The texts clipped so that render(*texts) is at most budget tokens. Each text gets
+        an equal share of the room, and what a shorter one leaves goes to the others.
+        """
+        chars = budget * CHARS_PER_TOKEN
+        while True:
+            shares, left = {}, chars
+            for index in sorted(range(len(texts)), key=lambda index: len(texts[index])):
+                shares[index] = min(len(texts[index]), left // (len(texts) - len(shares)))
+                left -= shares[index]
+            clipped = tuple(_clip(text, shares[index]) for index, text in enumerate(texts))
+            cost = estimate_tokens(render(*clipped), self.model)
+            if cost <= budget or chars <= 0:
+                return clipped
+            chars = min(chars - 1, chars * budget // cost)
+
+    def prompt_context(self, session: Optional[Dict[str, Any]]) -> str:
+        """The conversation so far, for the start of a prompt, or "" for a new conversation."""
+        summary, quoted = self.window(session)
+        if not summary and not quoted:
+            return ""
+        lines = [HISTORY_HEADER]
+        if summary:
+            lines.append(summary)
+        for user, answer in quoted:
+            lines.append(f"User: {user}")
+            lines.append(f"Assistant: {answer}")
+        return "\n".join(lines) + "\n\n"
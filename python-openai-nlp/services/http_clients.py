@@ -0,0 +1,165 @@
+from typing import Dict, Any, Optional
+import importlib.util
+import logging
+import httpx
+from openai import AsyncOpenAI
+from config import Settings
+from services.llm_cassette import Cassette, CassetteClient, REPLAY
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionMetrics:
+    """
+    Counts requests and new connections of one httpx client.
+
+    httpcore reports connection setup through the "trace" request extension, so every
+    request that does not open a TCP connection reused a pooled one.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+
+    async def on_request(self, request: httpx.Request) -> None:
+        """httpx request hook that attaches the trace callback."""
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+        elif event_name == "http2.send_request_headers.started":
+            self.http2_requests += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the counters and the share of requests served on a reused connection."""
+        reused = max(0, self.requests - self.connections_opened)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "http2_requests": self.http2_requests,
+            "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0
+        }
+
+
+class HTTPClientRegistry:
+    """
+    Application-scoped HTTP clients shared by every service.
+
+    One pooled client talks to OpenAI and one to the backend at external_api_base_url, so
+    connections (and their TLS sessions) are kept alive across requests and services
+    instead of every service, or every call, opening a pool of its own. Close the registry
+    on application shutdown.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None):
+        self.settings = settings or Settings()
+        self.limits = httpx.Limits(
+            max_connections=self.settings.http_max_connections,
+            max_keepalive_connections=self.settings.http_max_keepalive_connections,
+            keepalive_expiry=self.settings.http_keepalive_expiry_seconds
+        )
+        self.http2 = self.settings.http2_enabled and self._http2_available()
+        self.openai_metrics = ConnectionMetrics()
+        self.api_metrics = ConnectionMetrics()
+        self._openai: Optional[Any] = None
+        self._api: Optional[httpx.AsyncClient] = None
+
+    def _http2_available(self) -> bool:
+        """HTTP/2 needs the optional h2 package."""
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            return False
+        return True
+
+    def _build_client(self, metrics: ConnectionMetrics, read_timeout: float, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            limits=self.limits,
+            http2=self.http2,
+            timeout=httpx.Timeout(read_timeout, connect=self.settings.http_connect_timeout_seconds),
+            event_hooks={"request": [metrics.on_request]},
+            **kwargs
+        )
+
+    @property
+    def openai(self) -> Any:
+        """
+        The shared OpenAI client.
+
+        With LLM_CASSETTE_MODE set, it is wrapped in a CassetteClient that records its
+        completions or, in replay mode, replaces it altogether.
+        """
+        if self._openai is None:
+            mode = self.settings.llm_cassette_mode
+            client = None
+            if mode != REPLAY:
+                client = AsyncOpenAI(
+                    api_key=self.settings.openai_api_key,
+                    base_url=self.settings.openai_base_url,
+                    # Retries are made by the LLM gateway, within the request's deadline
+                    max_retries=0,
+                    http_client=self._build_client(self.openai_metrics, self.settings.openai_timeout_seconds)
+                )
+            if mode in ("", "off"):
+                self._openai = client
+            else:
+                logger.info(f"LLM cassette {mode} mode with {self.settings.llm_cassette_path}")
+                self._openai = CassetteClient(
+                    Cassette(self.settings.llm_cassette_path),
+                    mode,
+                    client=client,
+                    latency_scale=self.settings.llm_cassette_latency_scale
+                )
+        return self._openai
+
+    @property
+    def api(self) -> httpx.AsyncClient:
+        """The shared client for the backend API at external_api_base_url."""
+        if self._api is None:
+            self._api = self._build_client(
+                self.api_metrics,
+                self.settings.external_api_timeout_seconds,
+                base_url=self.settings.external_api_base_url
+            )
+        return self._api
+
+    async def aclose(self) -> None:
+        """Close every pooled connection."""
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+        if self._api is not None:
+            await self._api.aclose()
+            self._api = None
+        logger.info("Closed shared HTTP clients")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return connection reuse counters per client."""
+        return {
+            "http2": self.http2,
+            "openai": self.openai_metrics.stats(),
+            "api": self.api_metrics.stats(),
+            "cassette": self._openai.stats() if isinstance(self._openai, CassetteClient) else None
+        }
+
+
+_registry: Optional[HTTPClientRegistry] = None
+
+
+def get_http_clients(settings: Optional[Settings] = None) -> HTTPClientRegistry:
+    """
+    Return the process-wide HTTP client registry, creating it on first use.
+
+    Args:
+        settings: Settings to configure the registry with if it does not exist yet
+    """
+    global _registry
+    if _registry is None:
+        _registry = HTTPClientRegistry(settings)
+    return _registry
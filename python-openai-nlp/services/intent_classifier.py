@@ -0,0 +1,229 @@
+from typing import Dict, Any, List, Optional, Set
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+# Filler words that carry no routing information
+STOPWORDS = {
+    "a", "an", "the", "my", "me", "i", "i'd", "i'm", "please", "pls", "kindly", "can", "could",
+    "would", "will", "you", "want", "like", "need", "to", "for", "of", "on", "in", "at", "and",
+    "is", "are", "what", "what's", "whats", "do", "have", "all", "our", "your",
+    "check", "tell", "give", "know", "let", "us", "now", "user", "just", "about", "api"
+}
+
+# Verbs that ask to display something; a bare "show my cards" means the module's list submodule
+DISPLAY_VERBS = {"show", "list", "view", "display", "see", "get", "fetch", "find"}
+
+# Commands that need real language understanding are always left to the LLM
+LLM_ONLY_WORDS = {"not", "don't", "dont", "never", "no", "stop", "how", "why", "if", "when", "which", "or", "but"}
+
+# Submodules that move money use the TRANSFER flow even outside the TRF module
+TRANSFER_SUBMODULES = {"BILL_PAY", "BILL_AUTOPAY", "BILL_AUTOPAY_UPDATE", "LOAN_PAYMENT"}
+
+
+def stem(token: str) -> str:
+    """Reduce a token to a crude singular form so "cards" and "card" share a term."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def default_flow(module_code: str, submodule_code: str) -> str:
+    """Decide the flow type of a submodule from the mappings alone."""
+    if module_code == "TRF" or submodule_code in TRANSFER_SUBMODULES:
+        return "TRANSFER"
+    if module_code == "ANALYTICS":
+        return "ANALYTICS"
+    return "QUERY"
+
+
+class IntentMatch:
+    """The best local match for a command."""
+
+    def __init__(self, module_code: str, submodule_code: str, flow: str, confidence: float, entities: Dict[str, Any]):
+        self.module_code = module_code
+        self.submodule_code = submodule_code
+        self.flow = flow
+        self.confidence = confidence
+        self.entities = entities
+
+
+class LocalIntentClassifier:
+    """
+    Rule-based pre-classifier built from the module mappings.
+
+    Every submodule gets a term set from its name, its endpoint path and its module name.
+    Terms are weighted by how rare they are across submodules, so "balance" counts for much
+    more than "account". A command is scored against every submodule by how much of the
+    command is explained by the submodule (precision) and how much of the submodule name
+    appears in the command (recall). Words matching a property enum of the module, such as
+    "debit" for cardType, are extracted as entities instead of being scored.
+    """
+
+    def __init__(self, module_mappings: Dict[str, Any], module_properties: Dict[str, Dict[str, Any]]):
+        self.module_terms: Dict[str, Set[str]] = {}
+        self.enum_values: Dict[str, Dict[str, Any]] = {}
+        self.submodules: List[Dict[str, Any]] = []
+
+        for module_code, module_data in module_mappings.items():
+            module_nouns = {stem(t) for t in tokenize(module_data.get("moduleName", ""))} | {module_code.lower()}
+            self.module_terms[module_code] = module_nouns
+            self.enum_values[module_code] = self._build_enum_values(module_properties.get(module_code, {}))
+
+            for submodule in module_data.get("submodules", []):
+                if not isinstance(submodule, dict) or "submoduleCode" not in submodule:
+                    continue
+                name_terms = {stem(t) for t in tokenize(submodule.get("submoduleName", ""))} - STOPWORDS
+                endpoint = submodule.get("endpoint") or ""
+                endpoint_terms = {
+                    stem(t) for segment in endpoint.split("/") if segment and not segment.startswith(":")
+                    for t in tokenize(segment)
+                } - STOPWORDS
+                self.submodules.append({
+                    "module_code": module_code,
+                    "submodule_code": submodule["submoduleCode"],
+                    # Recall is measured on the distinctive part of the name only
+                    "name_terms": name_terms - module_nouns,
+                    "terms": name_terms | endpoint_terms | module_nouns
+                })
+
+        # Inverse document frequency over submodules
+        submodule_count = len(self.submodules)
+        document_frequency: Dict[str, int] = {}
+        for submodule in self.submodules:
+            for term in submodule["terms"]:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        self.weights = {
+            term: math.log(1 + submodule_count / count) for term, count in document_frequency.items()
+        }
+        # Words the mappings know nothing about count as heavily as the rarest term
+        self.unknown_weight = math.log(1 + submodule_count)
+
+    def _build_enum_values(self, properties: Dict[str, Any]) -> Dict[str, Any]:
+        """Map lowercase enum spellings to (property, value) pairs."""
+        values = {}
+        for prop_name, prop_data in properties.items():
+            for enum_value in prop_data.get("enum", []):
+                values[str(enum_value).lower()] = (prop_name, enum_value)
+        return values
+
+    def _match_enum(self, module_code: str, token: str) -> Optional[tuple]:
+        """Match a token against the enum values of a module ("savings" -> SAV)."""
+        enum_values = self.enum_values.get(module_code, {})
+        if token in enum_values:
+            return enum_values[token]
+        for spelling, value in enum_values.items():
+            # Three letter codes such as SAV and CUR are abbreviations of the spoken word
+            if len(spelling) == 3 and token.startswith(spelling):
+                return value
+        return None
+
+    def classify(self, text: str, strict: bool = True) -> Optional[IntentMatch]:
+        """
+        Score the command against every submodule.
+
+        Args:
+            text: The command
+            strict: Give up on commands that need the LLM. Without it, such commands are
+                still routed, but values the LLM would extract are missing from the entities.
+
+        Returns:
+            Optional[IntentMatch]: The best match with its confidence, or None when nothing
+            matches or, if strict, the command carries values (numbers, names) or phrasing
+            that needs the LLM
+        """
+        if strict and any(ch.isdigit() for ch in text):
+            return None
+        # Capitalized words after the first are likely names the LLM has to extract
+        if strict and any(word[:1].isupper() and not word.isupper() for word in text.split()[1:]):
+            return None
+
+        tokens = tokenize(text)
+        if not tokens or (strict and any(token in LLM_ONLY_WORDS for token in tokens)):
+            return None
+
+        content = [stem(t) for t in tokens if t not in STOPWORDS and t not in DISPLAY_VERBS]
+        has_display_verb = any(t in DISPLAY_VERBS for t in tokens)
+
+        scored = []
+        for submodule in self.submodules:
+            module_code = submodule["module_code"]
+            entities = {}
+            terms = []
+            for token in content:
+                enum_match = self._match_enum(module_code, token)
+                if enum_match:
+                    entities[enum_match[0]] = enum_match[1]
+                else:
+                    terms.append(token)
+
+            # "show my cards" only names the module, which means list it
+            if has_display_verb and terms and set(terms) <= self.module_terms[module_code]:
+                terms.append("list")
+            if not terms:
+                continue
+
+            score = self._score(set(terms), submodule)
+            if score == 0 and not strict:
+                # Without the submodule's distinctive words, fall back to the share of the
+                # command the submodule explains, well below any proper match
+                score = 0.1 * self._precision(set(terms), submodule)
+            if score > 0:
+                scored.append((score, submodule, entities))
+
+        if not scored:
+            return None
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        best_score, best, entities = scored[0]
+        second_score = scored[1][0] if len(scored) > 1 else 0.0
+
+        # Penalize ambiguity between the two best submodules
+        margin = (best_score - second_score) / best_score
+        confidence = round(best_score * min(1.0, 0.5 + margin), 4)
+
+        module_code = best["module_code"]
+        submodule_code = best["submodule_code"]
+        return IntentMatch(
+            module_code=module_code,
+            submodule_code=submodule_code,
+            flow=default_flow(module_code, submodule_code),
+            confidence=confidence,
+            entities=entities
+        )
+
+    def _precision(self, terms: Set[str], submodule: Dict[str, Any]) -> float:
+        """Weighted share of the command terms found among a submodule's terms."""
+        matched = terms & submodule["terms"]
+        if not matched:
+            return 0.0
+        matched_weight = sum(self.weights[t] for t in matched)
+        text_weight = sum(self.weights.get(t, self.unknown_weight) for t in terms)
+        return matched_weight / text_weight
+
+    def _score(self, terms: Set[str], submodule: Dict[str, Any]) -> float:
+        """F-measure of the command terms against a submodule's terms."""
+        precision = self._precision(terms, submodule)
+        if precision == 0:
+            return 0.0
+
+        name_terms = submodule["name_terms"]
+        if name_terms:
+            recall = sum(self.weights[t] for t in name_terms & terms) / sum(self.weights[t] for t in name_terms)
+        else:
+            recall = 1.0
+
+        if precision + recall == 0:
+            return 0.0
+        return 2 * precision * recall / (precision + recall)
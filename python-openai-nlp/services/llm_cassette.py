@@ -0,0 +1,192 @@
+from typing import Dict, Any, List, Optional, AsyncIterator
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Request arguments that do not change the completion and are left out of fingerprints
+UNFINGERPRINTED = {"timeout", "stream_options", "extra_headers", "user"}
+
+# Today's date is part of some prompts; recordings should replay on any day
+DATE_PATTERN = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+
+
+class CassetteMissError(Exception):
+    """A replayed request was never recorded."""
+
+
+def fingerprint(kwargs: Dict[str, Any]) -> str:
+    """A stable hash of the arguments of a chat completion request."""
+    request = {key: value for key, value in kwargs.items() if key not in UNFINGERPRINTED}
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(DATE_PATTERN.sub("<date>", canonical).encode("utf-8")).hexdigest()[:32]
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Cassette:
+    """
+    Recorded completions on disk, one JSON line per completion.
+
+    Each line holds the request fingerprint, the recorded latency and either the
+    completion or, for streamed completions, the chunks with their delays. None values
+    are dropped, and paths ending in .gz are gzip-compressed. Lines are appended as they
+    are recorded, so an interrupted recording keeps everything recorded so far.
+
+    Completions recorded more than once for the same fingerprint are replayed in the
+    order they were recorded, starting over after the last one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._next: Dict[str, int] = {}
+        if os.path.exists(path):
+            with _open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["fp"], []).append(entry)
+            logger.info(f"Loaded {len(self)} recorded completions from {path}")
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.entries.values())
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        self.entries.setdefault(entry["fp"], []).append(entry)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _open(self.path, "a") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def next(self, key: str) -> Optional[Dict[str, Any]]:
+        entries = self.entries.get(key)
+        if not entries:
+            return None
+        index = self._next.get(key, 0)
+        self._next[key] = index + 1
+        return entries[index % len(entries)]
+
+
+class _Completions:
+    def __init__(self, owner: "CassetteClient"):
+        self._owner = owner
+
+    async def create(self, **kwargs) -> Any:
+        return await self._owner.create(kwargs)
+
+
+class _Chat:
+    def __init__(self, owner: "CassetteClient"):
+        self.completions = _Completions(owner)
+
+
+class CassetteClient:
+    """
+    Records or replays the completions of an OpenAI client.
+
+    It stands in for the shared AsyncOpenAI client (client.chat.completions.create).
+    In record mode every completion is passed through to the real client and stored in
+    the cassette with its latency. In replay mode completions are served from the
+    cassette, after the recorded latency times latency_scale (0 replays instantly), and
+    no request leaves the process. Requests missing from the cassette raise
+    CassetteMissError.
+    """
+
+    def __init__(self, cassette: Cassette, mode: str, client: Optional[Any] = None, latency_scale: float = 1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == RECORD and client is None:
+            raise ValueError("Recording needs a client to pass requests to")
+        self.cassette = cassette
+        self.mode = mode
+        self.client = client
+        self.latency_scale = latency_scale
+        self.chat = _Chat(self)
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    async def create(self, kwargs: Dict[str, Any]) -> Any:
+        key = fingerprint(kwargs)
+        if self.mode == RECORD:
+            return await self._record(key, kwargs)
+        return await self._replay(key, kwargs)
+
+    async def _record(self, key: str, kwargs: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(**kwargs)
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if kwargs.get("stream"):
+            return self._record_stream(key, response, started, latency_ms)
+        self.cassette.append({
+            "fp": key,
+            "latency_ms": latency_ms,
+            "response": response.model_dump(exclude_none=True)
+        })
+        self.recorded += 1
+        return response
+
+    async def _record_stream(self, key: str, stream: Any, started: float, latency_ms: float) -> AsyncIterator[Any]:
+        chunks = []
+        last = time.perf_counter()
+        async for chunk in stream:
+            now = time.perf_counter()
+            chunks.append([round((now - last) * 1000, 1), chunk.model_dump(exclude_none=True)])
+            last = now
+            yield chunk
+        self.cassette.append({"fp": key, "latency_ms": latency_ms, "chunks": chunks})
+        self.recorded += 1
+
+    async def _replay(self, key: str, kwargs: Dict[str, Any]) -> Any:
+        from openai.types.chat import ChatCompletion
+
+        entry = self.cassette.next(key)
+        if entry is None:
+            self.misses += 1
+            raise CassetteMissError(f"No recorded completion for request {key}")
+        self.replayed += 1
+        await self._sleep(entry["latency_ms"])
+        if "chunks" in entry:
+            return self._replay_stream(entry["chunks"])
+        return ChatCompletion.model_validate(entry["response"])
+
+    async def _replay_stream(self, chunks: List[List[Any]]) -> AsyncIterator[Any]:
+        from openai.types.chat import ChatCompletionChunk
+
+        for delay_ms, chunk in chunks:
+            await self._sleep(delay_ms)
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    async def _sleep(self, milliseconds: float) -> None:
+        if self.latency_scale > 0 and milliseconds > 0:
+            await asyncio.sleep(milliseconds * self.latency_scale / 1000.0)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the cassette mode and its counters."""
+        return {
+            "mode": self.mode,
+            "path": self.cassette.path,
+            "entries": len(self.cassette),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses
+        }
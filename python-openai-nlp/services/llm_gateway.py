@@ -0,0 +1,430 @@
+from typing import Dict, Any, Optional, Iterator
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import logging
+import random
+import re
+import time
+import openai
+from config import Settings
+from services.http_clients import get_http_clients
+from services.adaptive_limiter import AdaptiveLimiter, OverloadedError, SUCCESS, DROPPED, IGNORED
+from services.metrics import stage, record_usage
+
+logger = logging.getLogger(__name__)
+
+# Absolute time.monotonic() by which the current request must be answered
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_request_deadline", default=None)
+
+# Errors worth another attempt: timeouts, dropped connections, rate limits and 5xx responses
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+# Upstream signals that it is overloaded; the concurrency limit is lowered on these
+OVERLOAD_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+# Our own timeout and the client's; an overload signal only when the attempt had its full timeout
+TIMEOUT_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError
+)
+
+# Durations such as "1s", "250ms" or "6m0s" in OpenAI's x-ratelimit-reset-* headers
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# Latest successful latencies kept to estimate the p95 used as the hedge delay
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class LLMUnavailableError(Exception):
+    """The LLM could not answer within the request's budget; callers should fall back locally."""
+
+
+class DeadlineExceededError(LLMUnavailableError):
+    """The request's deadline budget ran out."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """The circuit breaker is open after repeated upstream failures."""
+
+
+@contextmanager
+def deadline_scope(budget_seconds: float) -> Iterator[None]:
+    """
+    Give every LLM call made inside the block a shared deadline.
+
+    Nested scopes can only shorten the deadline, never extend it.
+    """
+    deadline = time.monotonic() + budget_seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left until the current request's deadline, or None if there is none."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive upstream failures so calls fail fast instead of queueing.
+
+    While open, calls are rejected until reset_seconds have passed; then a single trial
+    call is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Check whether a call may be made now."""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Let another trial call through after one ended without an outcome."""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("LLM circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class CompletionStream:
+    """
+    A streamed completion, holding its concurrency slot until it is read to the end or closed.
+
+    The upstream keeps generating until then, so the call still counts against the limit
+    after the response headers have arrived. Callers must close the stream when they
+    stop reading it early.
+    """
+
+    def __init__(self, stream: Any, limiter: Optional[AdaptiveLimiter] = None, latency: Optional[float] = None):
+        self._stream = stream
+        self._limiter = limiter
+        self._latency = latency
+
+    def __aiter__(self) -> "CompletionStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            return await self._stream.__anext__()
+        except StopAsyncIteration:
+            self._release(SUCCESS)
+            raise
+        except BaseException:
+            self._release(IGNORED)
+            raise
+
+    async def close(self) -> None:
+        """Stop reading: free the slot and close the connection."""
+        self._release(IGNORED)
+        close = getattr(self._stream, "close", None) or getattr(self._stream, "aclose", None)
+        if close is not None:
+            await close()
+
+    def _release(self, outcome: str) -> None:
+        if self._limiter is not None:
+            limiter, self._limiter = self._limiter, None
+            limiter.release(outcome, self._latency)
+
+
+class LLMGateway:
+    """
+    The single path through which every chat completion is made.
+
+    Each call is bounded by the deadline of the request it belongs to (see
+    deadline_scope). Failed attempts are retried with jittered exponential backoff, but
+    only while enough budget remains. With hedging enabled, a second identical request
+    is sent if the first has not answered within the recent p95 latency, and whichever
+    answers first wins. Repeated failures open a circuit breaker so that callers fail
+    fast with LLMUnavailableError and can use their local fallbacks.
+    """
+
+    def __init__(self, client: Optional[Any] = None, settings: Optional[Settings] = None):
+        # Without an explicit client, the shared OpenAI client is used
+        self.client = client
+        self.settings = settings or Settings()
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.settings.llm_circuit_failure_threshold,
+            reset_seconds=self.settings.llm_circuit_reset_seconds
+        )
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.limiter = AdaptiveLimiter(
+            initial_limit=self.settings.llm_limiter_initial_limit,
+            min_limit=self.settings.llm_limiter_min_limit,
+            max_limit=self.settings.llm_limiter_max_limit,
+            backoff_ratio=self.settings.llm_limiter_backoff_ratio,
+            latency_tolerance=self.settings.llm_limiter_latency_tolerance,
+            max_queue=self.settings.llm_limiter_max_queue,
+            queue_timeout=self.settings.llm_limiter_queue_timeout_ms / 1000.0
+        ) if self.settings.llm_limiter_enabled else None
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+        self.deadline_exceeded = 0
+
+    async def create(self, **kwargs) -> Any:
+        """
+        Make a chat completion with the arguments of client.chat.completions.create.
+
+        A streamed completion is returned as a CompletionStream, which the caller reads
+        within the request's deadline and closes.
+
+        Raises:
+            LLMUnavailableError: If the circuit is open or the deadline ran out
+            OverloadedError: If the concurrency limiter shed the call
+        """
+        with stage("llm"):
+            response = await self._create(kwargs)
+        # Streamed completions report their usage in the last chunk, read by the caller
+        if not kwargs.get("stream"):
+            record_usage(getattr(response, "usage", None))
+        return response
+
+    async def _create(self, kwargs: Dict[str, Any]) -> Any:
+        """Attempt the completion until it succeeds, the budget runs out or the circuit opens."""
+        self.calls += 1
+        max_attempts = self.settings.llm_max_retries + 1
+        last_error: Optional[Exception] = None
+
+        for attempt in range(max_attempts):
+            if not self.breaker.allow():
+                self.short_circuited += 1
+                raise CircuitOpenError("LLM circuit breaker is open") from last_error
+
+            if self._out_of_budget():
+                self.breaker.release()
+                self.deadline_exceeded += 1
+                raise DeadlineExceededError("Request deadline exceeded before the LLM answered") from last_error
+            timeout = self.settings.llm_attempt_timeout_seconds
+            remaining = remaining_budget()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+
+            self.attempts += 1
+            try:
+                response = await self._attempt(kwargs, timeout)
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                if isinstance(e, TIMEOUT_ERRORS):
+                    self.timeouts += 1
+                self.breaker.record_failure()
+                logger.warning(f"LLM attempt {attempt + 1}/{max_attempts} failed: {type(e).__name__}: {str(e)}")
+            except (asyncio.CancelledError, OverloadedError):
+                self.breaker.release()
+                raise
+            except Exception:
+                # The upstream answered, just not with a completion (e.g. a 400)
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                return response
+
+            if attempt + 1 < max_attempts:
+                delay = self._backoff(attempt)
+                remaining = remaining_budget()
+                if remaining is not None and remaining - delay <= self.settings.llm_min_attempt_seconds:
+                    # Not enough budget left for another attempt to be useful
+                    break
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+        if self._out_of_budget():
+            self.deadline_exceeded += 1
+            raise DeadlineExceededError("Request deadline exceeded before the LLM answered") from last_error
+        raise LLMUnavailableError(f"LLM unavailable after {attempt + 1} attempts") from last_error
+
+    def _out_of_budget(self) -> bool:
+        """Check whether too little of the deadline is left to start an attempt."""
+        remaining = remaining_budget()
+        return remaining is not None and remaining <= self.settings.llm_min_attempt_seconds
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        base = self.settings.llm_retry_base_delay_ms / 1000.0
+        cap = self.settings.llm_retry_max_delay_ms / 1000.0
+        return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+    async def _attempt(self, kwargs: Dict[str, Any], timeout: float) -> Any:
+        """One attempt, hedged unless it is a streamed completion."""
+        if not self.settings.llm_hedging_enabled or kwargs.get("stream"):
+            return await self._call(kwargs, timeout)
+
+        started = time.monotonic()
+        first = asyncio.ensure_future(self._call(kwargs, timeout))
+        second = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=min(self._hedge_delay(), timeout))
+            if done:
+                return first.result()
+
+            self.hedges += 1
+            second = asyncio.ensure_future(self._call(kwargs, timeout - (time.monotonic() - started)))
+            pending = {first, second}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _call(self, kwargs: Dict[str, Any], timeout: float) -> Any:
+        """Send a single request bounded by the timeout, within the concurrency limit."""
+        client = self.client or get_http_clients(self.settings).openai
+        if self.limiter is not None:
+            # Time spent queued for a slot counts against the attempt
+            timeout -= await self.limiter.acquire(timeout)
+        started = time.monotonic()
+        outcome = IGNORED
+        held = False
+        try:
+            response = await asyncio.wait_for(
+                client.chat.completions.create(**kwargs, timeout=timeout),
+                timeout=timeout
+            )
+            outcome = SUCCESS
+            if kwargs.get("stream"):
+                # The slot is released when the stream is read to the end or closed
+                response = CompletionStream(response, self.limiter, time.monotonic() - started)
+                held = self.limiter is not None
+        except TIMEOUT_ERRORS:
+            # A timeout cut short by the request's deadline says nothing about the upstream
+            if timeout >= self.settings.llm_attempt_timeout_seconds:
+                outcome = DROPPED
+            raise
+        except OVERLOAD_ERRORS as e:
+            outcome = DROPPED
+            retry_after = retry_after_seconds(e)
+            if retry_after and self.limiter is not None:
+                self.limiter.pause(retry_after)
+            raise
+        finally:
+            latency = time.monotonic() - started
+            if self.limiter is not None and not held:
+                self.limiter.release(outcome, latency)
+        self._latencies.append(latency)
+        return response
+
+    def _hedge_delay(self) -> float:
+        """The recent p95 latency, or the configured delay until there are enough samples."""
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return self.settings.llm_hedge_delay_ms / 1000.0
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return gateway counters and the circuit state."""
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": round(self._hedge_delay() * 1000, 1),
+            "short_circuited": self.short_circuited,
+            "deadline_exceeded": self.deadline_exceeded,
+            "limiter": self.limiter.stats() if self.limiter is not None else None,
+            "circuit": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "times_opened": self.breaker.times_opened
+            }
+        }
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read how long the upstream asked us to back off from a rate limit response."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # An HTTP date; fall through to the rate limit reset headers
+        pass
+    resets = [
+        sum(float(amount) * DURATION_SECONDS[unit] for amount, unit in DURATION_PART.findall(value))
+        for value in (headers.get("x-ratelimit-reset-requests"), headers.get("x-ratelimit-reset-tokens"))
+        if value
+    ]
+    return max(resets) if resets else None
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway(settings: Optional[Settings] = None) -> LLMGateway:
+    """
+    Return the process-wide LLM gateway, creating it on first use.
+
+    Args:
+        settings: Settings to configure the gateway with if it does not exist yet
+    """
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway(settings=settings)
+    return _gateway
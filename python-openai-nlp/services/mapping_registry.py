@@ -0,0 +1,132 @@
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import logging
+import os
+from models.smart_text_models import Module, SubModule
+from services.intent_classifier import default_flow
+from services.prompt_compiler import fingerprint_mapping_files
+
+logger = logging.getLogger(__name__)
+
+
+class MappingRegistry:
+    """
+    The parsed contents of the mapping directory.
+
+    Every mapping file is read once, both to parse it and to fingerprint the mapping
+    version, and the result is shared by all services instead of each service parsing
+    the files on its own.
+
+    Modules and submodules are indexed by moduleCode, submoduleCode and endpoint, and
+    validated once into frozen Module/SubModule models that the request path can return
+    as they are.
+    """
+
+    def __init__(self, mapping_dir: str = "mapping"):
+        self.mapping_dir = mapping_dir
+        self.modules: List[Dict[str, Any]] = []
+        self.module_mappings: Dict[str, Dict[str, Any]] = {}
+        self.module_properties: Dict[str, Dict[str, Any]] = {}
+        self.version = ""
+        self.modules_by_code: Dict[str, Module] = {}
+        self.submodules_by_code: Dict[str, SubModule] = {}
+        self.submodules_by_endpoint: Dict[str, List[SubModule]] = {}
+        self._submodule_entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._submodule_modules: Dict[str, str] = {}
+        self.flows_by_submodule: Dict[str, str] = {}
+        self.flows_by_module: Dict[str, str] = {}
+        self._load()
+        self._build_indexes()
+
+    def _load(self) -> None:
+        """Load all module mappings and their entity properties from the mapping directory."""
+        try:
+            files = {}
+            for file_name in os.listdir(self.mapping_dir):
+                if file_name.endswith(".json"):
+                    with open(os.path.join(self.mapping_dir, file_name), "rb") as f:
+                        files[file_name] = f.read()
+            self.version = fingerprint_mapping_files(files)
+
+            # Load index file
+            self.modules = json.loads(files["index.json"])
+
+            # Load individual module mappings
+            for module in self.modules:
+                module_data = json.loads(files[module["mappingFile"]])
+                self.module_mappings[module["moduleCode"]] = {
+                    **module,
+                    "submodules": module_data.get("submodules", [])
+                }
+                self.module_properties[module["moduleCode"]] = module_data.get("properties", {})
+            logger.info(f"Loaded {len(self.module_mappings)} module mappings from {self.mapping_dir}")
+        except Exception as e:
+            logger.error(f"Error loading module mappings: {str(e)}")
+            raise
+
+    def _build_indexes(self) -> None:
+        """Validate every module and submodule once and index them."""
+        for module_code, module_data in self.module_mappings.items():
+            self.modules_by_code[module_code] = Module(
+                moduleCode=module_code,
+                moduleName=module_data["moduleName"]
+            )
+            for entry in module_data["submodules"]:
+                if not isinstance(entry, dict) or "submoduleCode" not in entry:
+                    continue
+                submodule_code = entry["submoduleCode"]
+                self._submodule_entries[(module_code, submodule_code)] = entry
+                try:
+                    submodule = SubModule(**entry)
+                except Exception as e:
+                    logger.warning(f"Skipping invalid submodule {module_code}/{submodule_code}: {str(e)}")
+                    continue
+                if submodule_code in self.submodules_by_code:
+                    logger.warning(f"Duplicate submoduleCode {submodule_code} in {module_code}")
+                self.submodules_by_code[submodule_code] = submodule
+                self._submodule_modules[submodule_code] = module_code
+                if submodule.endpoint:
+                    self.submodules_by_endpoint.setdefault(submodule.endpoint, []).append(submodule)
+                self.flows_by_submodule[submodule_code] = default_flow(module_code, submodule_code)
+
+            # A module's fallback flow is the one most of its submodules use
+            module_flows = [
+                self.flows_by_submodule[entry["submoduleCode"]] for entry in module_data["submodules"]
+                if isinstance(entry, dict) and entry.get("submoduleCode") in self.flows_by_submodule
+            ]
+            self.flows_by_module[module_code] = (
+                max(set(module_flows), key=module_flows.count) if module_flows else default_flow(module_code, "")
+            )
+
+    def module(self, module_code: str) -> Optional[Module]:
+        """The Module model for a moduleCode."""
+        return self.modules_by_code.get(module_code)
+
+    def submodule(self, submodule_code: str) -> Optional[SubModule]:
+        """The SubModule model for a submoduleCode."""
+        return self.submodules_by_code.get(submodule_code)
+
+    def module_of(self, submodule_code: str) -> Optional[str]:
+        """The moduleCode a submoduleCode belongs to."""
+        return self._submodule_modules.get(submodule_code)
+
+    def submodules_for_endpoint(self, endpoint: str) -> List[SubModule]:
+        """The SubModules served by an endpoint path (e.g. "/api/cards/:cardId/pin")."""
+        return self.submodules_by_endpoint.get(endpoint, [])
+
+    def flow_for(self, module_code: str, submodule_code: Optional[str] = None) -> str:
+        """Look up the flow type of a submodule, falling back to its module's usual flow."""
+        if submodule_code and submodule_code in self.flows_by_submodule:
+            return self.flows_by_submodule[submodule_code]
+        return self.flows_by_module.get(module_code, "QUERY")
+
+    def submodule_entry(self, module_code: str, submodule_code: str) -> Optional[Dict[str, Any]]:
+        """The raw mapping entry of a submodule within a module."""
+        return self._submodule_entries.get((module_code, submodule_code))
+
+    def with_properties(self) -> Dict[str, Dict[str, Any]]:
+        """Module mappings with each module's entity properties included."""
+        return {
+            module_code: {**module_data, "properties": self.module_properties.get(module_code, {})}
+            for module_code, module_data in self.module_mappings.items()
+        }
@@ -0,0 +1,243 @@
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {value:g}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Counter):
+    """A value that can go up and down, set when the metrics are scraped."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        self.values[key] = value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        # One count per bucket, then the sum and the total count
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, state in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, state):
+                bucket_labels = _format_labels(self.label_names, key, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count:g}")
+            bucket_labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {state[-1]:g}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {state[-2]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state[-1]:g}")
+        return lines
+
+
+class MetricsRegistry:
+    """The process-wide metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _register(self, metric: Any) -> Any:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, label_names))
+
+    def gauge(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, description, label_names))
+
+    def histogram(self, name: str, description: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    "nlp_http_request_duration_seconds", "Time to answer an HTTP request", ("path", "status")
+)
+STAGE_SECONDS = registry.histogram(
+    "nlp_stage_duration_seconds", "Time spent in each stage of a request", ("stage",)
+)
+LLM_TOKENS = registry.counter(
+    "nlp_llm_tokens_total", "Completion tokens used, by module, flow and kind", ("module", "flow", "kind")
+)
+LLM_CALLS = registry.counter(
+    "nlp_llm_calls_total", "Completions made, by module and flow", ("module", "flow")
+)
+
+
+class RequestMetrics:
+    """Stage timings and token usage of one request."""
+
+    def __init__(self):
+        # Stage name -> [total seconds, occurrences], in the order stages first ran
+        self.stages: Dict[str, List[float]] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_calls = 0
+        self.module = "unknown"
+        self.flow = "unknown"
+        self.status = "500"
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        totals = self.stages.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def server_timing(self) -> str:
+        """The stages as a Server-Timing header value, in milliseconds."""
+        entries = []
+        for name, (seconds, count) in self.stages.items():
+            entry = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="{count}x"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+
+_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def track_request(path: str) -> Iterator[RequestMetrics]:
+    """
+    Collect the stages and token usage of everything run inside the block.
+
+    On exit the request duration is observed and the token usage is counted under the
+    module and flow the request was labeled with (see label_request). Set
+    request_metrics.status before leaving the block.
+    """
+    request_metrics = RequestMetrics()
+    token = _request_metrics.set(request_metrics)
+    start_time = time.perf_counter()
+    try:
+        yield request_metrics
+    finally:
+        _request_metrics.reset(token)
+        REQUEST_SECONDS.observe(time.perf_counter() - start_time, path=path, status=request_metrics.status)
+        _count_usage(request_metrics)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current request, e.g. `with stage("llm"): ...`."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start_time
+        STAGE_SECONDS.observe(seconds, stage=name)
+        request_metrics = _request_metrics.get()
+        if request_metrics is not None:
+            request_metrics.add_stage(name, seconds)
+
+
+def label_request(module: Optional[str] = None, flow: Optional[str] = None) -> None:
+    """Record the module and flow the current request was routed to."""
+    request_metrics = _request_metrics.get()
+    if request_metrics is None:
+        return
+    if module:
+        request_metrics.module = module
+    if flow:
+        request_metrics.flow = flow
+
+
+def record_usage(usage: Any) -> None:
+    """
+    Add the `usage` of a completion to the current request.
+
+    Outside a request the usage is counted right away, without a module or flow.
+    """
+    request_metrics = _request_metrics.get()
+    standalone = request_metrics is None
+    if standalone:
+        request_metrics = RequestMetrics()
+    request_metrics.llm_calls += 1
+    if usage is not None:
+        request_metrics.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        request_metrics.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+    if standalone:
+        _count_usage(request_metrics)
+
+
+def _count_usage(request_metrics: RequestMetrics) -> None:
+    if not request_metrics.llm_calls:
+        return
+    labels = {"module": request_metrics.module, "flow": request_metrics.flow}
+    LLM_CALLS.inc(request_metrics.llm_calls, **labels)
+    LLM_TOKENS.inc(request_metrics.prompt_tokens, kind="prompt", **labels)
+    LLM_TOKENS.inc(request_metrics.completion_tokens, kind="completion", **labels)
@@ -0,0 +1,97 @@
+from typing import Dict, Any, List, Set, Tuple, Awaitable, Callable, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent submissions into small batches.
+
+    Submissions are held for at most window_ms, or until max_batch_size are pending,
+    and then handed to process_batch together. Each result is delivered back to the
+    caller that submitted the matching item. Callers cancelled while waiting are
+    dropped from the batch before it is sent.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        window_ms: float = 5.0,
+        max_batch_size: int = 8
+    ):
+        self._process_batch = process_batch
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batches, referenced so the loop does not collect them while pending
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Send everything pending as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Process a batch and fan the results back out to the waiting callers."""
+        live = [(item, future) for item, future in batch if not future.done()]
+        if not live:
+            return
+
+        self.batches += 1
+        self.items += len(live)
+        try:
+            results = await self._process_batch([item for item, _ in live])
+            for (_, future), result in zip(live, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except asyncio.CancelledError:
+            for _, future in live:
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Batch of {len(live)} failed: {str(e)}")
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # No caller is left waiting, whatever ended the batch
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batch ended without a result for this item"))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batching counters."""
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0
+        }
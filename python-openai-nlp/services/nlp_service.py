@@ -1,120 +1,85 @@
-from openai import AsyncOpenAI
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Callable, Hashable, Optional
+import asyncio
+import copy
 import json
 import logging
-import httpx
-import os
 from config import Settings
 from datetime import datetime
+from services.prompt_compiler import PromptCompiler
+from services.mapping_registry import MappingRegistry
+from services.result_cache import ResultCache, normalize_command_text
+from services.template_cache import SlotTemplateCache
+from services.intent_classifier import LocalIntentClassifier
+from services.single_flight import SingleFlight
+from services.micro_batcher import MicroBatcher
+from services.streaming_json import IncrementalJSONParser
+from services.llm_gateway import get_llm_gateway, remaining_budget, LLMUnavailableError, DeadlineExceededError
+from services.adaptive_limiter import OverloadedError
+from services.metrics import stage, record_usage
 logger = logging.getLogger(__name__)
 
-class NLPService:
-    def __init__(self):
-        self.settings = Settings()
-        # Initialize with custom httpx client to avoid the proxies issue
-        self.client = AsyncOpenAI(
-            api_key=self.settings.openai_api_key,
-            http_client=httpx.AsyncClient()
-        )
-        # Load module mappings
-        self.module_mappings = self._load_module_mappings()
-        
-    def _load_module_mappings(self) -> Dict[str, Any]:
-        """Load all module mappings from the mapping directory."""
-        try:
-            # Load index file
-            with open('mapping/index.json', 'r') as f:
-                modules = json.load(f)
-            
-            # Load individual module mappings
-            mappings = {}
-            for module in modules:
-                with open(f"mapping/{module['mappingFile']}", 'r') as f:
-                    module_data = json.load(f)
-                    mappings[module['moduleCode']] = {
-                        **module,
-                        'submodules': module_data.get('submodules', [])
-                    }
-            return mappings
-        except Exception as e:
-            logger.error(f"Error loading module mappings: {str(e)}")
-            raise
-        
-    async def process_command(self, text: str) -> Dict[str, Any]:
-        """
-        Process a natural language command and extract intent and entities.
-        
-        Args:
-            text (str): The input text command
-            
-        Returns:
-            Dict[str, Any]: A dictionary containing module, submodule, entities, flow, and raw text
-        """
-        try:
-            # For QUERY flows, we'll use a combined approach with a single API call
-            result, flow = await self._combined_analysis(text)
-            
-            # Check for error response
-            if "error" in result:
-                return {
-                    "error": result["error"],
-                    "raw_text": text
-                }
-            
-            # Get the module code
-            module_code = result["module"]
-            
-            # Check if the module code is valid
-            if module_code not in self.module_mappings:
-                return {
-                    "error": f"Invalid module code: {module_code}",
-                    "raw_text": text
-                }
-                
-            # Get the complete submodule object if available
-            submodule = None
-            if "sub_module" in result and isinstance(result["sub_module"], dict) and "submoduleCode" in result["sub_module"]:
-                submodule_code = result["sub_module"]["submoduleCode"]
-                for sm in self.module_mappings[module_code]["submodules"]:
-                    if isinstance(sm, dict) and sm.get("submoduleCode") == submodule_code:
-                        submodule = sm
-                        break
-                        
-            # Construct final response
-            final_response = {
-                "module": self.module_mappings[module_code],
-                "sub_module": submodule if submodule else result.get("sub_module", {}),
-                "entities": result.get("entities", {}),
-                "flow": flow,
-                "raw_text": text
-            }
-            
-            logger.info(f"Final response: {final_response}")
-            return final_response
-            
-        except Exception as e:
-            logger.error(f"Error processing command: {str(e)}")
-            logger.error(f"Error type: {type(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return {
-                "error": str(e),
-                "raw_text": text
-            }
-    
-    async def _combined_analysis(self, text: str) -> Tuple[Dict[str, Any], str]:
-        """
-        Performs combined analysis of the text in a single API call.
-        Returns both the module/submodule/entities data and the flow type.
-        """
-        messages = [
-            {
-                "role": "system",
-                "content": self._create_combined_prompt()
-            },
-            {
-                "role": "assistant",
-                "content": """I understand. I will analyze banking commands and return structured JSON responses with appropriate entities based on the module. Here are examples across different modules:
+# Fields of the analysis that are enough to start downstream work
+ROUTE_FIELDS = {"module", "sub_module", "flow"}
+
+# Analytics-specific entity guidance
+ANALYTICS_ENTITY_GUIDE = """
+For ANALYTICS module, pay special attention to:
+
+1. Analytics Submodules:
+   - ANALYTICS_SPENDING: For spending analysis, expense trends, spending by category/merchant (e.g., "show my spending trends", "analyze my expenses")
+   - ANALYTICS_INCOME: For income analysis and income trends (e.g., "show my income analysis", "income trends")
+   - ANALYTICS_TRANSACTIONS: For transaction analysis, statements, activity (e.g., "show my transactions", "analyze my recent activity")
+   - ANALYTICS_BUDGET: For budget tracking and planning (e.g., "how am I doing on my budget", "budget analysis")
+   - ANALYTICS_INVESTMENT: For investment performance (e.g., "show my investment performance", "analyze my portfolio")
+
+2. Analytics-specific entities:
+   - year: When a specific year is mentioned (e.g., "2024" in "spending for 2024")
+   - month: When a specific month is mentioned (e.g., "January", "Jan", "01")
+   - quarter: For quarterly analysis (e.g., "Q1", "Q2", "first quarter")
+   - period: For relative time periods and ranges (e.g., "last month", "last 6 months", "since March", "year to date", "H1 2024", "FY 2023-24", "Nov 2023 to Feb 2024")
+   - category: For specific spending categories (e.g., "groceries", "entertainment")
+   - comparison: For comparative analysis (e.g., "compare", "versus", "vs")
+   - visualization: For specific visualization requests (e.g., "pie chart", "bar graph", "table")
+   - distributionType: For distribution analysis (e.g., "category", "amount_range", "time_of_day", "day_of_week", "transaction_type", "merchant", "location", "month")
+   - amountRangeBuckets: The specific amount ranges for grouping transactions (e.g., ["0-50", "51-100", "101-500", "500+"])
+   - timeOfDayRanges: The specific time ranges for grouping transactions (e.g., ["morning", "afternoon", "evening", "night"])
+
+3. Flow Determination:
+   - ALWAYS use ANALYTICS flow (not QUERY) when the user asks for:
+     - Any trends or patterns (e.g., "spending trends", "income patterns")
+     - Distribution analysis (e.g., "distribution of expenses")
+     - Comparative analysis (e.g., "compare spending across categories")
+     - Performance metrics (e.g., "budget performance", "investment performance")
+     - Insights or summaries (e.g., "insights on my spending", "financial summary")
+     - Visual representations (e.g., "show me a chart of", "graph my spending")
+     
+4. For distribution analysis with pie charts, extract these additional entities when appropriate:
+   - distributionType: The type of distribution to analyze (category, amount_range, time_of_day, day_of_week, etc.)
+   - When user mentions "pie chart of spending by category" → distributionType="category"
+   - When user mentions "distribution of transactions by amount" → distributionType="amount_range"
+   - When user mentions "breakdown of spending by time of day" → distributionType="time_of_day"
+   - When user mentions "transactions by day of week" → distributionType="day_of_week"
+"""
+
+# Transfer-specific entity guidance
+TRANSFER_ENTITY_GUIDE = """
+For TRANSFER module (TRF), pay special attention to:
+
+1. Always use consistent entity names:
+   - For recipient/beneficiary information, always use "beneficiaryName" as the entity name
+   - For amount, use "amount" as the entity name
+   - For currency, use "currency" as the entity name when explicitly mentioned
+   - For account types, use "sourceAccountType" and "targetAccountType"
+
+2. When processing transfer commands like:
+   - "Transfer $100 to John Smith" → use entities: {"amount": "100", "beneficiaryName": "John Smith", "currency": "USD"}
+   - "Send 500 euros to Alice Johnson" → use entities: {"amount": "500", "beneficiaryName": "Alice Johnson", "currency": "EUR"}
+   
+3. Never use "recipientName" - always use "beneficiaryName" instead for consistency
+"""
+
+# Few-shot examples sent as the assistant turn of the combined analysis prompt
+COMBINED_ANALYSIS_EXAMPLES = """I understand. I will analyze banking commands and return structured JSON responses with appropriate entities based on the module. Here are examples across different modules:
 
 1. For account-related queries:
 ```
@@ -245,15 +210,282 @@ For "Show my spending trends for 2024", I would return:
   "flow": "ANALYTICS"
 }
 ```"""
-            },
-            {
-                "role": "user",
-                "content": f"Extract the module, sub_module, entities, and flow from this banking command: {text}\n\nReturn ONLY a JSON object with the defined structure."
+
+class NLPService:
+    def __init__(self, settings: Optional[Settings] = None, mappings: Optional[MappingRegistry] = None):
+        self.settings = settings or Settings()
+        # Shared OpenAI client with a pooled, keep-alive httpx client
+        self.llm = get_llm_gateway()
+        # Load module mappings
+        self.mappings = mappings or MappingRegistry()
+        self.module_mappings = self.mappings.module_mappings
+        self.module_properties = self.mappings.module_properties
+        self.mapping_version = self.mappings.version
+        # The prompts only depend on the mappings, so compile them once per mapping version
+        self.prompt_compiler = PromptCompiler(model=self.settings.openai_model)
+        self.prompt_compiler.register("combined", self._create_combined_prompt, COMBINED_ANALYSIS_EXAMPLES)
+        self.prompt_compiler.register("router", self._create_router_prompt)
+        for module_code in self.module_mappings:
+            self.prompt_compiler.register(
+                f"entities:{module_code}",
+                lambda module_code=module_code: self._create_entity_prompt(module_code)
+            )
+        # Resolved results keyed by normalized text and mapping version
+        self.result_cache = ResultCache(
+            max_entries=self.settings.nlp_cache_max_entries if self.settings.nlp_cache_enabled else 0,
+            ttl_seconds=self.settings.nlp_cache_ttl_seconds
+        )
+        # Learned command templates for commands that differ only in amounts, dates and names
+        self.template_cache = SlotTemplateCache(
+            max_entries=self.settings.nlp_template_cache_max_entries if self.settings.nlp_template_cache_enabled else 0,
+            ttl_seconds=self.settings.nlp_template_cache_ttl_seconds
+        )
+        # Local pre-classifier for simple QUERY commands
+        self.intent_classifier = (
+            LocalIntentClassifier(self.module_mappings, self.module_properties)
+            if self.settings.local_classifier_enabled else None
+        )
+        # Concurrent identical commands share one in-flight OpenAI call
+        self.single_flight = SingleFlight()
+        # Optionally pack concurrent commands into one completion
+        self.batcher = (
+            MicroBatcher(
+                process_batch=self._batched_analysis,
+                window_ms=self.settings.nlp_batch_window_ms,
+                max_batch_size=self.settings.nlp_batch_max_size
+            )
+            if self.settings.nlp_batching_enabled else None
+        )
+        # Early route callbacks of callers waiting on an in-flight analysis, by cache key
+        self._route_listeners: Dict[Hashable, List[Callable[[Dict[str, Any]], None]]] = {}
+        
+    async def process_command(
+        self,
+        text: str,
+        on_route: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process a natural language command and extract intent and entities.
+        
+        Args:
+            text (str): The input text command
+            on_route: Optional callback invoked once with the module, sub_module and flow as
+                soon as they are known. With streaming or two-stage analysis this happens
+                before the entities are parsed, so callers can start downstream work early.
+            
+        Returns:
+            Dict[str, Any]: A dictionary containing module, submodule, entities, flow, and raw text
+        """
+        routed = False
+        
+        def notify_route(route: Dict[str, Any]) -> None:
+            nonlocal routed
+            if on_route is None or routed:
+                return
+            routed = True
+            try:
+                on_route(route)
+            except Exception as e:
+                logger.error(f"Error in route callback: {str(e)}")
+        
+        try:
+            # Repeated commands are answered from the cache without an OpenAI round trip
+            cache_key = (normalize_command_text(text), self.mapping_version)
+            cached_response = self.result_cache.get(cache_key)
+            if cached_response is not None:
+                logger.info(f"Result cache hit for '{text}'")
+                cached_response["raw_text"] = text
+                cached_response["metadata"] = {**cached_response.get("metadata", {}), "source": "cache"}
+                notify_route(self._route_of(cached_response))
+                return cached_response
+            
+            # Simple QUERY commands that the local classifier is sure about skip the LLM entirely
+            if self.intent_classifier is not None:
+                match = self.intent_classifier.classify(text)
+                if match and match.flow == "QUERY" and match.confidence >= self.settings.local_classifier_threshold:
+                    logger.info(f"Local classifier matched '{text}' to {match.submodule_code} ({match.confidence})")
+                    final_response = self._build_response(
+                        module_code=match.module_code,
+                        sub_module={"submoduleCode": match.submodule_code},
+                        entities=match.entities,
+                        flow=match.flow,
+                        text=text,
+                        metadata={"source": "local", "confidence": match.confidence}
+                    )
+                    self.result_cache.set(cache_key, final_response)
+                    notify_route(self._route_of(final_response))
+                    return final_response
+            
+            # Commands matching a learned template get their slot entities filled in locally
+            template_response = self.template_cache.lookup(text, self.mapping_version)
+            if template_response is not None:
+                logger.info(f"Template cache hit for '{text}'")
+                template_response["metadata"] = {"source": "template_cache", "confidence": None}
+                self.result_cache.set(cache_key, template_response)
+                notify_route(self._route_of(template_response))
+                return template_response
+            
+            # For QUERY flows, we'll use a combined approach with a single API call.
+            # Identical commands already in flight await the same call.
+            listeners = None
+            if on_route is not None:
+                listeners = self._route_listeners.setdefault(cache_key, [])
+                listeners.append(notify_route)
+            try:
+                result, flow = await self.single_flight.do(cache_key, lambda: self._analyze(text, cache_key))
+            except LLMUnavailableError as e:
+                logger.warning(f"LLM unavailable for '{text}': {str(e)}")
+                fallback_response = self._local_fallback(text)
+                if fallback_response is None:
+                    return {
+                        "error": str(e),
+                        "raw_text": text
+                    }
+                notify_route(self._route_of(fallback_response))
+                return fallback_response
+            finally:
+                if listeners is not None:
+                    listeners.remove(notify_route)
+                    if not listeners and self._route_listeners.get(cache_key) is listeners:
+                        del self._route_listeners[cache_key]
+            result = copy.deepcopy(result)
+            
+            # Check for error response
+            if "error" in result:
+                return {
+                    "error": result["error"],
+                    "raw_text": text
+                }
+            
+            # Get the module code
+            module_code = result["module"]
+            
+            # Check if the module code is valid
+            if module_code not in self.module_mappings:
+                return {
+                    "error": f"Invalid module code: {module_code}",
+                    "raw_text": text
+                }
+            
+            final_response = self._build_response(
+                module_code=module_code,
+                sub_module=result.get("sub_module", {}),
+                entities=result.get("entities", {}),
+                flow=flow,
+                text=text,
+                metadata={"source": "llm", "confidence": None}
+            )
+            
+            logger.info(f"Final response: {final_response}")
+            self.result_cache.set(cache_key, final_response)
+            self.template_cache.learn(text, self.mapping_version, final_response)
+            # No-op if the route was already reported while streaming
+            notify_route(self._route_of(final_response))
+            return final_response
+            
+        except OverloadedError:
+            # Shed requests are answered with a 503 rather than an error payload
+            raise
+        except Exception as e:
+            logger.error(f"Error processing command: {str(e)}")
+            logger.error(f"Error type: {type(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return {
+                "error": str(e),
+                "raw_text": text
             }
-        ]
+    
+    def _local_fallback(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Answer with the local classifier's best guess when the LLM is unavailable.
+        
+        Any match is used regardless of its confidence or flow, and even for commands the
+        classifier would normally leave to the LLM, since the alternative is an error. The
+        response is not cached, so the LLM answers the command once it recovers.
+        """
+        if self.intent_classifier is None:
+            return None
+        match = self.intent_classifier.classify(text, strict=False)
+        if match is None:
+            return None
+        logger.info(f"Local fallback matched '{text}' to {match.submodule_code} ({match.confidence})")
+        return self._build_response(
+            module_code=match.module_code,
+            sub_module={"submoduleCode": match.submodule_code},
+            entities=match.entities,
+            flow=match.flow,
+            text=text,
+            metadata={"source": "local_fallback", "confidence": match.confidence}
+        )
+    
+    def _build_response(
+        self,
+        module_code: str,
+        sub_module: Any,
+        entities: Dict[str, Any],
+        flow: str,
+        text: str,
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Construct the process_command response for a resolved module and submodule.
+        The submodule is replaced by the complete mapping entry when one exists.
+        """
+        return {
+            "module": self.module_mappings[module_code],
+            "sub_module": self._resolve_submodule(module_code, sub_module),
+            "entities": entities,
+            "flow": flow,
+            "raw_text": text,
+            "metadata": metadata
+        }
+    
+    def _resolve_submodule(self, module_code: str, sub_module: Any) -> Any:
+        """Replace a parsed submodule with its complete mapping entry when one exists."""
+        if isinstance(sub_module, dict) and "submoduleCode" in sub_module:
+            entry = self.mappings.submodule_entry(module_code, sub_module["submoduleCode"])
+            if entry is not None:
+                return entry
+        return sub_module
+    
+    def _route_of(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """The part of a process_command response that downstream routing depends on."""
+        return {
+            "module": response["module"],
+            "sub_module": response["sub_module"],
+            "flow": response["flow"]
+        }
+    
+    def _emit_route(self, route_key: Optional[Hashable], fields: Dict[str, Any]) -> None:
+        """Report an early route to every caller waiting on the analysis for route_key."""
+        listeners = self._route_listeners.get(route_key)
+        module_code = fields.get("module")
+        if not listeners or module_code not in self.module_mappings:
+            return
+        
+        route = {
+            "module": self.module_mappings[module_code],
+            "sub_module": self._resolve_submodule(module_code, fields.get("sub_module", {})),
+            "flow": self._normalize_flow(fields.get("flow"))
+        }
+        logger.info(f"Early route for {route_key!r}: {module_code}/{fields.get('sub_module')} {route['flow']}")
+        for listener in list(listeners):
+            listener(route)
+    
+    async def _combined_analysis(self, text: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Performs combined analysis of the text in a single API call.
+        Returns both the module/submodule/entities data and the flow type.
+        """
+        with stage("prompt_build"):
+            compiled_prompt = self.prompt_compiler.compile(self.mapping_version)
+            messages = compiled_prompt.build_messages(
+                f"Extract the module, sub_module, entities, and flow from this banking command: {text}\n\nReturn ONLY a JSON object with the defined structure."
+            )
         
         # Call OpenAI API (single call)
-        response = await self.client.chat.completions.create(
+        response = await self.llm.create(
             model=self.settings.openai_model,
             messages=messages,
             temperature=0.1,  # Low temperature for consistent results
@@ -264,36 +496,226 @@ For "Show my spending trends for 2024", I would return:
         try:
             content = response.choices[0].message.content
             logger.info(f"Content to parse: {content}")
-            result = json.loads(content)
+            with stage("parse"):
+                result = json.loads(content)
             logger.info(f"Parsed result: {result}")
-            
-            # Extract the flow type and the rest of the data
-            flow = result.get("flow", "QUERY").upper()
-            if flow not in ["QUERY", "TRANSFER", "ANALYTICS"]:
-                flow = "QUERY"  # Default to QUERY for invalid flow types
-                
-            # Remove flow from the result to maintain compatibility with existing code
-            if "flow" in result:
-                del result["flow"]
-                
-            return result, flow
+            return self._split_flow(result)
             
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse OpenAI response: {content}")
             raise ValueError("Invalid JSON response from OpenAI")
+    
+    async def _streaming_analysis(self, text: str, route_key: Optional[Hashable] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        Performs the combined analysis over a streamed completion.
+        
+        The completion is parsed incrementally, and the route (module, sub_module and
+        flow) is reported to waiting callers as soon as those fields are complete, while
+        the entities are still being generated.
+        """
+        with stage("prompt_build"):
+            compiled_prompt = self.prompt_compiler.compile(self.mapping_version)
+            messages = compiled_prompt.build_messages(
+                f"Extract the module, sub_module, entities, and flow from this banking command: {text}\n\n"
+                f"Return ONLY a JSON object with the defined structure, with \"module\", \"sub_module\" and \"flow\" before \"entities\"."
+            )
+        
+        stream = await self.llm.create(
+            model=self.settings.openai_model,
+            messages=messages,
+            temperature=0.1,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        
+        parser = IncrementalJSONParser()
+        
+        async def consume() -> None:
+            routed = False
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    # The last chunk carries the usage of the whole completion
+                    record_usage(chunk.usage)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                parser.feed(chunk.choices[0].delta.content)
+                if not routed and ROUTE_FIELDS <= parser.fields.keys():
+                    routed = True
+                    self._emit_route(route_key, parser.fields)
+        
+        # Reading the stream is bounded by what is left of the request's deadline
+        remaining = remaining_budget()
+        timeout = self.settings.request_deadline_seconds if remaining is None else max(0.0, remaining)
+        try:
+            with stage("llm_stream"):
+                await asyncio.wait_for(consume(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("Request deadline exceeded while the completion was streaming")
+        finally:
+            # Frees the concurrency slot and the connection, also when cancelled
+            await stream.close()
+        
+        try:
+            logger.info(f"Content to parse: {parser.text}")
+            result = parser.value()
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse OpenAI response: {parser.text}")
+            raise ValueError("Invalid JSON response from OpenAI")
+        return self._split_flow(result)
+    
+    async def _two_stage_analysis(self, text: str, route_key: Optional[Hashable] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        Performs the analysis as a router call followed by a per-module entity call.
+        
+        The router prompt only lists the modules and flow types, and the entity prompt
+        only carries the chosen module's properties, so neither call pays for the entity
+        guides of every module. Modules without properties or a dedicated guide skip the
+        second call entirely.
+        """
+        with stage("prompt_build"):
+            router_prompt = self.prompt_compiler.compile(self.mapping_version, name="router")
+        response = await self.llm.create(
+            model=self.settings.openai_model,
+            messages=router_prompt.build_messages(
+                f"Identify the module, sub_module and flow of this banking command: {text}\n\nReturn ONLY a JSON object with the defined structure."
+            ),
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        content = response.choices[0].message.content
+        try:
+            with stage("parse"):
+                result = json.loads(content)
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse router response: {content}")
+            raise ValueError("Invalid JSON response from OpenAI")
+        logger.info(f"Router result: {result}")
+        
+        module_code = result.get("module")
+        if "error" in result or module_code not in self.module_mappings:
+            return self._split_flow(result)
+        self._emit_route(route_key, result)
+        
+        result["entities"] = {}
+        if self.module_properties.get(module_code) or module_code in ("TRF", "ANALYTICS"):
+            sub_module = result.get("sub_module") or {}
+            submodule_code = sub_module.get("submoduleCode", "") if isinstance(sub_module, dict) else ""
+            with stage("prompt_build"):
+                entity_prompt = self.prompt_compiler.compile(self.mapping_version, name=f"entities:{module_code}")
+            response = await self.llm.create(
+                model=self.settings.openai_model,
+                messages=entity_prompt.build_messages(
+                    f"Extract the entities from this banking command for submodule {submodule_code}: {text}\n\nReturn ONLY a JSON object with the defined structure."
+                ),
+                temperature=0.1,
+                response_format={"type": "json_object"}
+            )
+            content = response.choices[0].message.content
+            try:
+                with stage("parse"):
+                    entities = json.loads(content).get("entities", {})
+            except json.JSONDecodeError:
+                logger.error(f"Failed to parse entity response: {content}")
+                raise ValueError("Invalid JSON response from OpenAI")
+            if isinstance(entities, dict):
+                result["entities"] = entities
+        
+        logger.info(f"Two-stage result: {result}")
+        return self._split_flow(result)
+    
+    def _split_flow(self, result: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """Separate and validate the flow type from a parsed analysis result."""
+        # Extract the flow type and the rest of the data
+        flow = self._normalize_flow(result.get("flow"))
             
-    def _create_combined_prompt(self) -> str:
+        # Remove flow from the result to maintain compatibility with existing code
+        if "flow" in result:
+            del result["flow"]
+            
+        return result, flow
+    
+    def _normalize_flow(self, flow: Any) -> str:
+        """Validate a flow type returned by the model."""
+        flow = str(flow or "QUERY").upper()
+        if flow not in ["QUERY", "TRANSFER", "ANALYTICS"]:
+            flow = "QUERY"  # Default to QUERY for invalid flow types
+        return flow
+    
+    async def _analyze(self, text: str, route_key: Optional[Hashable] = None) -> Tuple[Dict[str, Any], str]:
         """
-        Create a system prompt for combined module/submodule and flow determination.
-        Includes detailed entity extraction guidance for all available modules.
-        Enhances entity extraction by using allowed values when appropriate.
+        Run the configured analysis pipeline.
+        
+        Batching takes precedence over streaming, since a batched completion only
+        yields routes for all of its commands at the end.
+        
+        Args:
+            text: The command to analyze
+            route_key: Key of the callers to notify when the route is known early
         """
-        modules_info = []
-        entity_extraction_guides = []
+        if self.settings.nlp_pipeline_mode == "two_stage":
+            return await self._two_stage_analysis(text, route_key)
+        if self.batcher is not None:
+            return await self.batcher.submit(text)
+        if self.settings.nlp_streaming_enabled:
+            return await self._streaming_analysis(text, route_key)
+        return await self._combined_analysis(text)
+    
+    async def _batched_analysis(self, texts: List[str]) -> List[Any]:
+        """
+        Analyze several commands with a single completion.
         
-        # Add detailed entity extraction guide for all modules
+        The compiled system prompt is sent once for the whole batch and the model returns
+        one result per command. If the batched response cannot be matched up with the
+        commands, each command falls back to its own combined analysis call.
+        
+        Args:
+            texts: The commands collected by the micro-batcher
+            
+        Returns:
+            List[Any]: A (result, flow) tuple or an exception for each command, in order
+        """
+        if len(texts) == 1:
+            return [await self._combined_analysis(texts[0])]
+        
+        with stage("prompt_build"):
+            compiled_prompt = self.prompt_compiler.compile(self.mapping_version)
+            numbered_commands = "\n".join(f"{i + 1}. {text}" for i, text in enumerate(texts))
+            messages = compiled_prompt.build_messages(
+                f"Extract the module, sub_module, entities, and flow from each of these {len(texts)} banking commands:\n"
+                f"{numbered_commands}\n\n"
+                f"Return ONLY a JSON object of the form {{\"results\": [...]}} where \"results\" holds exactly "
+                f"{len(texts)} objects with the defined structure, in the same order as the commands."
+            )
+        
+        try:
+            response = await self.llm.create(
+                model=self.settings.openai_model,
+                messages=messages,
+                temperature=0.1,
+                response_format={"type": "json_object"}
+            )
+            content = response.choices[0].message.content
+            with stage("parse"):
+                results = json.loads(content).get("results")
+            if not isinstance(results, list) or len(results) != len(texts) or not all(isinstance(r, dict) for r in results):
+                raise ValueError(f"Expected {len(texts)} results in batched response")
+            logger.info(f"Batched analysis of {len(texts)} commands in one call")
+            return [self._split_flow(result) for result in results]
+        except (LLMUnavailableError, OverloadedError):
+            # Individual calls would fail the same way
+            raise
+        except Exception as e:
+            logger.warning(f"Batched analysis failed, analyzing commands individually: {str(e)}")
+            return await asyncio.gather(
+                *(self._combined_analysis(text) for text in texts),
+                return_exceptions=True
+            )
+            
+    def _modules_info(self) -> str:
+        """List every module with its submodules for the prompts."""
+        modules_info = []
         for module_code, module_data in self.module_mappings.items():
-            # Process module information for the available modules section
             submodules = []
             for submodule in module_data['submodules']:
                 if isinstance(submodule, dict) and 'submoduleName' in submodule and 'submoduleCode' in submodule:
@@ -303,87 +725,43 @@ For "Show my spending trends for 2024", I would return:
                 f"   - {module_data['moduleName']} ({module_code}):\n" + 
                 "\n".join(submodules)
             )
+        return "\n".join(modules_info)
+    
+    def _property_lines(self, properties: Dict[str, Any]) -> List[str]:
+        """Describe entity properties, including their allowed values, one per line."""
+        entity_details = []
+        for prop_name, prop_data in properties.items():
+            prop_type = prop_data.get("type", "string")
+            prop_desc = prop_data.get("description", "")
+            enum_values = prop_data.get("enum", [])
             
+            prop_info = f"- {prop_name}: {prop_desc} (type: {prop_type})"
+            if enum_values:
+                prop_info += f", allowed values: [{', '.join(str(v) for v in enum_values)}]"
+            entity_details.append(prop_info)
+        return entity_details
+    
+    def _create_combined_prompt(self) -> str:
+        """
+        Create a system prompt for combined module/submodule and flow determination.
+        Includes detailed entity extraction guidance for all available modules.
+        Enhances entity extraction by using allowed values when appropriate.
+        """
+        entity_extraction_guides = []
+        
+        # Add detailed entity extraction guide for all modules
+        for module_code, module_data in self.module_mappings.items():
             # Extract entity information for this module
-            module_properties = module_data.get("properties", {})
-            if module_properties:
-                entity_details = []
-                for prop_name, prop_data in module_properties.items():
-                    prop_type = prop_data.get("type", "string")
-                    prop_desc = prop_data.get("description", "")
-                    enum_values = prop_data.get("enum", [])
-                    
-                    prop_info = f"- {prop_name}: {prop_desc} (type: {prop_type})"
-                    if enum_values:
-                        prop_info += f", allowed values: [{', '.join(str(v) for v in enum_values)}]"
-                    entity_details.append(prop_info)
-                
-                if entity_details:
-                    module_guide = f"\nFor {module_data['moduleName']} ({module_code}) module, extract these specific entities when present:\n"
-                    module_guide += "\n".join(entity_details)
-                    entity_extraction_guides.append(module_guide)
+            entity_details = self._property_lines(module_data.get("properties", {}))
+            if entity_details:
+                module_guide = f"\nFor {module_data['moduleName']} ({module_code}) module, extract these specific entities when present:\n"
+                module_guide += "\n".join(entity_details)
+                entity_extraction_guides.append(module_guide)
         
-        # Add Analytics-specific guidance
-        analytics_guide = """
-For ANALYTICS module, pay special attention to:
-
-1. Analytics Submodules:
-   - ANALYTICS_SPENDING: For spending analysis, expense trends, spending by category/merchant (e.g., "show my spending trends", "analyze my expenses")
-   - ANALYTICS_INCOME: For income analysis and income trends (e.g., "show my income analysis", "income trends")
-   - ANALYTICS_TRANSACTIONS: For transaction analysis, statements, activity (e.g., "show my transactions", "analyze my recent activity")
-   - ANALYTICS_BUDGET: For budget tracking and planning (e.g., "how am I doing on my budget", "budget analysis")
-   - ANALYTICS_INVESTMENT: For investment performance (e.g., "show my investment performance", "analyze my portfolio")
-
-2. Analytics-specific entities:
-   - year: When a specific year is mentioned (e.g., "2024" in "spending for 2024")
-   - month: When a specific month is mentioned (e.g., "January", "Jan", "01")
-   - quarter: For quarterly analysis (e.g., "Q1", "Q2", "first quarter")
-   - period: For relative time periods (e.g., "last month", "past quarter", "year to date")
-   - category: For specific spending categories (e.g., "groceries", "entertainment")
-   - comparison: For comparative analysis (e.g., "compare", "versus", "vs")
-   - visualization: For specific visualization requests (e.g., "pie chart", "bar graph", "table")
-   - distributionType: For distribution analysis (e.g., "category", "amount_range", "time_of_day", "day_of_week", "transaction_type", "merchant", "location", "month")
-   - amountRangeBuckets: The specific amount ranges for grouping transactions (e.g., ["0-50", "51-100", "101-500", "500+"])
-   - timeOfDayRanges: The specific time ranges for grouping transactions (e.g., ["morning", "afternoon", "evening", "night"])
-
-3. Flow Determination:
-   - ALWAYS use ANALYTICS flow (not QUERY) when the user asks for:
-     - Any trends or patterns (e.g., "spending trends", "income patterns")
-     - Distribution analysis (e.g., "distribution of expenses")
-     - Comparative analysis (e.g., "compare spending across categories")
-     - Performance metrics (e.g., "budget performance", "investment performance")
-     - Insights or summaries (e.g., "insights on my spending", "financial summary")
-     - Visual representations (e.g., "show me a chart of", "graph my spending")
-     
-4. For distribution analysis with pie charts, extract these additional entities when appropriate:
-   - distributionType: The type of distribution to analyze (category, amount_range, time_of_day, day_of_week, etc.)
-   - When user mentions "pie chart of spending by category" → distributionType="category"
-   - When user mentions "distribution of transactions by amount" → distributionType="amount_range"
-   - When user mentions "breakdown of spending by time of day" → distributionType="time_of_day"
-   - When user mentions "transactions by day of week" → distributionType="day_of_week"
-"""
-
-        # Add Transfer-specific guidance
-        transfer_guide = """
-For TRANSFER module (TRF), pay special attention to:
-
-1. Always use consistent entity names:
-   - For recipient/beneficiary information, always use "beneficiaryName" as the entity name
-   - For amount, use "amount" as the entity name
-   - For currency, use "currency" as the entity name when explicitly mentioned
-   - For account types, use "sourceAccountType" and "targetAccountType"
-
-2. When processing transfer commands like:
-   - "Transfer $100 to John Smith" → use entities: {"amount": "100", "beneficiaryName": "John Smith", "currency": "USD"}
-   - "Send 500 euros to Alice Johnson" → use entities: {"amount": "500", "beneficiaryName": "Alice Johnson", "currency": "EUR"}
-   
-3. Never use "recipientName" - always use "beneficiaryName" instead for consistency
-"""
-
         # Combine all entity extraction guides
         entity_extraction_guide = "\n".join(entity_extraction_guides) if entity_extraction_guides else ""
-        entity_extraction_guide += analytics_guide
-        entity_extraction_guide += transfer_guide
+        entity_extraction_guide += ANALYTICS_ENTITY_GUIDE
+        entity_extraction_guide += TRANSFER_ENTITY_GUIDE
         
         return f"""You are a banking command processor. Your task is to analyze banking commands to identify:
 1. The appropriate module and submodule
@@ -391,7 +769,7 @@ For TRANSFER module (TRF), pay special attention to:
 3. The flow type (QUERY, TRANSFER, or ANALYTICS)
 
 Available Banking Modules and Submodules:
-{chr(10).join(modules_info)}
+{self._modules_info()}
 
 Flow Types:
 - QUERY: Simple information retrieval or basic actions (e.g., "show balance", "check mini statement", "show card details")
@@ -439,6 +817,83 @@ Only return an error object if you absolutely cannot map the command to any modu
 
 Always extract entities based on the properties of the identified module.
 Be generous in interpretation - try to map commands to the closest matching module/submodule.
+Provide no additional text outside of the JSON object.
+"""
+            
+    def _create_router_prompt(self) -> str:
+        """
+        Create the stage-one system prompt that only picks the module, submodule and flow.
+        Entity guidance is left to the per-module entity prompt.
+        """
+        return f"""You are a banking command router. Your task is to analyze banking commands to identify:
+1. The appropriate module and submodule
+2. The flow type (QUERY, TRANSFER, or ANALYTICS)
+
+Available Banking Modules and Submodules:
+{self._modules_info()}
+
+Flow Types:
+- QUERY: Simple information retrieval or basic actions (e.g., "show balance", "check mini statement", "show card details")
+- TRANSFER: Financial transactions requiring validations (e.g., "send $100 to John", "pay electricity bill")
+- ANALYTICS: Requests involving visualization, insights, or analytics such as trends, distributions, comparisons or charts (e.g., "show spending trends", "monthly expense analysis")
+
+Return a JSON response with this exact structure:
+{{
+  "module": "<module_code>",
+  "sub_module": {{
+    "submoduleCode": "<submodule_code>",
+    "submoduleName": "<submodule_name>"
+  }},
+  "flow": "<QUERY, TRANSFER, or ANALYTICS>"
+}}
+
+Only return an error object if you absolutely cannot map the command to any module:
+{{
+  "error": "descriptive error message"
+}}
+
+Be generous in interpretation - try to map commands to the closest matching module/submodule.
+Provide no additional text outside of the JSON object.
+"""
+    
+    def _create_entity_prompt(self, module_code: str) -> str:
+        """
+        Create the stage-two system prompt for extracting the entities of one module.
+        Only the properties of that module, and its dedicated guide if any, are included.
+        """
+        module_data = self.module_mappings[module_code]
+        entity_details = self._property_lines(self.module_properties.get(module_code, {}))
+        
+        entity_extraction_guide = ""
+        if entity_details:
+            entity_extraction_guide = (
+                f"For {module_data['moduleName']} ({module_code}) module, extract these specific entities when present:\n"
+                + "\n".join(entity_details) + "\n"
+            )
+        if module_code == "ANALYTICS":
+            entity_extraction_guide += ANALYTICS_ENTITY_GUIDE
+        elif module_code == "TRF":
+            entity_extraction_guide += TRANSFER_ENTITY_GUIDE
+        
+        return f"""You are a banking command processor. The command has already been identified as belonging to the {module_data['moduleName']} ({module_code}) module. Your task is to extract the entities mentioned in it.
+
+{entity_extraction_guide}
+Entity Extraction Guidelines:
+1. Extract ALL relevant entities explicitly mentioned in the user's query
+2. If an entity is implied but not explicitly stated, use context to determine the most appropriate value
+3. When an entity type is identified but its exact value is not specified:
+   - If the property has allowed values (enum), use the MOST APPROPRIATE value from the allowed list
+   - For boolean properties, infer the likely value based on context (true/false)
+   - For date-related properties, use appropriate date values in YYYY-MM-DD format
+4. Don't include entities that are completely unrelated to the query
+
+Return a JSON response with this exact structure:
+{{
+  "entities": {{
+    /* Entity names and values for the {module_code} module */
+  }}
+}}
+
 Provide no additional text outside of the JSON object.
 """
             
@@ -514,63 +969,22 @@ Be generous in interpretation - try to map commands to the closest matching modu
 Provide no additional text outside of the JSON object."""
 
     # Maintain the determine_flow method for backward compatibility, but it will no longer make API calls for QUERY flow
-    async def determine_flow(self, text: str, module_code: str) -> str:
+    async def determine_flow(self, text: str, module_code: str, submodule_code: Optional[str] = None) -> str:
         """
-        Determine the flow type based on the module code.
-        For ACC (Accounts) module with QUERY submodules, returns "QUERY" without making an API call.
-        For other flows, make a separate API call for now.
+        Determine the flow type from the mappings, without an API call.
+        
+        The combined analysis already returns the flow, so this is only needed when a
+        result has none. The flow of a known submodule comes from the mapping decision
+        table; otherwise the most common flow of the module's submodules is used.
         
         Args:
             text: The input text command
             module_code: The module code identified from the command
+            submodule_code: The submodule code identified from the command, if any
             
         Returns:
             str: The determined flow type (QUERY, TRANSFER, or ANALYTICS)
         """
-        # For QUERY flow determination without API call
-        if module_code == "ACC":
-            logger.info(f"ACC module detected - using QUERY flow for '{text}'")
-            return "QUERY"
-            
-        # Fall back to API call for other modules or more complex flows
-        try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": """You are a banking command classifier. Your task is to classify banking commands into one of three flows:
-
-QUERY: Simple information retrieval or basic actions (e.g., "show balance", "check mini statement", "show card details", "block Card").
-
-TRANSFER: Financial transactions requiring validations and resolutions (e.g., "send $100 to John", "pay electricity bill", "setup auto-pay").
-
-ANALYTICS: Requests involving data visualization, insights, or financial management analytics (e.g., "show spending trends", "monthly expense analysis", "income versus expense chart").
-
-Return ONLY one of these three values: "QUERY", "TRANSFER", or "ANALYTICS".
-Do not include any additional text or explanation."""
-                },
-                {
-                    "role": "user",
-                    "content": f"Classify this banking command: {text}"
-                }
-            ]
-            
-            response = await self.client.chat.completions.create(
-                model=self.settings.openai_model,
-                messages=messages,
-                temperature=0.1,  # Low temperature for consistent results
-                max_tokens=10  # We only need a single word response
-            )
-            
-            flow = response.choices[0].message.content.strip().upper()
-            logger.info(f"Determined flow for text '{text}': {flow}")
-            
-            # Validate the response is one of the expected values
-            if flow not in ["QUERY", "TRANSFER", "ANALYTICS"]:
-                logger.warning(f"Unexpected flow type '{flow}', defaulting to QUERY")
-                return "QUERY"
-                
-            return flow
-            
-        except Exception as e:
-            logger.error(f"Error determining flow: {str(e)}")
-            return "QUERY"  # Default to QUERY in case of errors 
\ No newline at end of file
+        flow = self.mappings.flow_for(module_code, submodule_code)
+        logger.info(f"Determined flow for text '{text}' from mappings: {flow}")
+        return flow
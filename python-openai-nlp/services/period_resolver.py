@@ -0,0 +1,365 @@
+from typing import Dict, Any, Optional, Tuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import calendar
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3,
+    "april": 4, "apr": 4, "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7,
+    "august": 8, "aug": 8, "september": 9, "sep": 9, "sept": 9, "october": 10, "oct": 10,
+    "november": 11, "nov": 11, "december": 12, "dec": 12
+}
+
+# Length in months of the calendar periods; weeks and days are handled apart
+PERIOD_MONTHS = {"month": 1, "quarter": 3, "half": 6, "year": 12, "fiscal year": 12}
+
+UNITS = {
+    "day": "day", "days": "day", "week": "week", "weeks": "week",
+    "month": "month", "months": "month", "quarter": "quarter", "quarters": "quarter",
+    "half": "half", "half year": "half", "half-year": "half", "halves": "half",
+    "year": "year", "years": "year", "fiscal year": "fiscal year", "fy": "fiscal year",
+    "financial year": "fiscal year"
+}
+
+NUMBERS = {
+    "a": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "couple of": 2, "few": 3
+}
+ORDINALS = {"first": 1, "1st": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3, "fourth": 4, "4th": 4}
+
+# Longest span a "last N ..." phrase reaches back; longer counts are clamped to it
+MAX_SPAN_YEARS = 100
+
+# Relative words: 0 is the period containing today, -1 the one before it
+RELATIVE = {"this": 0, "current": 0, "last": -1, "previous": -1, "past": -1, "prior": -1}
+
+# Phrases for a period up to today
+TO_DATE = {
+    "today": ("day", 0), "yesterday": ("day", -1),
+    "week": ("week", 0), "month": ("month", 0), "quarter": ("quarter", 0), "year": ("year", 0),
+    "ytd": ("year", 0), "year to date": ("year", 0), "mtd": ("month", 0), "month to date": ("month", 0),
+    "qtd": ("quarter", 0), "quarter to date": ("quarter", 0),
+    "fytd": ("fiscal year", 0), "fiscal year to date": ("fiscal year", 0)
+}
+
+_UNIT = "|".join(sorted((re.escape(unit) for unit in UNITS), key=len, reverse=True))
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_NUMBER = "|".join([r"\d+"] + sorted((re.escape(number) for number in NUMBERS), key=len, reverse=True))
+_ORDINAL = "|".join(ORDINALS)
+# A two-digit year only with an apostrophe ("march '24") or after "of" ("q1 of 24"), since
+# a bare one is as likely a day of the month ("march 15")
+_YEAR = r"(\d{4}|'\d{2}|(?<=of )\d{2})"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+
+RELATIVE_PERIOD = re.compile(rf"^({'|'.join(RELATIVE)})\s+({_UNIT})$")
+LAST_N = re.compile(rf"^(?:last|past|previous|prior)\s+({_NUMBER})\s+({_UNIT})$")
+MONTH_YEAR = re.compile(rf"^({_MONTH})(?:\s+(?:of\s+)?{_YEAR})?$")
+MONTH_DAY = re.compile(rf"^({_MONTH})\s+{_DAY}(?:\s+(?:of\s+)?{_YEAR})?$")
+DAY_MONTH = re.compile(rf"^{_DAY}\s+(?:of\s+)?({_MONTH})(?:\s+(?:of\s+)?{_YEAR})?$")
+YEAR_MONTH = re.compile(rf"^(\d{{4}})(?:\s+({_MONTH})|[-/](\d{{1,2}}))$")
+QUARTER = re.compile(rf"^(?:q([1-4])|({_ORDINAL})\s+quarter)(?:\s+(?:of\s+)?{_YEAR})?$")
+YEAR_QUARTER = re.compile(r"^(\d{4})\s*-?\s*q([1-4])$")
+HALF = re.compile(rf"^(?:h([12])|({_ORDINAL})\s+half)(?:\s+(?:of\s+)?{_YEAR})?$")
+FISCAL_YEAR = re.compile(r"^(?:fy|fiscal\s+year|financial\s+year|fiscal)\s*'?(\d{4}|\d{2})(?:\s*[-/]\s*'?(\d{4}|\d{2}))?$")
+YEAR = re.compile(r"^(\d{4})$")
+ISO_DATE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+# Range separators, words before dashes since dashes also appear inside single periods
+RANGE_SEPARATORS = (
+    re.compile(r"\s+(?:to|until|till|through|thru|and)\s+"),
+    re.compile(r"\s*[-–]\s*")
+)
+RANGE_PREFIX = re.compile(r"^(?:from|between)\s+")
+FILLER = re.compile(r"^(?:(?:for|in|during|over|of|the)\s+)+")
+
+Span = Tuple[date, date]
+
+
+def month_end(year: int, month: int) -> date:
+    """The last day of a month, leap years included."""
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _months_span(first_month: int, months: int) -> Span:
+    """The span of `months` months from an absolute month index (year * 12 + month - 1)."""
+    last_month = first_month + months - 1
+    return date(first_month // 12, first_month % 12 + 1, 1), month_end(last_month // 12, last_month % 12 + 1)
+
+
+def _shift_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    year, month = index // 12, index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _year(value: str) -> int:
+    value = value.lstrip("'")
+    return int(value) if len(value) == 4 else 2000 + int(value)
+
+
+def _number(value: str) -> int:
+    return int(value) if value.isdigit() else NUMBERS[value]
+
+
+class _Calendar:
+    """Period arithmetic relative to one day, with the fiscal year starting on fiscal_start."""
+
+    def __init__(self, today: date, fiscal_start: int):
+        self.today = today
+        self.fiscal_start = fiscal_start
+
+    def period(self, unit: str, offset: int = 0, day: Optional[date] = None) -> Span:
+        """The period of a unit containing the day (today by default), moved by offset periods."""
+        day = day or self.today
+        if unit == "day":
+            day += timedelta(days=offset)
+            return day, day
+        if unit == "week":
+            monday = day - timedelta(days=day.weekday()) + timedelta(weeks=offset)
+            return monday, monday + timedelta(days=6)
+        months = PERIOD_MONTHS[unit]
+        anchor = self.fiscal_start - 1 if unit == "fiscal year" else 0
+        index = day.year * 12 + day.month - 1
+        first_month = (index - anchor) // months * months + anchor + offset * months
+        return _months_span(first_month, months)
+
+    def latest(self, first_month_of_year: int, months: int, year: Optional[int]) -> Span:
+        """
+        A period given by its first month and, optionally, its year.
+
+        Without a year it is the latest such period that has started, so in February
+        "march" is last March and "q4" is last year's fourth quarter.
+        """
+        if year is None:
+            year = self.today.year if first_month_of_year <= self.today.month else self.today.year - 1
+        return _months_span(year * 12 + first_month_of_year - 1, months)
+
+    def latest_day(self, month: int, day: int, year: Optional[int]) -> Optional[Span]:
+        """A day of a month, of the given year or else the latest one up to today; None if there is no such day."""
+        try:
+            if year is not None:
+                found = date(year, month, day)
+            else:
+                found = date(self.today.year, month, day)
+                if found > self.today:
+                    found = date(self.today.year - 1, month, day)
+        except ValueError:
+            return None
+        return found, found
+
+    def fiscal_year(self, end_year: int) -> Span:
+        """A fiscal year, named after the calendar year it ends in (FY2024 is Apr 2023 - Mar 2024)."""
+        if self.fiscal_start == 1:
+            return _months_span(end_year * 12, 12)
+        return _months_span((end_year - 1) * 12 + self.fiscal_start - 1, 12)
+
+    def to_date(self, unit: str, offset: int) -> Span:
+        start, end = self.period(unit, offset)
+        return start, min(end, self.today)
+
+
+def _resolve_single(phrase: str, cal: _Calendar) -> Optional[Span]:
+    """Resolve a phrase naming one period, or None."""
+    if phrase in TO_DATE:
+        return cal.to_date(*TO_DATE[phrase])
+
+    match = RELATIVE_PERIOD.match(phrase)
+    if match:
+        offset, unit = RELATIVE[match.group(1)], UNITS[match.group(2)]
+        # "this month" runs up to today, "last month" is the whole previous month
+        return cal.to_date(unit, 0) if offset == 0 else cal.period(unit, offset)
+
+    match = LAST_N.match(phrase)
+    if match:
+        count, unit = _number(match.group(1)), UNITS[match.group(2)]
+        if count <= 0:
+            return None
+        if unit in ("day", "week"):
+            days = count * 7 if unit == "week" else count
+            start = cal.today - timedelta(days=min(days, MAX_SPAN_YEARS * 366))
+        else:
+            start = _shift_months(cal.today, -min(count * PERIOD_MONTHS[unit], MAX_SPAN_YEARS * 12))
+        return start, cal.today
+
+    if phrase.startswith("since "):
+        span = resolve_phrase(phrase[6:], cal)
+        if span is None or span[0] > cal.today:
+            return None
+        return span[0], cal.today
+
+    match = MONTH_YEAR.match(phrase)
+    if match:
+        year = _year(match.group(2)) if match.group(2) else None
+        return cal.latest(MONTHS[match.group(1)], 1, year)
+
+    match = MONTH_DAY.match(phrase)
+    if match:
+        year = _year(match.group(3)) if match.group(3) else None
+        return cal.latest_day(MONTHS[match.group(1)], int(match.group(2)), year)
+
+    match = DAY_MONTH.match(phrase)
+    if match:
+        year = _year(match.group(3)) if match.group(3) else None
+        return cal.latest_day(MONTHS[match.group(2)], int(match.group(1)), year)
+
+    match = YEAR_MONTH.match(phrase)
+    if match:
+        month = MONTHS[match.group(2)] if match.group(2) else int(match.group(3))
+        if 1 <= month <= 12:
+            return cal.latest(month, 1, int(match.group(1)))
+        return None
+
+    match = QUARTER.match(phrase) or YEAR_QUARTER.match(phrase)
+    if match:
+        if match.re is YEAR_QUARTER:
+            quarter, year = int(match.group(2)), int(match.group(1))
+        else:
+            quarter = int(match.group(1)) if match.group(1) else ORDINALS[match.group(2)]
+            year = _year(match.group(3)) if match.group(3) else None
+        if 1 <= quarter <= 4:
+            return cal.latest((quarter - 1) * 3 + 1, 3, year)
+        return None
+
+    match = HALF.match(phrase)
+    if match:
+        half = int(match.group(1)) if match.group(1) else ORDINALS[match.group(2)]
+        if half in (1, 2):
+            year = _year(match.group(3)) if match.group(3) else None
+            return cal.latest((half - 1) * 6 + 1, 6, year)
+        return None
+
+    match = FISCAL_YEAR.match(phrase)
+    if match:
+        # "FY 2023-24" and "FY24" both name the fiscal year ending in 2024
+        return cal.fiscal_year(_year(match.group(2) or match.group(1)))
+
+    match = YEAR.match(phrase)
+    if match:
+        return cal.period("year", 0, date(int(match.group(1)), 1, 1))
+
+    match = ISO_DATE.match(phrase)
+    if match:
+        try:
+            day = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return None
+        return day, day
+
+    return None
+
+
+def resolve_phrase(phrase: str, cal: _Calendar) -> Optional[Span]:
+    """Resolve a normalized phrase naming a period or a range of periods, or None."""
+    phrase = FILLER.sub("", phrase)
+    span = _resolve_single(phrase, cal)
+    if span is not None:
+        return span
+
+    for separator in RANGE_SEPARATORS:
+        for match in separator.finditer(phrase):
+            span = _resolve_range(RANGE_PREFIX.sub("", phrase[:match.start()]), phrase[match.end():], cal)
+            if span is not None:
+                return span
+    return None
+
+
+def _resolve_range(first: str, last: str, cal: _Calendar) -> Optional[Span]:
+    """From the start of the first period to the end of the last, or None."""
+    end = resolve_phrase(last, cal)
+    if end is None:
+        return None
+    start = resolve_phrase(first, cal)
+    if start is not None and start[0] > end[1]:
+        # "nov to feb 2024": a start without a year is the latest one before the end
+        start = resolve_phrase(first, _Calendar(end[1], cal.fiscal_start))
+    if start is None or start[0] > end[1]:
+        return None
+    return start[0], end[1]
+
+
+def normalize(phrase: str) -> str:
+    return " ".join(phrase.lower().replace(",", " ").rstrip(".?!").split())
+
+
+@lru_cache(maxsize=4096)
+def resolve_period(phrase: str, today: date, timezone: str, fiscal_start: int = 1) -> Optional[Tuple[str, str]]:
+    """
+    The first and last day, as YYYY-MM-DD, of a period phrase on a given day, or None.
+
+    Memoized per phrase, day and timezone, so the same phrase costs one lookup for the
+    rest of the day. The timezone is part of the key because it decides what today is.
+    """
+    span = resolve_phrase(normalize(phrase), _Calendar(today, fiscal_start))
+    if span is None:
+        return None
+    return span[0].isoformat(), span[1].isoformat()
+
+
+class PeriodResolver:
+    """
+    Turns the date entities of an analytics command into startDate/endDate filters.
+
+    Understands months, quarters, half-years, calendar and fiscal years, to-date and
+    relative periods ("last 3 months", "since March") and ranges of any of them
+    ("Nov 2023 to Feb 2024"). Today is taken once per request in the configured
+    timezone (the server's local time when none is set).
+    """
+
+    def __init__(self, timezone: str = "", fiscal_year_start_month: int = 1):
+        self.timezone_name = timezone
+        self.tz = None
+        if timezone:
+            from zoneinfo import ZoneInfo
+            self.tz = ZoneInfo(timezone)
+        if not 1 <= fiscal_year_start_month <= 12:
+            raise ValueError(f"Invalid fiscal year start month: {fiscal_year_start_month}")
+        self.fiscal_start = fiscal_year_start_month
+
+    def today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    def resolve(self, phrase: str, today: Optional[date] = None) -> Optional[Tuple[str, str]]:
+        """The first and last day of a period phrase, or None if it names no period."""
+        return resolve_period(phrase, today or self.today(), self.timezone_name, self.fiscal_start)
+
+    def filters(self, entities: Dict[str, Any], today: Optional[date] = None) -> Dict[str, str]:
+        """The startDate and endDate filters for the date entities, or {} without any."""
+        today = today or self.today()
+        span = None
+        if "year" in entities:
+            span = self.resolve(_entity_phrase(entities), today)
+        elif "startDate" in entities:
+            return {
+                "startDate": entities["startDate"],
+                "endDate": entities.get("endDate") or today.isoformat()
+            }
+        elif "month" in entities or "quarter" in entities:
+            span = self.resolve(_entity_phrase(entities), today)
+        elif "period" in entities:
+            span = self.resolve(str(entities["period"]), today)
+        elif "timePeriod" in entities:
+            span = self.resolve(str(entities["timePeriod"]), today)
+
+        if span is None:
+            return {}
+        return {"startDate": span[0], "endDate": span[1]}
+
+
+def _entity_phrase(entities: Dict[str, Any]) -> str:
+    """A period phrase from separate year, quarter, half and month entities."""
+    year = str(entities.get("year", "")).strip()
+    if entities.get("quarter") not in (None, ""):
+        quarter = str(entities["quarter"]).strip().lower()
+        return f"{quarter if quarter.startswith('q') or ' ' in quarter else 'q' + quarter} {year}"
+    if entities.get("half") not in (None, ""):
+        half = str(entities["half"]).strip().lower()
+        return f"{half if half.startswith('h') or ' ' in half else 'h' + half} {year}"
+    if entities.get("month") not in (None, ""):
+        month = str(entities["month"]).strip()
+        if month.isdigit() and 1 <= int(month) <= 12:
+            month = calendar.month_name[int(month)]
+        return f"{month} {year}"
+    return year
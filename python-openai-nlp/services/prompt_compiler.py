@@ -0,0 +1,126 @@
+from typing import Dict, List, Callable, Optional, Tuple
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+
+def compute_mapping_version(mapping_dir: str = "mapping") -> str:
+    """
+    Compute a fingerprint of the mapping/*.json contents.
+
+    The fingerprint changes whenever any mapping file is added, removed or edited,
+    so it can be used as a cache key for anything derived from the mappings.
+
+    Args:
+        mapping_dir: Directory containing index.json and the per-module mapping files
+
+    Returns:
+        str: A short hex digest identifying the current mapping version
+    """
+    files = {}
+    for file_name in os.listdir(mapping_dir):
+        if file_name.endswith(".json"):
+            with open(os.path.join(mapping_dir, file_name), "rb") as f:
+                files[file_name] = f.read()
+    return fingerprint_mapping_files(files)
+
+
+def fingerprint_mapping_files(files: Dict[str, bytes]) -> str:
+    """Compute the mapping version from already loaded mapping files, keyed by file name."""
+    digest = hashlib.sha256()
+    for file_name in sorted(files):
+        digest.update(file_name.encode("utf-8"))
+        digest.update(files[file_name])
+    return digest.hexdigest()[:16]
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count the tokens in a prompt, falling back to an estimate if tiktoken is unavailable."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return len(encoding.encode(text))
+    except ImportError:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class CompiledPrompt:
+    """An immutable message prefix built for a single mapping version."""
+
+    def __init__(self, mapping_version: str, messages: List[Dict[str, str]], token_count: int):
+        self.mapping_version = mapping_version
+        self.messages = tuple(messages)
+        self.token_count = token_count
+
+    def build_messages(self, user_content: str) -> List[Dict[str, str]]:
+        """Return the compiled prefix followed by the user message."""
+        return [*self.messages, {"role": "user", "content": user_content}]
+
+
+class PromptCompiler:
+    """
+    Builds prompt message prefixes once per mapping version.
+
+    Each registered prompt (the combined-analysis prompt, the stage-one router, the
+    per-module entity prompts) only depends on the module mappings, so it is compiled
+    the first time a mapping version is seen and reused for every subsequent request.
+    Keeping the prefix byte-for-byte stable also lets the upstream provider reuse its
+    prompt cache across requests.
+    """
+
+    def __init__(self, model: Optional[str] = None):
+        self._model = model
+        self._builders: Dict[str, Tuple[Callable[[], str], Optional[str]]] = {}
+        self._mapping_version: Optional[str] = None
+        self._compiled: Dict[str, CompiledPrompt] = {}
+
+    def register(self, name: str, build_system_prompt: Callable[[], str], assistant_examples: Optional[str] = None) -> None:
+        """
+        Register a prompt to be compiled on demand.
+
+        Args:
+            name: Name used to compile the prompt
+            build_system_prompt: Builds the system prompt from the current mappings
+            assistant_examples: Optional few-shot examples sent as the assistant turn
+        """
+        self._builders[name] = (build_system_prompt, assistant_examples)
+        self._compiled.pop(name, None)
+
+    def compile(self, mapping_version: str, name: str = "combined") -> CompiledPrompt:
+        """
+        Get a compiled prompt for a mapping version, building it on first use.
+
+        Args:
+            mapping_version: Fingerprint of the mapping files the prompt is built from
+            name: Name the prompt was registered under
+
+        Returns:
+            CompiledPrompt: The cached message prefix for this mapping version
+        """
+        if mapping_version != self._mapping_version:
+            # Only the latest mapping version is ever used, so drop stale prefixes
+            self._compiled = {}
+            self._mapping_version = mapping_version
+
+        compiled = self._compiled.get(name)
+        if compiled is not None:
+            return compiled
+
+        build_system_prompt, assistant_examples = self._builders[name]
+        messages = [{"role": "system", "content": build_system_prompt()}]
+        if assistant_examples:
+            messages.append({"role": "assistant", "content": assistant_examples})
+        token_count = sum(estimate_tokens(m["content"], self._model) for m in messages)
+        compiled = CompiledPrompt(mapping_version, messages, token_count)
+
+        self._compiled[name] = compiled
+        logger.info(f"Compiled {name} prompt for mapping version {mapping_version}: ~{token_count} tokens")
+        return compiled
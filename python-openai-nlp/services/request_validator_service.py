@@ -1,39 +1,26 @@
 from typing import Dict, Any, List, Optional
-import httpx
 import logging
 from config import Settings
+from services.http_clients import get_http_clients
+from services.llm_gateway import get_llm_gateway
+from services.mapping_registry import MappingRegistry
 import json
-from openai import AsyncOpenAI
 import os
 
 logger = logging.getLogger(__name__)
 
 class RequestValidatorService:
-    def __init__(self):
-        self.settings = Settings()
+    def __init__(self, settings: Optional[Settings] = None, mappings: Optional[MappingRegistry] = None):
+        self.settings = settings or Settings()
         self.base_url = self.settings.external_api_base_url
-        self.client = httpx.AsyncClient()
+        self.client = get_http_clients().api
         # Load module mappings to use local data instead of API calls
-        self.module_mappings = self._load_module_mappings()
+        self.module_mappings = self._load_module_mappings(mappings)
         
-    def _load_module_mappings(self) -> Dict[str, Any]:
-        """Load all module mappings from the mapping directory."""
+    def _load_module_mappings(self, mappings: Optional[MappingRegistry] = None) -> Dict[str, Any]:
+        """Get all module mappings, with their properties, from the mapping registry."""
         try:
-            # Load index file
-            with open('mapping/index.json', 'r') as f:
-                modules = json.load(f)
-            
-            # Load individual module mappings
-            mappings = {}
-            for module in modules:
-                with open(f"mapping/{module['mappingFile']}", 'r') as f:
-                    module_data = json.load(f)
-                    mappings[module['moduleCode']] = {
-                        **module,
-                        'submodules': module_data.get('submodules', []),
-                        'properties': module_data.get('properties', {})
-                    }
-            return mappings
+            return (mappings or MappingRegistry()).with_properties()
         except Exception as e:
             logger.error(f"Error loading module mappings: {str(e)}")
             return {}
@@ -158,10 +145,7 @@ class RequestValidatorService:
     async def _extract_entities(self, raw_text: str, schema: Dict[str, Any]) -> Dict[str, Any]:
         """Extract entities from raw text based on JSON schema properties."""
         try:
-            client = AsyncOpenAI(
-                api_key=self.settings.openai_api_key,
-                http_client=httpx.AsyncClient()
-            )
+            llm = get_llm_gateway()
             
             # Create a prompt that includes property information from schema
             properties = schema.get("properties", {})
@@ -200,7 +184,7 @@ Return ONLY a JSON object with parameter names as keys and extracted values.
                 }
             ]
             
-            response = await client.chat.completions.create(
+            response = await llm.create(
                 model=self.settings.openai_model,
                 messages=messages,
                 temperature=0.1,
@@ -0,0 +1,86 @@
+from typing import Dict, Any, Optional, Tuple, Hashable
+from collections import OrderedDict
+import copy
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Punctuation folded away at token boundaries. Currency symbols, '%' and inner
+# decimal points are kept because they change the meaning of a command.
+FOLDED_PUNCTUATION = ".,!?;:'\"()[]{}<>`~*_"
+
+
+def normalize_command_text(text: str) -> str:
+    """
+    Normalize a command for cache lookups.
+
+    Folds case and whitespace and strips punctuation from the edges of each token,
+    so "Show my balance!" and "  show MY balance" share a key while "10.5" and "105" do not.
+    """
+    tokens = (token.strip(FOLDED_PUNCTUATION) for token in text.lower().split())
+    return " ".join(token for token in tokens if token)
+
+
+class ResultCache:
+    """
+    A bounded LRU cache with a per-entry TTL.
+
+    Values are deep-copied on the way in and out, so callers can freely mutate
+    the results they get back (query_service normalizes entities in place).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a copy of the cached value, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a copy of the value, evicting the least recently used entry when full."""
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all cached entries (counters are kept)."""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
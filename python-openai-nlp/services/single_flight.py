@@ -0,0 +1,79 @@
+from typing import Dict, Any, Awaitable, Callable, Hashable, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call:
+    """A shared in-flight call and the number of callers waiting on it."""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one shared call.
+
+    The first caller for a key starts the call as a task; callers arriving while it is
+    in flight await the same task instead of starting their own. Errors are re-raised to
+    every waiter. A waiter being cancelled does not cancel the shared call unless it was
+    the last one waiting, in which case the call is abandoned and the next caller for the
+    key starts a fresh one.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn() for the key, or join the call already in flight for it.
+
+        Args:
+            key: Identifies equivalent calls
+            fn: Starts the call; only invoked when no call for the key is in flight
+
+        Returns:
+            The result of the shared call
+        """
+        call = self._calls.get(key)
+        if call is None or call.abandoned:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task, key=key, call=call: self._finish(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Joining in-flight call for {key!r}")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller has gone away, so nobody needs the result any more
+                call.abandoned = True
+                call.task.cancel()
+
+    def _finish(self, key: Hashable, call: _Call) -> None:
+        """Forget a completed call and mark its exception as retrieved."""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return coalescing counters."""
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
@@ -1,8 +1,7 @@
 from typing import Dict, Any, Optional, List
+import asyncio
 import json
 import logging
-import os
-from datetime import datetime
 from services.nlp_service import NLPService
 from services.request_validator_service import RequestValidatorService
 from services.transfer_service import TransferService
@@ -13,55 +12,90 @@ from models.smart_text_models import (
     SmartResponseContent, CardEntity
 )
 from config import Settings
-from openai import AsyncOpenAI
+from services.http_clients import get_http_clients
+from services.llm_gateway import get_llm_gateway, LLMUnavailableError
+from services.adaptive_limiter import OverloadedError
+from services.metrics import stage
+from services.context_store import create_context_store
+from services.context_writer import ContextWriter
+from services.history_manager import HistoryManager, new_session, session_from_context
 import httpx
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 class SmartTextService:
-    def __init__(self):
-        self.settings = Settings()
-        self.nlp_service = NLPService()
-        self.validator_service = RequestValidatorService()
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        nlp_service: Optional[NLPService] = None,
+        validator_service: Optional[RequestValidatorService] = None,
+        transfer_service: Optional[TransferService] = None,
+        analytics_service: Optional[AnalyticsService] = None,
+        context_writer: Optional[ContextWriter] = None,
+        history_manager: Optional[HistoryManager] = None
+    ):
+        self.settings = settings or Settings()
+        self.nlp_service = nlp_service or NLPService(settings=self.settings)
+        self.validator_service = validator_service or RequestValidatorService(settings=self.settings)
         
-        self.transfer_service = TransferService()
-        self.analytics_service = AnalyticsService()
-        self.context_file = "data/conversation_context.json"
-        self.client = AsyncOpenAI(
-            api_key=self.settings.openai_api_key,
-            http_client=httpx.AsyncClient()
+        self.transfer_service = transfer_service or TransferService(settings=self.settings)
+        self.analytics_service = analytics_service or AnalyticsService(settings=self.settings)
+        self.context_writer = context_writer or ContextWriter(
+            create_context_store(self.settings),
+            write_behind=self.settings.context_write_behind,
+            flush_interval_ms=self.settings.context_flush_interval_ms,
+            max_batch=self.settings.context_flush_max_batch
         )
-        self.api_client = httpx.AsyncClient(base_url=self.settings.external_api_base_url)
-        self.current_user_id = None
-        
-        # Create data directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.context_file), exist_ok=True)
+        self.history_manager = history_manager or HistoryManager(
+            max_turns=self.settings.history_max_turns,
+            token_budget=self.settings.history_token_budget,
+            max_stored_turns=self.settings.history_max_stored_turns,
+            model=self.settings.openai_model
+        )
+        self.llm = get_llm_gateway()
+        self.api_client = get_http_clients().api
         
     async def process_smart_text(self, user_id: str, raw_text: str, is_new_session: bool) -> Dict[str, Any]:
         """Process user text with context awareness and generate smart responses."""
         try:
-            # Store the current user_id for API calls
-            self.current_user_id = user_id
-            
-            # 1. Context Retrieval (if needed)
-            previous_context = None
-            if not is_new_session:
-                previous_context = self._get_conversation_context(user_id)
+            # 1. Context Retrieval (a new session starts without history)
+            if is_new_session:
+                session = new_session(user_id)
+            else:
+                with stage("context_read"):
+                    session = session_from_context(await self._get_conversation_context(user_id), user_id)
             
             # 2. NLP Analysis
             nlp_result = None
             flow_type = None
+            route: Dict[str, Any] = {}
+            prefetch: Dict[str, Any] = {}
+            
+            def handle_route(early_route: Dict[str, Any]) -> None:
+                # Start the backend fetch while the entities are still being parsed
+                route.update(early_route)
+                if early_route["flow"] not in ("TRANSFER", "ANALYTICS"):
+                    prefetch.update(self._start_prefetch(early_route, user_id))
+            
             try:
-                nlp_response_object = await process_text(TextCommand(text=raw_text, user_id=user_id))
-                # Convert NLPResponse object to dict format expected by rest of code
+                nlp_response_object = await process_text(
+                    TextCommand(text=raw_text, user_id=user_id),
+                    on_route=handle_route
+                )
+                # Convert the response to the dict format expected by rest of code
                 nlp_result = {
-                    "module": nlp_response_object.module.model_dump(),
-                    "sub_module": nlp_response_object.sub_module.model_dump(),
+                    "module": {
+                        "moduleCode": route["module"]["moduleCode"],
+                        "moduleName": route["module"]["moduleName"]
+                    } if route else None,
+                    "sub_module": route.get("sub_module"),
                     "entities": nlp_response_object.entities,
-                    "error": nlp_response_object.error
+                    "error": nlp_response_object.error,
+                    # How the command was resolved (source and confidence)
+                    "metadata": nlp_response_object.metadata
                 }
-                if nlp_result["error"] is not None:
+                if nlp_result["error"] is not None or not route:
                     return self._create_error_response(
                         raw_text=raw_text,
                         error_msg="Could not determine module/submodule",
@@ -69,8 +103,15 @@ class SmartTextService:
                         nlp_result=nlp_result
                     )
                 
-                # Determine flow type
-                flow_type = await self.nlp_service.determine_flow(raw_text, nlp_result["module"]["moduleCode"])
+                # The flow was determined along with the module; the mapping decision table
+                # is only consulted if it is missing
+                flow_type = nlp_response_object.flow or route.get("flow")
+                if not flow_type:
+                    flow_type = await self.nlp_service.determine_flow(
+                        raw_text,
+                        nlp_result["module"]["moduleCode"],
+                        nlp_result["sub_module"].get("submoduleCode")
+                    )
                 
                 # Check if flow type is TRANSFER and return graceful message
                 if flow_type == "TRANSFER":
@@ -81,6 +122,8 @@ class SmartTextService:
                         nlp_result=nlp_result,
                         flow_type=flow_type
                     )
+            except OverloadedError:
+                raise
             except Exception as e:
                 logger.error(f"Error in NLP analysis: {str(e)}")
                 return self._create_error_response(
@@ -99,7 +142,7 @@ class SmartTextService:
                     api_data = nlp_result.get("resolution", {})
                     logger.info("Using NLP response data for analytics flow")
                 else:
-                    api_data = await self._get_api_data(flow_type, nlp_result)
+                    api_data = await self._get_api_data(flow_type, nlp_result, user_id, prefetch)
                     if "error" in api_data:
                         logger.error(f"API error: {api_data['error']}")
                         return self._create_error_response(
@@ -134,12 +177,15 @@ class SmartTextService:
             
             # 5. Generate smart response
             try:
-                smart_response = await self._generate_smart_response(
-                    raw_text=raw_text,
-                    nlp_result=nlp_result,
-                    api_data=api_data,
-                    previous_context=previous_context
-                )
+                with stage("smart_response"):
+                    smart_response = await self._generate_smart_response(
+                        raw_text=raw_text,
+                        nlp_result=nlp_result,
+                        api_data=api_data,
+                        session=session
+                    )
+            except OverloadedError:
+                raise
             except Exception as e:
                 logger.error(f"Error generating smart response: {str(e)}")
                 return self._create_error_response(
@@ -151,26 +197,28 @@ class SmartTextService:
                 )
             
             # 6. Context Storage
-            current_context = {
-                "timestamp": datetime.now().isoformat(),
-                "raw_text": raw_text,
-                "response": smart_response
-            }
-            self._save_conversation_context(user_id, current_context)
+            with stage("context_write"):
+                await self._save_conversation_context(
+                    user_id,
+                    self.history_manager.record(session, raw_text, smart_response.content, nlp_result, flow_type)
+                )
             
             # 7. Create success response
             return {
-                "module": Module(**nlp_result["module"]),
-                "sub_module": SubModule(**nlp_result["sub_module"]),
+                "module": self._module_model(nlp_result["module"]),
+                "sub_module": self._submodule_model(nlp_result["sub_module"]),
                 "flow": flow_type,
                 "entities": nlp_result["entities"],
                 "validation": validation_result,
                 "resolution": resolution_result,
                 "raw_text": raw_text,
                 "smart_response": smart_response,
+                "metadata": nlp_result.get("metadata"),
                 "error": None
             }
             
+        except OverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Error processing smart text: {str(e)}")
             return self._create_error_response(
@@ -180,6 +228,18 @@ class SmartTextService:
                 nlp_result=nlp_result if 'nlp_result' in locals() else None,
                 flow_type=flow_type if 'flow_type' in locals() else None
             )
+        finally:
+            # A prefetch that was never used must not outlive the request
+            if 'prefetch' in locals() and prefetch and not prefetch["task"].done():
+                prefetch["task"].cancel()
+    
+    def _module_model(self, module: Dict[str, Any]) -> Module:
+        """The registry's prebuilt Module, validating the dict only if it is unknown."""
+        return self.nlp_service.mappings.module(module.get("moduleCode")) or Module(**module)
+    
+    def _submodule_model(self, submodule: Dict[str, Any]) -> SubModule:
+        """The registry's prebuilt SubModule, validating the dict only if it is unknown."""
+        return self.nlp_service.mappings.submodule(submodule.get("submoduleCode")) or SubModule(**submodule)
     
     def _create_error_response(
         self, 
@@ -212,6 +272,7 @@ class SmartTextService:
                 content=user_message,
                 entities=None
             ),
+            "metadata": None,
             "error": error_msg
         }
         
@@ -219,18 +280,21 @@ class SmartTextService:
         if nlp_result:
             if "module" in nlp_result and nlp_result["module"]:
                 try:
-                    response["module"] = Module(**nlp_result["module"])
+                    response["module"] = self._module_model(nlp_result["module"])
                 except Exception:
                     pass
                     
             if "sub_module" in nlp_result and nlp_result["sub_module"]:
                 try:
-                    response["sub_module"] = SubModule(**nlp_result["sub_module"])
+                    response["sub_module"] = self._submodule_model(nlp_result["sub_module"])
                 except Exception:
                     pass
                     
             if "entities" in nlp_result and nlp_result["entities"]:
                 response["entities"] = nlp_result["entities"]
+            
+            if nlp_result.get("metadata"):
+                response["metadata"] = nlp_result["metadata"]
         
         # Preserve flow type if available
         if flow_type:
@@ -238,8 +302,83 @@ class SmartTextService:
             
         return response
     
-    async def _get_api_data(self, flow_type: str, nlp_result: Dict[str, Any]) -> Dict[str, Any]:
-        """Get data from appropriate backend APIs based on flow type and NLP result."""
+    def _endpoint_template(self, module_code: str, submodule: Dict[str, Any]) -> str:
+        """Get endpoint from submodule if available, otherwise construct it."""
+        endpoint = submodule.get("endpoint")
+        if not endpoint:
+            endpoint = f"/{module_code.lower()}/{submodule['submoduleCode'].lower()}"
+        return endpoint
+    
+    def _resolve_endpoint(self, endpoint: str, entities: Dict[str, Any], user_id: str) -> str:
+        """Fill in the URL parameters (e.g., :userId) of an endpoint for the given user."""
+        url_params = {}
+        parts = endpoint.split('/')
+        processed_parts = []
+        
+        for part in parts:
+            if part.startswith(':'):
+                param_name = part[1:]  # Remove the : prefix
+                if param_name == 'userId':
+                    # The user the request is made for, never shared state
+                    url_params[param_name] = user_id
+                else:
+                    # Check if the parameter exists in entities
+                    param_value = entities.get(param_name)
+                    if param_value:
+                        url_params[param_name] = param_value
+                    else:
+                        logger.warning(f"Missing URL parameter: {param_name}")
+                        url_params[param_name] = ''
+                processed_parts.append(url_params[param_name])
+            else:
+                processed_parts.append(part)
+        
+        # Reconstruct the endpoint with replaced parameters
+        return '/'.join(p for p in processed_parts if p)
+    
+    def _start_prefetch(self, route: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        """
+        Speculatively fetch the route's endpoint before the entities are known.
+        
+        Only endpoints whose URL needs nothing but the userId are prefetched, without query
+        parameters. The response is used only if the final request turns out identical,
+        which is the case for commands without entities (e.g. "show my cards").
+        
+        Returns:
+            Dict[str, Any]: The resolved endpoint and its fetch task, or {} if not prefetched
+        """
+        try:
+            submodule = route["sub_module"]
+            endpoint = self._endpoint_template(route["module"]["moduleCode"], submodule)
+        except (KeyError, TypeError, AttributeError):
+            return {}
+        if any(part.startswith(':') and part != ':userId' for part in endpoint.split('/')):
+            return {}
+        
+        processed_endpoint = self._resolve_endpoint(endpoint, {}, user_id)
+        logger.info(f"Prefetching API endpoint: {processed_endpoint}")
+        task = asyncio.ensure_future(self.api_client.get(processed_endpoint))
+        # Unused prefetches are dropped, so their errors must not be reported as unretrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return {"endpoint": processed_endpoint, "task": task}
+    
+    async def _get_api_data(
+        self,
+        flow_type: str,
+        nlp_result: Dict[str, Any],
+        user_id: str,
+        prefetch: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Get data from appropriate backend APIs based on flow type and NLP result.
+        
+        Args:
+            flow_type: The flow type of the command
+            nlp_result: The module, sub_module and entities of the command
+            user_id: The user whose data is fetched
+            prefetch: A speculative fetch started from the early route, reused if it
+                requested the same endpoint with the same (empty) parameters
+        """
         try:
             # Extract module and submodule codes
             module_code = nlp_result["module"]["moduleCode"]
@@ -248,10 +387,7 @@ class SmartTextService:
             if not module_code or not submodule:
                 raise ValueError("Missing module or submodule in NLP result")
             
-            # Get endpoint from submodule if available, otherwise construct it
-            endpoint = submodule.get("endpoint")
-            if not endpoint:
-                endpoint = f"/{module_code.lower()}/{submodule['submoduleCode'].lower()}"
+            endpoint = self._endpoint_template(module_code, submodule)
             
             # Add query parameters based on extracted entities
             params = {}
@@ -259,35 +395,18 @@ class SmartTextService:
                 if value is not None:
                     params[key] = value
             
-            # Process URL parameters (e.g., :userId)
-            url_params = {}
-            parts = endpoint.split('/')
-            processed_parts = []
+            processed_endpoint = self._resolve_endpoint(endpoint, nlp_result.get("entities", {}), user_id)
             
-            for part in parts:
-                if part.startswith(':'):
-                    param_name = part[1:]  # Remove the : prefix
-                    if param_name == 'userId':
-                        # Handle userId from the request context
-                        url_params[param_name] = self.current_user_id
-                    else:
-                        # Check if the parameter exists in entities
-                        param_value = nlp_result.get("entities", {}).get(param_name)
-                        if param_value:
-                            url_params[param_name] = param_value
-                        else:
-                            logger.warning(f"Missing URL parameter: {param_name}")
-                            url_params[param_name] = ''
-                    processed_parts.append(url_params[param_name])
+            # Make the API call, unless the prefetch already made the same one
+            with stage("backend_api"):
+                if prefetch and prefetch["endpoint"] == processed_endpoint and not params:
+                    logger.info(f"Using prefetched API response for endpoint: {processed_endpoint}")
+                    response = await prefetch["task"]
                 else:
-                    processed_parts.append(part)
-            
-            # Reconstruct the endpoint with replaced parameters
-            processed_endpoint = '/'.join(p for p in processed_parts if p)
-            
-            # Make the API call
-            logger.info(f"Making API call to endpoint: {processed_endpoint} with params: {params}")
-            response = await self.api_client.get(processed_endpoint, params=params)
+                    if prefetch:
+                        prefetch["task"].cancel()
+                    logger.info(f"Making API call to endpoint: {processed_endpoint} with params: {params}")
+                    response = await self.api_client.get(processed_endpoint, params=params)
             response.raise_for_status()
             
             api_data = response.json()
@@ -315,18 +434,12 @@ class SmartTextService:
         raw_text: str,
         nlp_result: Dict[str, Any],
         api_data: Dict[str, Any],
-        previous_context: Optional[Dict[str, Any]] = None
+        session: Optional[Dict[str, Any]] = None
     ) -> SmartResponseContent:
         """Generate a conversational smart response using OpenAI."""
         try:
-            # Create context-aware prompt
-            context_text = ""
-            if previous_context:
-                context_text = f"""Previous interaction:
-User: {previous_context['raw_text']}
-Assistant: {previous_context['response']}
-
-"""
+            # Create context-aware prompt: the latest turns within the token budget, older ones summarized
+            context_text = self.history_manager.prompt_context(session)
             
             messages = [
                 {
@@ -351,7 +464,7 @@ For card-related queries, format the response with markdown for better readabili
                 }
             ]
             
-            response = await self.client.chat.completions.create(
+            response = await self.llm.create(
                 model=self.settings.openai_model,
                 messages=messages,
                 temperature=0.7,
@@ -371,6 +484,18 @@ For card-related queries, format the response with markdown for better readabili
                 entities=None
             )
             
+        except OverloadedError:
+            raise
+        except LLMUnavailableError as e:
+            logger.warning(f"LLM unavailable for smart response, answering locally: {str(e)}")
+            content = f"Here is your {nlp_result['sub_module'].get('submoduleName', nlp_result['module']['moduleName'])} information."
+            if nlp_result["module"]["moduleCode"] == "CARD":
+                return self._create_card_response(content, api_data)
+            return SmartResponseContent(
+                type="text",
+                content=content,
+                entities=None
+            )
         except Exception as e:
             logger.error(f"Error generating smart response: {str(e)}")
             return SmartResponseContent(
@@ -407,49 +532,17 @@ For card-related queries, format the response with markdown for better readabili
                 entities=None
             )
     
-    def _get_conversation_context(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve previous conversation context from file storage."""
+    async def _get_conversation_context(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve the conversation session (or older single-turn context) of a user from the context store."""
         try:
-            if os.path.exists(self.context_file):
-                try:
-                    with open(self.context_file, 'r', encoding='utf-8') as f:
-                        contexts = json.load(f)
-                        return contexts.get(user_id)
-                except json.JSONDecodeError:
-                    logger.warning("Invalid JSON in context file. Creating new context file.")
-                    # If JSON is invalid, create a new empty context file
-                    with open(self.context_file, 'w', encoding='utf-8') as f:
-                        json.dump({}, f)
-                    return None
-            return None
+            return await self.context_writer.get(user_id)
         except Exception as e:
             logger.error(f"Error reading conversation context: {str(e)}")
             return None
     
-    def _save_conversation_context(self, user_id: str, context: Dict[str, Any]):
-        """Save current conversation context to file storage."""
+    async def _save_conversation_context(self, user_id: str, session: Dict[str, Any]):
+        """Queue the conversation session of a user for the context store."""
         try:
-            contexts = {}
-            if os.path.exists(self.context_file):
-                try:
-                    with open(self.context_file, 'r', encoding='utf-8') as f:
-                        contexts = json.load(f)
-                except json.JSONDecodeError:
-                    logger.warning("Invalid JSON in context file. Starting with empty context.")
-                    contexts = {}
-            
-            # Ensure the context is JSON serializable
-            context_copy = {
-                "timestamp": context["timestamp"],
-                "raw_text": context["raw_text"],
-                "response": context["response"].model_dump() if hasattr(context["response"], "model_dump") else context["response"]
-            }
-            
-            contexts[user_id] = context_copy
-            
-            # Write with proper encoding and formatting
-            with open(self.context_file, 'w', encoding='utf-8') as f:
-                json.dump(contexts, f, indent=2, ensure_ascii=False)
-                
+            await self.context_writer.put(user_id, session)
         except Exception as e:
-            logger.error(f"Error saving conversation context: {str(e)}") 
\ No newline at end of file
+            logger.error(f"Error saving conversation context: {str(e)}")
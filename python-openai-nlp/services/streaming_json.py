@@ -0,0 +1,112 @@
+from typing import Dict, Any, Optional
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# What the scanner expects next inside the top-level object
+_KEY = "key"
+_VALUE = "value"
+_AFTER_VALUE = "after_value"
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object as it streams in, one chunk at a time.
+
+    Each top-level field is decoded as soon as its value is complete, so callers can act
+    on "module" or "flow" while the rest of the object ("entities") is still arriving.
+    Nested values are only decoded once they are closed. Use value() for the complete
+    object once the stream has ended.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._state = _KEY
+        self._token_start = 0
+        self._key: Optional[str] = None
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """
+        Add the next chunk of the stream.
+
+        Args:
+            chunk: The next piece of the JSON text
+
+        Returns:
+            Dict[str, Any]: The top-level fields completed by this chunk
+        """
+        self.text += chunk
+        completed: Dict[str, Any] = {}
+
+        for pos in range(self._pos, len(self.text)):
+            ch = self.text[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_token(pos, completed)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._state == _KEY:
+                    self._token_start = pos
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    # A nested object or array value just closed
+                    self._close_token(pos, completed)
+                elif self._depth == 0:
+                    if self._state == _VALUE:
+                        self._emit(self.text[self._token_start:pos], completed)
+                    self.complete = True
+            elif self._depth == 1:
+                if ch == ":":
+                    self._state = _VALUE
+                    self._token_start = pos + 1
+                elif ch == ",":
+                    if self._state == _VALUE:
+                        self._emit(self.text[self._token_start:pos], completed)
+                    self._state = _KEY
+
+        self._pos = len(self.text)
+        return completed
+
+    def _close_token(self, pos: int, completed: Dict[str, Any]) -> None:
+        """Handle a string, object or array ending directly inside the top-level object."""
+        if self._state == _KEY:
+            self._key = json.loads(self.text[self._token_start:pos + 1])
+        elif self._state == _VALUE:
+            self._emit(self.text[self._token_start:pos + 1], completed)
+            self._state = _AFTER_VALUE
+
+    def _emit(self, raw_value: str, completed: Dict[str, Any]) -> None:
+        """Decode a finished top-level value."""
+        if self._key is None:
+            return
+        try:
+            value = json.loads(raw_value)
+        except json.JSONDecodeError:
+            # Left for the final parse of the whole object to report
+            logger.debug(f"Could not decode streamed value for '{self._key}': {raw_value!r}")
+            return
+        self.fields[self._key] = value
+        completed[self._key] = value
+
+    def value(self) -> Any:
+        """Decode the complete streamed text."""
+        return json.loads(self.text)
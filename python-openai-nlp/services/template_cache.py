@@ -0,0 +1,190 @@
+from typing import Dict, Any, List, Optional, Tuple
+from decimal import Decimal, InvalidOperation
+import copy
+import logging
+import re
+
+from services.result_cache import ResultCache, normalize_command_text
+
+logger = logging.getLogger(__name__)
+
+# Dates, numbers and capitalized name spans are masked into slots. Currency symbols
+# stay in the template text so "$100" and "€100" never share a template.
+SLOT_PATTERN = re.compile(
+    r"(?P<date>\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b)"
+    r"|(?P<number>(?<![\w.])\d[\d,]*(?:\.\d+)?(?!\w)(?!\.\d))"
+    r"|(?P<name>\b[A-Z][a-z'\-]+(?:\s+[A-Z][a-z'\-]+)*\b)"
+)
+
+# Capitalized words that are part of the command vocabulary rather than names
+CALENDAR_WORDS = {
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"
+}
+
+CURRENCY_MARKS = "$€£₹¥"
+
+
+def _to_decimal(value: Any) -> Optional[Decimal]:
+    """Parse a number from an entity or slot value, ignoring separators and currency marks."""
+    if isinstance(value, bool):
+        return None
+    try:
+        return Decimal(str(value).replace(",", "").strip().strip(CURRENCY_MARKS).strip())
+    except InvalidOperation:
+        return None
+
+
+class SlotTemplateCache:
+    """
+    Reuses LLM parses for commands that differ only in amounts, dates and names.
+
+    "transfer $100 to John Smith" and "transfer $250 to Alice Jones" both mask to
+    "transfer $ #number# to #name#". The first time a template is seen, the LLM result is
+    inspected to learn which entities were copied from which slot (e.g. amount <- slot 0,
+    beneficiaryName <- slot 1). Later commands matching the template get those entities
+    filled in locally. A template is only learned when every slot maps to an entity, so
+    commands whose slots the LLM interpreted in some other way keep going to the LLM.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600.0):
+        self.templates = ResultCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.learned = 0
+        self.rejected = 0
+
+    def mask(self, text: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """
+        Replace slot values in the text with placeholders.
+
+        Returns:
+            Tuple[str, List[Tuple[str, str]]]: The normalized template key and the
+            (kind, value) of each slot in order of appearance
+        """
+        slots: List[Tuple[str, str]] = []
+        parts: List[str] = []
+        position = 0
+
+        for match in SLOT_PATTERN.finditer(text):
+            kind = match.lastgroup
+            start, value = match.start(), match.group()
+
+            if kind == "name":
+                words = [(m.start(), m.group()) for m in re.finditer(r"\S+", value)]
+                # The first word of a command is capitalized as a matter of course
+                if start == 0:
+                    words = words[1:]
+                if not words or any(word.lower() in CALENDAR_WORDS for _, word in words):
+                    continue
+                start = match.start() + words[0][0]
+                value = " ".join(word for _, word in words)
+
+            parts.append(text[position:start])
+            parts.append(f" #{kind}# ")
+            slots.append((kind, value))
+            position = match.end()
+
+        parts.append(text[position:])
+        return normalize_command_text("".join(parts)), slots
+
+    def lookup(self, text: str, mapping_version: str) -> Optional[Dict[str, Any]]:
+        """
+        Fill a previously learned template with this command's slot values.
+
+        Returns:
+            Optional[Dict[str, Any]]: A process_command style response, or None when
+            the command has no slots or its template has not been learned yet
+        """
+        template_key, slots = self.mask(text)
+        if not slots:
+            return None
+
+        template = self.templates.get((template_key, mapping_version))
+        if template is None:
+            return None
+
+        response = template["response"]
+        entities = response["entities"]
+        for entity_name, (slot_index, value_type) in template["bindings"].items():
+            entities[entity_name] = self._convert(slots[slot_index], value_type)
+
+        response["raw_text"] = text
+        return response
+
+    def learn(self, text: str, mapping_version: str, response: Dict[str, Any]) -> bool:
+        """
+        Record how an LLM response maps back to the slots of the command.
+
+        Returns:
+            bool: True if the template was stored
+        """
+        template_key, slots = self.mask(text)
+        if not slots:
+            return False
+
+        bindings: Dict[str, Tuple[int, str]] = {}
+        bound_slots = set()
+        for entity_name, value in response.get("entities", {}).items():
+            matching_slots = [i for i, slot in enumerate(slots) if self._matches(slot, value)]
+            if len(matching_slots) > 1:
+                # Two slots with the same value - the binding cannot be told apart
+                self.rejected += 1
+                return False
+            if matching_slots:
+                bindings[entity_name] = (matching_slots[0], self._value_type(value))
+                bound_slots.add(matching_slots[0])
+
+        if len(bound_slots) != len(slots):
+            self.rejected += 1
+            logger.debug(f"Not learning template '{template_key}': unbound slots")
+            return False
+
+        template_response = copy.deepcopy(response)
+        template_response.pop("raw_text", None)
+        self.templates.set((template_key, mapping_version), {
+            "response": template_response,
+            "bindings": bindings
+        })
+        self.learned += 1
+        logger.info(f"Learned command template '{template_key}' with bindings {bindings}")
+        return True
+
+    def _matches(self, slot: Tuple[str, str], value: Any) -> bool:
+        """Check whether an entity value was copied from a slot."""
+        kind, slot_value = slot
+        if isinstance(value, (dict, list)) or value is None:
+            return False
+        if kind == "number":
+            entity_number = _to_decimal(value)
+            return entity_number is not None and entity_number == _to_decimal(slot_value)
+        if kind == "date":
+            return str(value).strip() == slot_value
+        return str(value).strip().casefold() == slot_value.casefold()
+
+    def _value_type(self, value: Any) -> str:
+        """Remember the type the LLM used so filled values look the same."""
+        if isinstance(value, int) and not isinstance(value, bool):
+            return "int"
+        if isinstance(value, float):
+            return "float"
+        return "str"
+
+    def _convert(self, slot: Tuple[str, str], value_type: str) -> Any:
+        """Convert a slot value to the type learned for its entity."""
+        kind, slot_value = slot
+        if kind != "number":
+            return slot_value
+        number = _to_decimal(slot_value)
+        if value_type == "int" and number == number.to_integral_value():
+            return int(number)
+        if value_type in ("int", "float"):
+            return float(number)
+        return slot_value.replace(",", "")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return template cache counters."""
+        return {
+            **self.templates.stats(),
+            "learned": self.learned,
+            "rejected": self.rejected
+        }
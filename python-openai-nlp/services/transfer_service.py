@@ -1,16 +1,16 @@
 from typing import Dict, Any, List, Optional
-import httpx
 import logging
 from config import Settings
+from services.http_clients import get_http_clients
 import json
 from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
 class TransferService:
-    def __init__(self):
-        self.settings = Settings()
-        self.client = httpx.AsyncClient()
+    def __init__(self, settings: Optional[Settings] = None):
+        self.settings = settings or Settings()
+        self.client = get_http_clients().api
         
     async def resolve_transfer_entities(
         self, 
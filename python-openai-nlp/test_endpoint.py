@@ -28,7 +28,7 @@ def test_process_text():
         data = response.json()
         
         # Check if it has only the simplified fields
-        simplified_fields = {"moduleCode", "submoduleCode", "flow", "entities", "raw_text", "error"}
+        simplified_fields = {"moduleCode", "submoduleCode", "flow", "entities", "raw_text", "error", "metadata"}
         actual_fields = set(data.keys())
         
         print("\nValidation:")
@@ -0,0 +1,143 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from config import Settings
+from services.adaptive_limiter import AdaptiveLimiter, OverloadedError, SUCCESS, DROPPED, IGNORED
+from services.llm_gateway import LLMGateway, LLMUnavailableError, deadline_scope
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class FailingClient:
+    def __init__(self, error):
+        self.error = error
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        raise self.error
+
+
+def test_limit_grows_by_about_one_per_round_of_successes():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=10, max_limit=100)
+        for _ in range(10):
+            await limiter.acquire()
+            limiter.release(SUCCESS, 0.1)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert 10.9 < limiter.limit < 11.1
+    assert limiter.in_flight == 0
+
+
+def test_drop_cuts_the_limit_by_the_backoff_ratio():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=20, min_limit=2, backoff_ratio=0.5)
+        await limiter.acquire()
+        limiter.release(DROPPED)
+        first = limiter.limit
+        for _ in range(10):
+            await limiter.acquire()
+            limiter.release(DROPPED)
+        return first, limiter
+
+    first, limiter = asyncio.run(scenario())
+    assert first == 10
+    assert limiter.limit == 2
+
+
+def test_ignored_outcome_leaves_the_limit():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=20)
+        await limiter.acquire()
+        limiter.release(IGNORED)
+        return limiter
+
+    assert asyncio.run(scenario()).limit == 20
+
+
+def test_calls_over_the_limit_queue_and_are_shed():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=1, queue_timeout=1.0)
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError):
+            # The queue is full
+            await limiter.acquire()
+        limiter.release(SUCCESS, 0.1)
+        waited = await queued
+        limiter.release(SUCCESS, 0.1)
+        return limiter, waited
+
+    limiter, waited = asyncio.run(scenario())
+    assert waited >= 0 and limiter.in_flight == 0
+    assert limiter.stats()["shed"] == 1 and limiter.stats()["queued"] == 1
+
+
+def test_queued_call_is_shed_when_no_slot_frees_up():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, queue_timeout=0.02)
+        await limiter.acquire()
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        return limiter
+
+    assert asyncio.run(scenario()).in_flight == 1
+
+
+def gateway(error, **settings):
+    defaults = {"llm_max_retries": 0, "llm_hedging_enabled": False, "llm_circuit_failure_threshold": 100,
+                "llm_limiter_initial_limit": 20, "llm_limiter_backoff_ratio": 0.5}
+    return LLMGateway(client=FailingClient(error), settings=Settings(**{**defaults, **settings}))
+
+
+def test_rate_limits_shrink_the_gateway_limit():
+    llm = gateway(rate_limit_error())
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(LLMUnavailableError):
+                await llm.create(model="m", messages=[])
+
+    asyncio.run(scenario())
+    assert llm.limiter.limit == 2.5
+    assert llm.limiter.in_flight == 0
+
+
+def test_retry_after_pauses_every_call():
+    llm = gateway(rate_limit_error(retry_after=30), llm_limiter_queue_timeout_ms=50)
+
+    async def scenario():
+        with pytest.raises(LLMUnavailableError):
+            await llm.create(model="m", messages=[])
+        with deadline_scope(1.0):
+            # Nothing is admitted while paused: the call is shed once its queue wait runs out
+            with pytest.raises(OverloadedError):
+                await llm.create(model="m", messages=[])
+
+    asyncio.run(scenario())
+    assert llm.limiter.rate_limited == 1
+
+
+def test_timeout_cut_short_by_the_deadline_is_not_overload():
+    llm = gateway(asyncio.TimeoutError(), llm_attempt_timeout_seconds=5.0)
+
+    async def scenario(budget):
+        with deadline_scope(budget):
+            with pytest.raises(LLMUnavailableError):
+                await llm.create(model="m", messages=[])
+
+    asyncio.run(scenario(1.0))
+    assert llm.limiter.limit == 20
+    asyncio.run(scenario(10.0))
+    assert llm.limiter.limit == 10
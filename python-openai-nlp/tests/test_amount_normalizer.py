@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+import pytest
+
+from services.amount_normalizer import canonical_amount, currency_code, find_amount, normalize_transfer_entities
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("transfer $100 to John Smith", {"amount": Decimal("100.00"), "currency": "USD"}),
+    ("send 500 euros to Alice Johnson", {"amount": Decimal("500.00"), "currency": "EUR"}),
+    ("pay electricity bill of Rs. 2500", {"amount": Decimal("2500.00"), "currency": "INR"}),
+    ("send 1.5 lakh rupees to dad", {"amount": Decimal("150000.00"), "currency": "INR"}),
+    ("transfer 300 CAD to Bob", {"amount": Decimal("300.00"), "currency": "CAD"}),
+    ("send 5k to mom", {"amount": Decimal("5000")}),
+    ("send 2m to Ravi", {"amount": Decimal("2000000")}),
+    ("send 2 mn dollars", {"amount": Decimal("2000000.00"), "currency": "USD"}),
+    ("send 2 crore", {"amount": Decimal("20000000")}),
+])
+def test_amount_and_currency_from_the_text(text, expected):
+    assert normalize_transfer_entities(text, {}) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    # A currency word elsewhere in the command is not the amount's currency
+    ("pay 300 for the cad drawing", {"amount": Decimal("300")}),
+    ("pay the euro invoice 300", {"amount": Decimal("300")}),
+    # One-letter scales apart from the number are not scales
+    ("send 2 m to Ravi", {"amount": Decimal("2")}),
+    ("send 5 k to mom", {"amount": Decimal("5")}),
+    ("send 3 b to the account", {"amount": Decimal("3")}),
+])
+def test_words_away_from_the_amount_are_ignored(text, expected):
+    assert normalize_transfer_entities(text, {}) == expected
+
+
+def test_model_entities_are_made_canonical():
+    entities = normalize_transfer_entities("send 1,50,000 to dad", {"amount": "1,50,000", "currency": "rupees"})
+    assert entities == {"amount": Decimal("150000.00"), "currency": "INR"}
+    # The model read "1.5 lakh" as 1.5: the scaled value from the text wins
+    entities = normalize_transfer_entities("send 1.5 lakh to dad", {"amount": 1.5, "currency": "INR"})
+    assert entities["amount"] == Decimal("150000.00")
+
+
+def test_currency_with_a_scale_wins_over_a_bare_number():
+    assert find_amount("from account 12345678 send Rs. 2500").value == Decimal("2500")
+
+
+@pytest.mark.parametrize("value", [Decimal("1e30"), Decimal("Infinity"), Decimal("NaN")])
+def test_amounts_that_cannot_be_rounded_are_left_as_they_are(value):
+    assert canonical_amount(value, "USD") is None
+    assert normalize_transfer_entities("send money", {"amount": value, "currency": "USD"})["amount"] is value
+
+
+def test_currency_codes():
+    assert currency_code("usd") == "USD"
+    assert currency_code("£") == "GBP"
+    assert currency_code("dollars") == "USD"
+    assert currency_code("doubloons") is None
+    assert currency_code(None) is None
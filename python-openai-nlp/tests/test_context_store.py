@@ -0,0 +1,31 @@
+import pytest
+
+from services.context_store import ContextBackend, SQLiteContextBackend, ShardedFileContextBackend
+
+
+def test_backend_missing_a_method_cannot_be_created():
+    class ReadOnlyBackend(ContextBackend):
+        def read(self, user_id, version=None):
+            return None, None
+
+    with pytest.raises(TypeError):
+        ReadOnlyBackend()
+
+
+@pytest.mark.parametrize("make", [
+    lambda path: SQLiteContextBackend(str(path / "contexts.db")),
+    lambda path: ShardedFileContextBackend(str(path / "contexts")),
+])
+def test_backends_store_and_delete_a_context(tmp_path, make):
+    backend = make(tmp_path)
+    try:
+        assert backend.is_empty()
+        backend.put("alice", {"last_intent": "balance"})
+        assert backend.get("alice") == {"last_intent": "balance"}
+        assert dict(backend.items()) == {"alice": {"last_intent": "balance"}}
+
+        backend.delete("alice")
+        assert backend.get("alice") is None
+        assert backend.is_empty()
+    finally:
+        backend.close()
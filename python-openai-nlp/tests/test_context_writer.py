@@ -0,0 +1,114 @@
+import asyncio
+
+from services.context_store import ContextStore, SQLiteContextBackend
+from services.context_writer import ContextWriter
+
+
+class RecordingBackend(SQLiteContextBackend):
+    """SQLite storage that records every batch written and can be told to fail."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.batches = []
+        self.fail = False
+
+    def put_many(self, contexts):
+        if self.fail:
+            raise OSError("disk full")
+        self.batches.append(dict(contexts))
+        return super().put_many(contexts)
+
+
+def writer(tmp_path, **options):
+    backend = RecordingBackend(str(tmp_path / "contexts.db"))
+    return backend, ContextWriter(ContextStore(backend), **options)
+
+
+def stored(tmp_path):
+    backend = SQLiteContextBackend(str(tmp_path / "contexts.db"))
+    try:
+        return dict(backend.items())
+    finally:
+        backend.close()
+
+
+def test_close_flushes_queued_contexts(tmp_path):
+    backend, contexts = writer(tmp_path, flush_interval_ms=60000)
+
+    async def scenario():
+        await contexts.put("alice", {"turn": 1})
+        await contexts.put("bob", {"turn": 1})
+        assert backend.batches == []
+        await contexts.close()
+
+    asyncio.run(scenario())
+    assert backend.batches == [{"alice": {"turn": 1}, "bob": {"turn": 1}}]
+    assert stored(tmp_path) == {"alice": {"turn": 1}, "bob": {"turn": 1}}
+
+
+def test_close_waits_for_a_running_flush(tmp_path):
+    backend, contexts = writer(tmp_path, flush_interval_ms=1)
+
+    async def scenario():
+        await contexts.put("alice", {"turn": 1})
+        await asyncio.sleep(0.005)
+        await contexts.put("alice", {"turn": 2})
+        await contexts.close()
+
+    asyncio.run(scenario())
+    assert stored(tmp_path) == {"alice": {"turn": 2}}
+
+
+def test_updates_before_a_flush_are_written_once(tmp_path):
+    backend, contexts = writer(tmp_path, flush_interval_ms=20)
+
+    async def scenario():
+        for turn in range(5):
+            await contexts.put("alice", {"turn": turn})
+        assert await contexts.get("alice") == {"turn": 4}
+        await asyncio.sleep(0.1)
+        assert backend.batches == [{"alice": {"turn": 4}}]
+        await contexts.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_batch_flushes_without_waiting(tmp_path):
+    backend, contexts = writer(tmp_path, flush_interval_ms=60000, max_batch=3)
+
+    async def scenario():
+        for user in ("alice", "bob", "carol"):
+            await contexts.put(user, {"turn": 1})
+        await asyncio.sleep(0.05)
+        assert len(backend.batches) == 1
+        assert contexts.stats()["queue_depth"] == 0
+        await contexts.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_is_queued_again(tmp_path):
+    backend, contexts = writer(tmp_path, flush_interval_ms=60000)
+
+    async def scenario():
+        await contexts.put("alice", {"turn": 1})
+        backend.fail = True
+        await contexts.flush()
+        assert contexts.failures == 1
+        assert contexts.stats()["queue_depth"] == 1
+        backend.fail = False
+        await contexts.close()
+
+    asyncio.run(scenario())
+    assert stored(tmp_path) == {"alice": {"turn": 1}}
+
+
+def test_without_write_behind_put_waits_for_its_write(tmp_path):
+    backend, contexts = writer(tmp_path, write_behind=False)
+
+    async def scenario():
+        await contexts.put("alice", {"turn": 1})
+        assert backend.batches == [{"alice": {"turn": 1}}]
+        await contexts.close()
+
+    asyncio.run(scenario())
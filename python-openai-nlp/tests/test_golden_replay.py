@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_replay_matches_the_golden_results():
+    # Replays data/golden_cassette.jsonl.gz against fake_banking_backend.py; no request leaves the machine
+    result = subprocess.run(
+        [sys.executable, "benchmark_replay.py", "replay", "--repeat", "1"],
+        cwd=HERE, capture_output=True, text=True, timeout=300
+    )
+    assert result.returncode == 0, result.stdout[-3000:] + result.stderr[-3000:]
+    assert "cassette misses: 0" in result.stdout
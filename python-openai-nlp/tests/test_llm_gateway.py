@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+import pytest
+
+from config import Settings
+from services.llm_gateway import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceededError, LLMGateway, LLMUnavailableError, deadline_scope
+)
+
+
+class FakeCompletions:
+    """Answers each call with the next behaviour: a delay in seconds, or an exception to raise."""
+
+    def __init__(self, behaviours):
+        self.behaviours = list(behaviours)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, **kwargs):
+        behaviour = self.behaviours[min(self.calls, len(self.behaviours) - 1)]
+        self.calls += 1
+        if isinstance(behaviour, BaseException):
+            raise behaviour
+        try:
+            await asyncio.sleep(behaviour)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"completion {self.calls}"
+
+
+class FakeClient:
+    def __init__(self, behaviours):
+        self.completions = FakeCompletions(behaviours)
+        self.chat = self
+
+
+def gateway(behaviours, **settings):
+    defaults = {
+        "llm_attempt_timeout_seconds": 0.1,
+        "llm_min_attempt_seconds": 0.02,
+        "llm_max_retries": 10,
+        "llm_retry_base_delay_ms": 5,
+        "llm_retry_max_delay_ms": 10,
+        "llm_hedging_enabled": False,
+        "llm_circuit_failure_threshold": 100,
+        "llm_limiter_enabled": False
+    }
+    client = FakeClient(behaviours)
+    return LLMGateway(client=client, settings=Settings(**{**defaults, **settings})), client.completions
+
+
+def test_failed_attempts_are_retried():
+    llm, completions = gateway([ConnectionResetError(), 0])
+    # Only the retryable errors are retried; anything else reaches the caller
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(llm.create(model="m", messages=[]))
+
+    llm, completions = gateway([asyncio.TimeoutError(), 0])
+    assert asyncio.run(llm.create(model="m", messages=[])) == "completion 2"
+    assert llm.stats()["retries"] == 1
+
+
+def test_retries_stop_at_the_deadline():
+    llm, completions = gateway([10])
+
+    async def scenario():
+        with deadline_scope(0.35):
+            started = time.monotonic()
+            with pytest.raises(LLMUnavailableError):
+                await llm.create(model="m", messages=[])
+            return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+    assert elapsed < 0.45
+    # Ten retries were allowed, but only the attempts that fit in the deadline were made
+    assert 2 <= completions.calls <= 4
+    assert llm.stats()["timeouts"] == completions.calls
+
+
+def test_no_attempt_is_started_without_budget():
+    llm, completions = gateway([0])
+
+    async def scenario():
+        with deadline_scope(0.01):
+            await llm.create(model="m", messages=[])
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(scenario())
+    assert completions.calls == 0
+
+
+def test_hedge_wins_and_cancels_the_slow_request():
+    llm, completions = gateway([1.0, 0.01], llm_hedging_enabled=True, llm_hedge_delay_ms=20,
+                               llm_attempt_timeout_seconds=2.0)
+
+    async def scenario():
+        started = time.monotonic()
+        response = await llm.create(model="m", messages=[])
+        await asyncio.sleep(0)
+        return response, time.monotonic() - started
+
+    response, elapsed = asyncio.run(scenario())
+    assert response == "completion 2"
+    assert elapsed < 0.5
+    assert completions.cancelled == 1
+    assert llm.stats()["hedges"] == 1 and llm.stats()["hedge_wins"] == 1
+
+
+def test_no_hedge_when_the_first_request_is_fast():
+    llm, completions = gateway([0.001], llm_hedging_enabled=True, llm_hedge_delay_ms=200)
+    asyncio.run(llm.create(model="m", messages=[]))
+    assert completions.calls == 1 and llm.stats()["hedges"] == 0
+
+
+def test_open_circuit_fails_fast():
+    llm, completions = gateway([asyncio.TimeoutError()], llm_max_retries=0, llm_circuit_failure_threshold=2)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError):
+                await llm.create(model="m", messages=[])
+        with pytest.raises(CircuitOpenError):
+            await llm.create(model="m", messages=[])
+
+    asyncio.run(scenario())
+    assert completions.calls == 2
+    assert llm.stats()["circuit"]["state"] == "open"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_half_opens(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("services.llm_gateway.time.monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    # One trial call is let through, and no other until it ends
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+
+    # A failed trial opens the circuit again at once
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.times_opened == 2
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.allow()
+
+
+def test_trial_without_outcome_lets_another_through(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("services.llm_gateway.time.monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=5)
+    breaker.record_failure()
+    clock.now += 5
+    assert breaker.allow() and not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
@@ -0,0 +1,69 @@
+from datetime import date
+
+import pytest
+
+from services.period_resolver import PeriodResolver, resolve_period
+
+TODAY = date(2026, 10, 17)
+
+
+def resolve(phrase, fiscal_start=1):
+    return resolve_period(phrase, TODAY, "", fiscal_start)
+
+
+@pytest.mark.parametrize("phrase, expected", [
+    # A number after a month is a day of the month, not a two-digit year
+    ("march 15", ("2026-03-15", "2026-03-15")),
+    ("march 5", ("2026-03-05", "2026-03-05")),
+    ("15th of march", ("2026-03-15", "2026-03-15")),
+    ("march 15th, 2024", ("2024-03-15", "2024-03-15")),
+    ("since march 15", ("2026-03-15", "2026-10-17")),
+    ("december 1 to december 15", ("2025-12-01", "2025-12-15")),
+    ("from jan 1 to march 31 2025", ("2025-01-01", "2025-03-31")),
+    # Two-digit years only with an apostrophe or after "of"
+    ("march '24", ("2024-03-01", "2024-03-31")),
+    ("march of 24", ("2024-03-01", "2024-03-31")),
+    ("q1 '24", ("2024-01-01", "2024-03-31")),
+    ("march 2024", ("2024-03-01", "2024-03-31")),
+    ("Q1 2024", ("2024-01-01", "2024-03-31")),
+    ("H1 2024", ("2024-01-01", "2024-06-30")),
+    ("second half of 2025", ("2025-07-01", "2025-12-31")),
+    ("nov to feb 2024", ("2023-11-01", "2024-02-29")),
+    ("Nov 2023 to Feb 2024", ("2023-11-01", "2024-02-29")),
+    ("march", ("2026-03-01", "2026-03-31")),
+    ("november", ("2025-11-01", "2025-11-30")),
+    ("last month", ("2026-09-01", "2026-09-30")),
+    ("this month", ("2026-10-01", "2026-10-17")),
+    ("last 3 days", ("2026-10-14", "2026-10-17")),
+    ("2024-03-05", ("2024-03-05", "2024-03-05")),
+])
+def test_phrases(phrase, expected):
+    assert resolve(phrase) == expected
+
+
+@pytest.mark.parametrize("phrase", ["q1 24", "feb 30", "march 32", "last 0 days", "next tuesday"])
+def test_phrases_naming_no_period(phrase):
+    assert resolve(phrase) is None
+
+
+def test_fiscal_years_follow_the_configured_start():
+    assert resolve("FY 2023-24", fiscal_start=4) == ("2023-04-01", "2024-03-31")
+    assert resolve("fy24", fiscal_start=4) == ("2023-04-01", "2024-03-31")
+    assert resolve("FY 2023-24") == ("2024-01-01", "2024-12-31")
+
+
+@pytest.mark.parametrize("phrase, start", [
+    ("last 10000 years", "1926-10-17"),
+    ("last 999999 days", "1926-08-03"),
+    ("last 99999999999 weeks", "1926-08-03"),
+])
+def test_long_spans_are_clamped_to_a_hundred_years(phrase, start):
+    assert resolve(phrase) == (start, "2026-10-17")
+
+
+def test_filters_from_entities():
+    resolver = PeriodResolver()
+    assert resolver.filters({"period": "march 15"}, TODAY) == {"startDate": "2026-03-15", "endDate": "2026-03-15"}
+    assert resolver.filters({"quarter": "1", "year": "2024"}, TODAY) == {"startDate": "2024-01-01", "endDate": "2024-03-31"}
+    assert resolver.filters({"period": "last 10000 years"}, TODAY)["startDate"] == "1926-10-17"
+    assert resolver.filters({"period": "whenever"}, TODAY) == {}
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+
+def test_every_caller_gets_the_same_exception():
+    async def scenario():
+        flight = SingleFlight()
+        error = ValueError("upstream failed")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise error
+
+        results = await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+        return error, results
+
+    error, results = asyncio.run(scenario())
+    assert all(result is error for result in results)
+
+
+def test_a_new_call_starts_after_the_previous_one_finished():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        return [await flight.do("key", fetch), await flight.do("key", fetch)]
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_cancelling_one_waiter_keeps_the_shared_call():
+    async def scenario():
+        flight = SingleFlight()
+        gate = asyncio.Event()
+
+        async def fetch():
+            await gate.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        return first, await second
+
+    first, result = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == "done"
+
+
+def test_call_is_abandoned_when_the_last_waiter_is_cancelled():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = False
+
+        async def slow():
+            nonlocal cancelled
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        waiter = asyncio.ensure_future(flight.do("key", slow))
+        await started.wait()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+        async def fast():
+            return "fresh"
+
+        return cancelled, await flight.do("key", fast)
+
+    assert asyncio.run(scenario()) == (True, "fresh")